@@ -0,0 +1,99 @@
+"""
+Measure cold-start time of a single-app check: interpreter start,
+module imports, and locating the app in a synthetic catalog index
+served from a local HTTP server. GitHub and URL checks are not part
+of this measurement.
+
+    python benchmarks/bench_cold_start.py --apps 400 --releases 25
+
+Target: below 1 second for an app in the middle of a 10,000 release index.
+"""
+import functools
+import http.server
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_index_parse import write_synthetic_index
+
+TARGET_SECONDS = 1.0
+
+CHILD_SCRIPT = '''
+import time
+start = time.perf_counter()
+import cli
+imported = time.perf_counter()
+conf = {
+    'user_agent': 'bench',
+    'keyword_pattern': '.*',
+    'codeowner_team_pattern': '.*',
+}
+ctx = cli.Context(conf)
+found = [name for name, _ in cli.load_catalog_index(URL, ctx, only={APP})]
+located = time.perf_counter()
+ctx.close()
+assert found == [APP], found
+print(imported - start, located - imported)
+'''
+
+
+@click.command()
+@click.option('--apps', default=400, help='Number of apps in the synthetic index.')
+@click.option('--releases', default=25, help='Number of releases per app.')
+@click.option('--runs', default=5, help='Number of measured runs.')
+def main(apps, releases, runs):
+    repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_synthetic_index(os.path.join(tmp, 'index.yaml'), apps, releases)
+
+        handler = functools.partial(QuietHandler, directory=tmp)
+        server = QuietServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/index.yaml'
+
+        app = f'app-{apps // 2}'
+        script = CHILD_SCRIPT.replace('URL', repr(url)).replace('APP', repr(app))
+
+        print(f'Looking up {app} in {apps} apps x {releases} releases, {runs} runs\n')
+        print('| Run | Total (s) | Imports (s) | Index lookup (s) |')
+        print('|----:|----------:|------------:|-----------------:|')
+
+        totals = []
+        for run in range(runs):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', script], cwd=repo_dir,
+                                 check=True, capture_output=True, text=True).stdout
+            # wall time, including interpreter startup
+            total = time.perf_counter() - start
+            imports, lookup = (float(x) for x in out.split())
+            totals.append(total)
+            print(f'| {run + 1} | {total:.2f} | {imports:.2f} | {lookup:.2f} |')
+
+        server.shutdown()
+
+    best = min(totals)
+    status = 'OK' if best < TARGET_SECONDS else 'MISSED'
+    print(f'\nBest: {best:.2f}s, target {TARGET_SECONDS:.2f}s: {status}')
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # The client closes the connection once it found the app
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+"""
+End-to-end benchmark of cli.py against local stand-ins for everything
+it talks to:
+
+- a catalog server serving a synthetic index.yaml (N apps x M releases)
+- a fake GitHub serving repo home pages and the REST endpoints used
+  for repo inspection, including rate limit headers, with the same
+  latency and error rate as the URL hosts
+- fake URL hosts for icons, sources, READMEs and maintainer URLs, with
+  configurable latency and error rate
+- dead hosts that accept connections but never answer
+
+For each catalog size, cli.py runs in a subprocess with the HTTP cache
+disabled. Reported are wall time, peak memory of the cli.py process and
+the number of requests per host.
+
+    python benchmarks/bench_e2e.py --apps 100 --apps 1000 --releases 10 --jobs 8
+"""
+import base64
+import hashlib
+import http.server
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import click
+import yaml
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CODEOWNERS = b'* @giantswarm/team-benchmark\n'
+
+README = ('# Benchmark app\n\n' + 'This app exists for benchmarking. ' * 60).encode('utf-8')
+
+# Runs cli.py like `python cli.py`, then writes the process' peak RSS (kB) to a file
+CHILD_SCRIPT = '''
+import atexit, runpy, sys
+
+def report():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                with open(RSS_FILE, 'w') as out:
+                    out.write(line.split()[1])
+
+atexit.register(report)
+sys.argv = ['cli.py'] + ARGS
+runpy.run_path('cli.py', run_name='__main__')
+'''
+
+
+class Stats:
+    """
+    Request counters per host and method, shared by all fake servers
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+
+    def count(self, host: str, method: str):
+        with self.lock:
+            self.requests[(host, method)] += 1
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+
+
+class FakeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Base handler: counts requests, adds latency and
+    answers with errors at the configured rate.
+    """
+    protocol_version = 'HTTP/1.1'
+    host_name = None
+    stats = None
+    latency = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body: bool):
+        self.stats.count(self.host_name, self.command)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if self.failing():
+            self.respond(404, b'not found', send_body)
+            return
+
+        status, body, content_type = self.content()
+        self.respond(status, body, send_body, content_type)
+
+    def failing(self) -> bool:
+        # deterministic per path, so reruns see the same errors
+        digest = hashlib.sha1(self.path.encode('utf-8')).digest()
+        return digest[0] / 256 < self.error_rate
+
+    def content(self):
+        return 200, b'ok', 'text/plain'
+
+    def respond(self, status: int, body: bytes, send_body: bool,
+                content_type: str = 'text/plain', headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+class UrlHostHandler(FakeHandler):
+    def content(self):
+        if self.path.endswith('README.md'):
+            return 200, README, 'text/markdown; charset=utf-8'
+        return 200, b'ok', 'text/plain'
+
+
+class CatalogHandler(FakeHandler):
+    index_path = None
+
+    def content(self):
+        if self.path == '/index.yaml':
+            with open(self.index_path, 'rb') as f:
+                return 200, f.read(), 'text/plain; charset=utf-8'
+        return 200, b'chart', 'application/octet-stream'
+
+
+class GithubHandler(FakeHandler):
+    """
+    Serves repo home pages (/giantswarm/<repo>) and the REST API
+    endpoints used by inspect_github_repo. Every 10th repo does
+    not exist. API requests fail at the error rate with a 404, as
+    for the URL hosts, so listings and CODEOWNERS go missing. A
+    5xx would end the run, as GitHub API calls aren't retried.
+    """
+    base_url = None
+    calls = 0
+    reset = int(time.time()) + 3600
+
+    def handle_request(self, send_body: bool):
+        parts = self.path.strip('/').split('/')
+        if parts[0] != 'repos':
+            super().handle_request(send_body)
+            return
+
+        self.stats.count(self.host_name, f'API {self.command}')
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        with self.stats.lock:
+            GithubHandler.calls += 1
+            remaining = max(0, 5000 - GithubHandler.calls)
+        headers = {
+            'X-RateLimit-Limit': '5000',
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(self.reset),
+        }
+
+        owner, repo = parts[1], parts[2]
+        if repo.endswith('0') or self.failing():
+            body = json.dumps({'message': 'Not Found'}).encode('utf-8')
+            self.respond(404, body, send_body, 'application/json', headers)
+            return
+
+        repo_url = f'{self.base_url}/repos/{owner}/{repo}'
+        if len(parts) == 3:
+            data = {'name': repo, 'full_name': f'{owner}/{repo}', 'url': repo_url}
+        elif parts[3:] == ['contents']:
+            data = [{'type': 'file', 'name': name, 'path': name,
+                     'url': f'{repo_url}/contents/{name}'}
+                    for name in ('CODEOWNERS', 'README.md', 'LICENSE', 'CONTRIBUTING.md')]
+        elif parts[3:] == ['contents', 'CODEOWNERS']:
+            data = {'type': 'file', 'name': 'CODEOWNERS', 'path': 'CODEOWNERS',
+                    'url': f'{repo_url}/contents/CODEOWNERS', 'encoding': 'base64',
+                    'content': base64.b64encode(CODEOWNERS).decode('ascii')}
+        else:
+            body = json.dumps({'message': 'Not Found'}).encode('utf-8')
+            self.respond(404, body, send_body, 'application/json', headers)
+            return
+
+        self.respond(200, json.dumps(data).encode('utf-8'), send_body, 'application/json', headers)
+
+
+def start_server(handler_class, **attributes) -> str:
+    """
+    Start a threaded HTTP server on a free local port and return its base URL
+    """
+    handler = type(handler_class.__name__, (handler_class,), attributes)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    if handler_class is GithubHandler:
+        handler.base_url = base_url
+    return base_url
+
+
+def start_dead_host() -> str:
+    """
+    Listen on a port without ever accepting, so connections
+    succeed but requests never get an answer.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    start_dead_host.sockets.append(sock)
+    return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+start_dead_host.sockets = []
+
+
+def synthetic_index(apps: int, releases: int, catalog_url: str, github_url: str,
+                    url_hosts: list, dead_hosts: list) -> dict:
+    rnd = random.Random(apps * 1000 + releases)
+    entries = {}
+    for app in range(apps):
+        name = f'app-{app}'
+        host = url_hosts[app % len(url_hosts)]
+        if dead_hosts and app % 20 == 0:
+            host = dead_hosts[app // 20 % len(dead_hosts)]
+
+        entries[name] = []
+        for r in range(releases):
+            version = f'{r // 10}.{r % 10}.0'
+            entries[name].append({
+                'annotations': {
+                    'application.giantswarm.io/readme': f'{host}/{name}/v{version}/README.md',
+                    'application.giantswarm.io/metadata': f'{host}/{name}/v{version}/metadata.yaml',
+                    'application.giantswarm.io/team': 'benchmark',
+                },
+                'apiVersion': 'v2',
+                'appVersion': version,
+                'created': f'2021-{rnd.randint(1, 12):02d}-01T10:00:00Z',
+                'description': f'Synthetic app {app}',
+                'digest': hashlib.sha256(f'{name}-{version}'.encode('utf-8')).hexdigest(),
+                'home': f'{github_url}/giantswarm/{name}',
+                'icon': f'{host}/icons/{name}.svg',
+                'keywords': ['benchmark'],
+                'maintainers': [{'name': 'benchmark', 'url': f'{url_hosts[0]}/team'}],
+                'name': name,
+                'sources': [f'{host}/sources/{name}'],
+                'urls': [f'{catalog_url}/{name}-{version}.tgz'],
+                'version': version,
+            })
+    return {'apiVersion': 'v1', 'entries': entries, 'generated': '2021-11-01T00:00:00Z'}
+
+
+def run_cli(workdir: str, catalog_url: str, github_url: str, jobs: int) -> dict:
+    conf_path = os.path.join(workdir, 'config.yaml')
+    token_path = os.path.join(workdir, 'token')
+    rss_path = os.path.join(workdir, 'rss')
+
+    with open(conf_path, 'w') as f:
+        yaml.safe_dump({
+            'catalogs': [{'name': 'benchmark', 'url': f'{catalog_url}/index.yaml'}],
+            'github_repo_organization': 'giantswarm',
+            'github_url': github_url,
+            'github_api_url': github_url,
+            'user_agent': 'app-catalog-qa-benchmark',
+            'keyword_pattern': '[a-z0-9-]+',
+            'codeowner_team_pattern': '@giantswarm/([a-zA-Z0-9-]+)',
+        }, f)
+    with open(token_path, 'w') as f:
+        f.write('benchmark-token\n')
+
+    args = ['--conf', conf_path, '--token-path', token_path, '--no-cache', '--jobs', str(jobs)]
+    script = CHILD_SCRIPT.replace('RSS_FILE', repr(rss_path)).replace('ARGS', repr(args))
+
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', script], cwd=REPO_DIR,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise click.ClickException(f'cli.py failed:\n{proc.stderr}')
+
+    with open(rss_path, 'r') as f:
+        peak_kb = int(f.read())
+
+    return {'wall': wall, 'peak_mb': peak_kb / 1024}
+
+
+@click.command()
+@click.option('--apps', multiple=True, type=int, default=[100], help='Number of apps, can be given several times.')
+@click.option('--releases', default=10, help='Number of releases per app.')
+@click.option('--jobs', default=8, help='Value for cli.py --jobs.')
+@click.option('--hosts', default=5, help='Number of fake URL hosts.')
+@click.option('--dead-hosts', default=1, help='Number of hosts that never answer. Every 20th app uses one.')
+@click.option('--latency', default=0.02, help='Response latency of URL hosts and GitHub in seconds.')
+@click.option('--error-rate', default=0.05, help='Share of URLs and GitHub API requests answered with 404.')
+def main(apps, releases, jobs, hosts, dead_hosts, latency, error_rate):
+    stats = Stats()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        index_path = os.path.join(workdir, 'index.yaml')
+        catalog_url = start_server(CatalogHandler, host_name='catalog', stats=stats,
+                                   index_path=index_path)
+        github_url = start_server(GithubHandler, host_name='github', stats=stats,
+                                  latency=latency, error_rate=error_rate)
+        url_hosts = [start_server(UrlHostHandler, host_name=f'host-{i}', stats=stats,
+                                  latency=latency, error_rate=error_rate)
+                     for i in range(hosts)]
+        dead = [start_dead_host() for _ in range(dead_hosts)]
+
+        print(f'{releases} releases per app, jobs={jobs}, {hosts} URL hosts '
+              f'({latency * 1000:.0f} ms, {error_rate:.0%} errors), {dead_hosts} dead hosts\n')
+        print('| Apps | Index (MB) | Wall time (s) | Peak RSS (MB) | Requests | GitHub API calls |')
+        print('|-----:|-----------:|--------------:|--------------:|---------:|-----------------:|')
+
+        per_host = {}
+        for app_count in apps:
+            index = synthetic_index(app_count, releases, catalog_url, github_url, url_hosts, dead)
+            with open(index_path, 'w') as f:
+                yaml.dump(index, f, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+            del index
+
+            stats.reset()
+            result = run_cli(workdir, catalog_url, github_url, jobs)
+            requests = dict(stats.requests)
+            per_host[app_count] = requests
+
+            total = sum(requests.values())
+            api_calls = sum(n for (host, method), n in requests.items() if method.startswith('API'))
+            size_mb = os.path.getsize(index_path) / 1024 / 1024
+            print(f'| {app_count} | {size_mb:.1f} | {result["wall"]:.1f} | {result["peak_mb"]:.0f} '
+                  f'| {total} | {api_calls} |')
+
+        for app_count, requests in per_host.items():
+            print(f'\nRequests per host, {app_count} apps:\n')
+            print('| Host | Method | Requests |')
+            print('|------|--------|---------:|')
+            for (host, method), n in sorted(requests.items()):
+                print(f'| {host} | {method} | {n} |')
+
+
+if __name__ == '__main__':
+    main()
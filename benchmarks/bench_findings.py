@@ -0,0 +1,113 @@
+"""
+Measure the memory held by the findings of a synthetic catalog after
+the local rules ran for all apps, as between the local and the HTTP
+stage of a run.
+
+    python benchmarks/bench_findings.py --apps 1000 --apps 10000
+
+`compact` is the Finding representation with message templates
+formatted on demand. `formatted` rebuilds the same findings as before:
+plain objects with the message formatted up front, and a result dict
+of four lists per rule.
+"""
+import gc
+import os
+import re
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import checks  # registers the rules
+from findings import RESULT_KEYS
+from history import latest_version
+from rules import LOCAL, AppCheck, RuleSelection, app_result, run_stage
+
+
+class FormattedFinding:
+    """
+    Findings as they were: unslotted, with the formatted message
+    """
+    def __init__(self, rule_id: str, severity: str, message: str):
+        self.rule_id = rule_id
+        self.severity = severity
+        self.message = message
+
+
+def synthetic_releases(app: int, releases: int) -> list:
+    return [{
+        'apiVersion': 'v1',
+        'created': f'2021-0{1 + i % 9}-1{i % 10}T10:00:00Z',
+        'description': f'A Helm chart for app-{app}',
+        'digest': f'{app:08x}{i:056x}',
+        'name': f'app-{app}-app',
+        'version': f'{i // 10}.{i % 10}.0',
+        'home': f'https://github.com/giantswarm/app-{app}',
+        'icon': f'https://example.com/icons/app-{app}.png',
+        'keywords': ['Monitoring_Stack', f'app-{app}', 'Giant Swarm'],
+        'sources': [f'https://github.com/giantswarm/app-{app}'],
+        'urls': [f'https://example.com/charts/app-{app}-{i}.tgz'],
+        'annotations': {
+            'application.giantswarm.io/readme': f'https://example.com/app-{app}/README.md',
+        },
+    } for i in range(releases)]
+
+
+def run_local_stage(apps: int, releases: int, mode: str) -> list:
+    ctx = SimpleNamespace(keyword_re=re.compile(r'^[a-z0-9-]+$'), github_url='https://github.com',
+                          names=None, history=None, state=None, rules=RuleSelection())
+    stage = ctx.rules.stage(LOCAL)
+
+    checked = []
+    for i in range(apps):
+        app = AppCheck('bench', f'app-{i}', synthetic_releases(i, releases))
+        app.latest_release = latest_version(r['version'] for r in app.releases)
+        app.release = next(r for r in app.releases if r['version'] == app.latest_release)
+        run_stage(app, ctx, stage)
+        app.releases = None
+        if mode == 'formatted':
+            app.findings = {name: formatted_result(findings) for name, findings in app.findings.items()}
+        checked.append(app)
+    return checked
+
+
+def formatted_result(findings: tuple) -> dict:
+    result = {key: [] for key in RESULT_KEYS.values()}
+    for f in findings:
+        result[RESULT_KEYS[f.severity]].append(FormattedFinding(f.rule_id, f.severity, f.message))
+    return result
+
+
+def measure(apps: int, releases: int, mode: str) -> tuple:
+    """
+    Return (bytes held, findings) after the local stage
+    """
+    gc.collect()
+    tracemalloc.start()
+    checked = run_local_stage(apps, releases, mode)
+    # the release dicts are gone, what is left are the apps and their findings
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    findings = sum(len(app_result(app, RuleSelection())[key]) for app in checked
+                   for key in RESULT_KEYS.values()) if mode == 'compact' else None
+    return held, findings
+
+
+@click.command()
+@click.option('--apps', default=[1000, 10000], multiple=True, help='Number of apps. Can be given several times.')
+@click.option('--releases', default=10, help='Releases per app.')
+def main(apps, releases):
+    for n in apps:
+        held, findings = measure(n, releases, 'compact')
+        formatted, _ = measure(n, releases, 'formatted')
+        print(f'{n} apps, {findings} findings: {held / 1024 / 1024:.1f} MB held, '
+              f'{formatted / 1024 / 1024:.1f} MB with formatted messages')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measure version ordering and release history analysis on synthetic
+releases, compared with sorting by semver.VersionInfo.compare().
+
+    python benchmarks/bench_history.py --releases 10000 --releases 50000
+
+The semver comparison is skipped if the semver module isn't installed.
+"""
+import functools
+import os
+import random
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from history import AppHistory, CatalogHistory, latest_version, version_key
+
+
+def synthetic_releases(count: int, per_app: int = 50, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    apps = {}
+    start = time.time() - 3 * 365 * 24 * 60 * 60
+    for i in range(count):
+        version = f'{rnd.randint(0, 3)}.{rnd.randint(0, 20)}.{rnd.randint(0, 30)}'
+        if rnd.random() < 0.2:
+            version += f'-{rnd.choice(["alpha", "beta", "rc"])}.{rnd.randint(0, 5)}'
+        created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start + rnd.random() * 3 * 365 * 24 * 60 * 60))
+        apps.setdefault(f'app-{i // per_app}', []).append({'version': version, 'created': created})
+    return apps
+
+
+@click.command()
+@click.option('--releases', default=[10000, 50000], multiple=True, help='Number of releases. Can be given several times.')
+def main(releases):
+    try:
+        import semver
+    except ImportError:
+        semver = None
+
+    for n in releases:
+        apps = synthetic_releases(n)
+        versions = [r['version'] for app in apps.values() for r in app]
+
+        start = time.perf_counter()
+        expected = sorted(versions, key=version_key)
+        line = f'{n} releases: {time.perf_counter() - start:.2f}s sorting by key'
+
+        if semver is not None:
+            start = time.perf_counter()
+            compared = sorted(versions, key=functools.cmp_to_key(semver.compare))
+            line += f', {time.perf_counter() - start:.2f}s with semver.compare'
+            if [version_key(v) for v in compared] != [version_key(v) for v in expected]:
+                line += ' - ORDER DIFFERS'
+
+        start = time.perf_counter()
+        catalog = CatalogHistory()
+        for app_name, app_releases in apps.items():
+            latest_version(r['version'] for r in app_releases)
+            history = AppHistory(app_releases)
+            catalog.add(app_name, history)
+            history.stats()
+        catalog.stats()
+        line += f', {time.perf_counter() - start:.2f}s history analysis of {len(apps)} apps'
+
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
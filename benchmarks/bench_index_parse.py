@@ -0,0 +1,125 @@
+"""
+Compare parse time and peak memory of catalog index loading:
+
+- `full`: read the whole file into a string and parse it with the
+  pure Python yaml.Loader, as the catalog index used to be loaded
+- `csafe`: same, but with the libyaml based safe loader
+- `stream`: iterate entries from a file stream with iter_catalog_entries
+
+Each method runs in a fresh subprocess, so peak RSS is comparable.
+
+    python benchmarks/bench_index_parse.py --apps 500 --releases 25
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from catalog import iter_catalog_entries
+
+METHODS = ('full', 'csafe', 'stream')
+
+
+def synthetic_release(app: int, release: int) -> dict:
+    return {
+        'annotations': {
+            'application.giantswarm.io/metadata': f'https://giantswarm.github.io/catalog/app-{app}-{release}.0.0.tgz-meta/main.yaml',
+            'application.giantswarm.io/readme': f'https://raw.githubusercontent.com/giantswarm/app-{app}/v{release}.0.0/README.md',
+            'application.giantswarm.io/team': f'team-{app % 10}',
+        },
+        'apiVersion': 'v2',
+        'appVersion': f'{release}.0.0',
+        'created': f'2021-{release % 12 + 1:02d}-01T10:00:00.000000000Z',
+        'description': f'A synthetic app number {app} used for benchmarking the catalog index parser',
+        'digest': f'{app:032x}{release:032x}',
+        'home': f'https://github.com/giantswarm/app-{app}',
+        'icon': f'https://s.giantswarm.io/app-icons/app-{app}/1/light.svg',
+        'keywords': ['benchmark', 'synthetic', f'app-{app}'],
+        'maintainers': [{'name': 'giantswarm', 'url': 'https://github.com/giantswarm'}],
+        'name': f'app-{app}',
+        'sources': [f'https://github.com/giantswarm/app-{app}'],
+        'urls': [f'https://giantswarm.github.io/catalog/app-{app}-{release}.0.0.tgz'],
+        'version': f'{release}.0.0',
+    }
+
+
+def write_synthetic_index(path: str, apps: int, releases: int):
+    entries = {}
+    for app in range(apps):
+        entries[f'app-{app}'] = [synthetic_release(app, r) for r in range(releases)]
+    with open(path, 'w') as f:
+        yaml.safe_dump({'apiVersion': 'v1', 'entries': entries, 'generated': '2021-11-01T00:00:00Z'}, f)
+
+
+def peak_rss_kb() -> int:
+    """
+    Peak resident set size of this process in kB. ru_maxrss is
+    carried over from the parent across exec on Linux, so prefer
+    the per address space high water mark where available.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_method(method: str, path: str) -> int:
+    """
+    Parse the index with the given method and return the number of releases
+    """
+    if method == 'full':
+        with open(path, 'r') as f:
+            index = yaml.load(f.read(), Loader=yaml.Loader)
+        return sum(len(r) for r in index['entries'].values())
+    if method == 'csafe':
+        with open(path, 'r') as f:
+            index = yaml.load(f.read(), Loader=yaml.CSafeLoader)
+        return sum(len(r) for r in index['entries'].values())
+    if method == 'stream':
+        with open(path, 'rb') as f:
+            return sum(len(releases) for _, releases in iter_catalog_entries(f))
+    raise ValueError(f'Unknown method {method}')
+
+
+@click.command()
+@click.option('--apps', default=500, help='Number of apps in the synthetic index.')
+@click.option('--releases', default=25, help='Number of releases per app.')
+@click.option('--method', 'child_method', hidden=True)
+@click.option('--index', 'child_index', hidden=True)
+def main(apps, releases, child_method, child_index):
+    if child_method is not None:
+        start = time.perf_counter()
+        count = run_method(child_method, child_index)
+        duration = time.perf_counter() - start
+        peak_kb = peak_rss_kb()
+        print(f'{count} {duration} {peak_kb}')
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'index.yaml')
+        write_synthetic_index(path, apps, releases)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f'Synthetic index: {apps} apps x {releases} releases, {size_mb:.1f} MB\n')
+        print(f'| Method | Releases | Parse time (s) | Peak RSS (MB) |')
+        print(f'|--------|---------:|---------------:|--------------:|')
+
+        for method in METHODS:
+            out = subprocess.run([sys.executable, __file__, '--method', method, '--index', path],
+                                 check=True, capture_output=True, text=True).stdout
+            count, duration, peak_kb = out.split()
+            print(f'| {method} | {count} | {float(duration):.2f} | {int(peak_kb) / 1024:.0f} |')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure the cross-catalog name analysis on synthetic app names,
+built from a vocabulary of words with occasional typos and
+`-app` suffixes, spread over several catalogs.
+
+    python benchmarks/bench_names.py --apps 500 --apps 2000 --catalogs 4
+
+With --pairwise, the indexed result is compared against comparing
+all pairs of names, and the time of that is reported as well.
+"""
+import os
+import random
+import string
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from names import NameAnalysis, levenshtein, max_edit_distance
+
+
+def synthetic_names(apps: int, catalogs: int, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 9)))
+             for _ in range(400)]
+
+    def name():
+        n = '-'.join(rnd.choices(words, k=rnd.randint(1, 3)))
+        if rnd.random() < 0.1:
+            i = rnd.randrange(len(n))
+            n = n[:i] + rnd.choice(string.ascii_lowercase) + n[i + 1:]
+        if rnd.random() < 0.1:
+            n += '-app'
+        return n
+
+    return {f'catalog{i}': sorted({name() for _ in range(apps)}) for i in range(catalogs)}
+
+
+def pairwise(keys: list) -> dict:
+    similar = {}
+    for a in keys:
+        for b in keys:
+            if a == b:
+                continue
+            limit = min(max_edit_distance(len(a)), max_edit_distance(len(b)))
+            if limit > 0 and levenshtein(a, b, limit) <= limit:
+                similar.setdefault(a, []).append(b)
+    return similar
+
+
+@click.command()
+@click.option('--apps', default=[500, 2000], multiple=True, help='Number of apps per catalog. Can be given several times.')
+@click.option('--catalogs', default=4, help='Number of catalogs.')
+@click.option('--pairwise', 'compare', is_flag=True, help='Also run the pairwise comparison and check the results match.')
+def main(apps, catalogs, compare):
+    for n in apps:
+        names = synthetic_names(n, catalogs)
+
+        start = time.perf_counter()
+        analysis = NameAnalysis(names)
+        indexed = time.perf_counter() - start
+
+        total = sum(len(v) for v in names.values())
+        pairs = sum(len(v) for v in analysis.similar_keys.values()) // 2
+        line = (f'{total} names, {len(analysis.names_by_key)} distinct normalised: '
+                f'{indexed:.2f}s indexed, {pairs} similar pairs')
+
+        if compare:
+            start = time.perf_counter()
+            expected = pairwise(list(analysis.names_by_key))
+            line += f', {time.perf_counter() - start:.2f}s pairwise'
+            found = {k: sorted(v) for k, v in analysis.similar_keys.items()}
+            if found != {k: sorted(v) for k, v in expected.items()}:
+                line += ' - RESULTS DIFFER'
+
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Fast, low-memory parsing of helm catalog index files.
+"""
+from typing import Any, BinaryIO, Callable, Iterator, Optional, Set, Tuple
+
+import yaml
+from yaml.events import (AliasEvent, MappingEndEvent, MappingStartEvent,
+                         ScalarEvent, SequenceEndEvent, SequenceStartEvent,
+                         StreamEndEvent)
+from yaml.nodes import ScalarNode
+
+# Use the libyaml based loader if PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+STR_TAG = 'tag:yaml.org,2002:str'
+MERGE_TAG = 'tag:yaml.org,2002:merge'
+
+
+def load_yaml(stream) -> Any:
+    """
+    Parse a complete YAML document from a string or stream
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def iter_catalog_entries(stream: BinaryIO,
+                         only: Optional[Set[str]] = None,
+                         select: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[str, list]]:
+    """
+    Parse a catalog index from the stream and yield tuples
+    (app name, releases) one app at a time, so that only the
+    current app's release list is held in memory.
+
+    If `only` is given, other apps are skipped without being
+    constructed, and parsing stops once all apps in `only`
+    have been found. Likewise, apps for which `select(app name)`
+    returns False are skipped. It is called for every app, in
+    index order.
+    """
+    return _iter_entries(stream, only, build=True, select=select)
+
+
+def iter_catalog_app_names(stream: BinaryIO) -> Iterator[str]:
+    """
+    Parse a catalog index from the stream and yield the app
+    names only, skipping over the releases.
+    """
+    for app_name, _ in _iter_entries(stream, None, build=False):
+        yield app_name
+
+
+def _iter_entries(stream: BinaryIO, only: Optional[Set[str]], build: bool,
+                  select: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[str, Optional[list]]]:
+    if only is not None:
+        only = set(only)
+
+    loader = SafeLoader(stream)
+    anchors = {}
+    try:
+        loader.get_event()  # stream start
+        if loader.check_event(StreamEndEvent):
+            return
+        loader.get_event()  # document start
+
+        if not loader.check_event(MappingStartEvent):
+            raise ValueError('Catalog index is not a YAML mapping')
+        loader.get_event()
+
+        while not loader.check_event(MappingEndEvent):
+            key = _build(loader, anchors)
+            if key != 'entries' or not loader.check_event(MappingStartEvent):
+                _build(loader, anchors)
+                continue
+
+            loader.get_event()
+            while not loader.check_event(MappingEndEvent):
+                app_name = _build(loader, anchors)
+                if select is not None and not select(app_name):
+                    _skip(loader, anchors)
+                elif only is None and not build:
+                    _skip(loader, anchors)
+                    yield app_name, None
+                elif only is None:
+                    yield app_name, _build(loader, anchors)
+                elif app_name in only:
+                    yield app_name, _build(loader, anchors)
+                    only.discard(app_name)
+                    if not only:
+                        return
+                else:
+                    _skip(loader, anchors)
+            loader.get_event()
+    finally:
+        loader.dispose()
+
+
+def _skip(loader: SafeLoader, anchors: dict):
+    """
+    Consume the next value from the parser without constructing
+    it. Anchored values are still built, as later aliases may
+    refer to them.
+    """
+    depth = 0
+    while True:
+        event = loader.peek_event()
+        if not isinstance(event, AliasEvent) and getattr(event, 'anchor', None) is not None:
+            _build(loader, anchors)
+        else:
+            loader.get_event()
+            if isinstance(event, (MappingStartEvent, SequenceStartEvent)):
+                depth += 1
+            elif isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+                depth -= 1
+        if depth == 0:
+            return
+
+
+def _build(loader: SafeLoader, anchors: dict) -> Any:
+    """
+    Construct the next value directly from parser events.
+
+    This skips building the intermediate node graph, which is
+    much faster than compose + construct with the C parser.
+    It covers what index files use: mappings, sequences,
+    plain and tagged scalars, anchors/aliases and merge keys.
+    """
+    event = loader.get_event()
+
+    if isinstance(event, AliasEvent):
+        return anchors[event.anchor]
+
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        if tag == STR_TAG:
+            value = event.value
+        elif tag == MERGE_TAG:
+            value = MERGE_TAG
+        else:
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark,
+                              style=event.style)
+            constructor = loader.yaml_constructors.get(tag)
+            if constructor is None:
+                value = loader.construct_document(node)
+            else:
+                value = constructor(loader, node)
+    elif isinstance(event, SequenceStartEvent):
+        value = []
+        while not loader.check_event(SequenceEndEvent):
+            value.append(_build(loader, anchors))
+        loader.get_event()
+    elif isinstance(event, MappingStartEvent):
+        value = {}
+        merged = []
+        while not loader.check_event(MappingEndEvent):
+            k = _build(loader, anchors)
+            v = _build(loader, anchors)
+            if k is MERGE_TAG:
+                merged += v if isinstance(v, list) else [v]
+            else:
+                value[k] = v
+        loader.get_event()
+        # Explicit keys take precedence over merged ones,
+        # earlier merged mappings over later ones
+        for m in merged:
+            for k, v in m.items():
+                value.setdefault(k, v)
+    else:
+        raise ValueError(f'Unexpected YAML event {event}')
+
+    if event.anchor is not None:
+        anchors[event.anchor] = value
+    return value
@@ -0,0 +1,553 @@
+"""
+The checks run for each app, registered as rules (see rules.py)
+in the order their findings are reported.
+"""
+from datetime import datetime
+import functools
+from typing import Any, List
+
+import requests
+
+from documents import validate_metadata, validate_values_schema
+from findings import Finding, add_finding
+from github_repos import REPO_FILES
+from history import AppHistory
+from probe import STATUS_CIRCUIT_OPEN, CircuitOpenError, describe_status
+from readme import ReadmeAnalysis, analyse_readme, read_capped
+from rules import APP, GITHUB, HTTP, AppCheck, rule
+
+# GitHub organisation expected to own the app home repository
+GITHUB_REPO_ORG = 'giantswarm'
+
+# Some chart annotation keys we'll look for
+ANNOTATIONS_TEAM          = 'application.giantswarm.io/team'
+ANNOTATIONS_README        = 'application.giantswarm.io/readme'
+ANNOTATIONS_METADATA      = 'application.giantswarm.io/metadata'
+ANNOTATIONS_VALUES_SCHEMA = 'application.giantswarm.io/values-schema'
+
+URL_ANNOTATIONS = (ANNOTATIONS_METADATA, ANNOTATIONS_README, ANNOTATIONS_VALUES_SCHEMA)
+
+
+def check_condition(expression, results, rule_id, error=None, warning=None, suggestion=None, accolade=None,
+                    params=()):
+    """
+    Add the accolade if `expression` is true, otherwise the first of
+    error, warning and suggestion given. Messages are templates for
+    `params`, only formatted when the finding is rendered.
+    """
+    if expression == True:
+        if accolade is not None:
+            add_finding(results, rule_id, 'accolade', accolade, *params)
+    else:
+        if error is not None:
+            add_finding(results, rule_id, 'error', error, *params)
+        elif warning is not None:
+            add_finding(results, rule_id, 'warning', warning, *params)
+        elif suggestion is not None:
+            add_finding(results, rule_id, 'suggestion', suggestion, *params)
+
+    return results
+
+
+def annotation_url(release: dict, annotation: str) -> list:
+    """
+    The URL in an annotation, as a list with zero or one element
+    """
+    url = (release.get('annotations') or {}).get(annotation)
+    return [url] if url is not None else []
+
+
+def release_urls(release: dict) -> list:
+    """
+    URLs in fields of a release that are checked for duplicates
+    """
+    urls = []
+    if 'home' in release:
+        urls.append(release['home'])
+    for field in ('sources', 'urls'):
+        if field in release:
+            urls += release[field]
+    for item in release.get('maintainers', []):
+        if 'url' in item:
+            urls.append(item['url'])
+    return urls
+
+
+def app_repo(app: AppCheck, ctx: Any):
+    """
+    RepoInfo of the app's GitHub repository, looked up once per app
+    and shared by all apps and catalogs referring to the repo
+    """
+    if app.repo is None:
+        app.repo = ctx.repo_cache.get(app.repo_handle, app=ctx.app)
+    return app.repo
+
+
+def get_duplicates(thelist: list) -> list:
+    thelist = sorted(thelist)
+    items = set()
+    dupes = set()
+    for i in thelist:
+        if i in items:
+            dupes.add(i)
+        else:
+            items.add(i)
+    return list(dupes)
+
+
+@rule('duplicate-release', scope=APP)
+def check_duplicate_releases(app: AppCheck, ctx: Any, ret: list):
+    versions = set()
+    for release in app.releases:
+        if release['version'] in versions:
+            add_finding(ret, 'duplicate-release', 'error', 'Duplicate release {}', release['version'])
+        versions.add(release['version'])
+
+
+@rule('required-field')
+def check_required_fields(app: AppCheck, ctx: Any, ret: list):
+    for field in ('apiVersion', 'created', 'description', 'digest', 'name', 'version'):
+        check_condition(field in app.release, ret, 'required-field',
+                        error='No `{}` given', params=(field,))
+
+
+@rule('chart-api-version', ids=('chart-api-version', 'chart-api-version-v2'))
+def check_api_version(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    check_condition(release['apiVersion'] in ('v1', 'v2'), ret, 'chart-api-version',
+                    error='Invalid helm chart apiVersion value `{}`', params=(release['apiVersion'],))
+    check_condition(release['apiVersion'] == 'v2', ret, 'chart-api-version-v2',
+                    suggestion='Migrate helm chart to apiVersion v2')
+
+
+@rule('recommended-field')
+def check_recommended_fields(app: AppCheck, ctx: Any, ret: list):
+    for field in ('appVersion', 'icon', 'sources', 'urls'):
+        check_condition(field in app.release, ret, 'recommended-field',
+                        warning='No `{}` given',
+                        accolade='Chart specifies the `{}` field', params=(field,))
+
+
+@rule('suggested-field')
+def check_suggested_fields(app: AppCheck, ctx: Any, ret: list):
+    for field in ('keywords', 'kubeVersion', 'maintainers'):
+        check_condition(field in app.release, ret, 'suggested-field',
+                        suggestion='Specify `{}` attribute',
+                        accolade='Chart specifies the `{}` field', params=(field,))
+
+
+@rule('dependencies')
+def check_dependencies(app: AppCheck, ctx: Any, ret: list):
+    check_condition('dependencies' in app.release, ret, 'dependencies',
+                    suggestion='Use `dependencies` to inform about required apps/charts',
+                    accolade='Chart specifies `dependencies`')
+
+
+@rule('name-app-suffix')
+def check_name_suffix(app: AppCheck, ctx: Any, ret: list):
+    check_condition(not app.release['name'].endswith('-app'), ret, 'name-app-suffix',
+                    warning='App name should not end with `-app`')
+
+
+@rule('description-meaningful')
+def check_description(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'description' in release:
+        check_condition('helm chart for' not in release['description'].lower(), ret, 'description-meaningful',
+                        warning='Description should be unique and meaningful (is: `{}`)',
+                        params=(release['description'],))
+
+
+@rule('home', ids=('home-set', 'home-github-org'))
+def check_home(app: AppCheck, ctx: Any, ret: list):
+    """
+    Also detects the app's GitHub repository, for the rules requiring this one
+    """
+    release = app.release
+    check_condition('home' in release, ret, 'home-set',
+                    error='Field `home` not set, must be set to a `{}/{}/...` repository URL',
+                    params=(ctx.github_url, GITHUB_REPO_ORG))
+
+    if 'home' in release:
+        check_condition(release['home'].startswith(f'{ctx.github_url}/{GITHUB_REPO_ORG}/'), ret, 'home-github-org',
+                        warning='URL in `home` should point to a GitHub repo owned by {0} (is {1})',
+                        accolade='URL in `home` points to a GitHub repo owned by {0}',
+                        params=(GITHUB_REPO_ORG, release['home']))
+
+        if release['home'].startswith(f'{ctx.github_url}/{GITHUB_REPO_ORG}/'):
+            segments = release['home'].split('/')
+            app.repo_handle = f'{GITHUB_REPO_ORG}/{segments[4]}'
+            app.repo_url = release['home']
+
+
+@rule('home-url-valid', cost=HTTP, urls=lambda release: [release['home']] if 'home' in release else [])
+def check_home_url(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'home' in release:
+        valid, status_code = app.url_results[release['home']][:2]
+        if not valid:
+            add_finding(ret, 'home-url-valid', 'error', 'URL in `home` is invalid, {} - `{}`',
+                        describe_status(status_code), release['home'])
+
+
+@rule('icon-host')
+def check_icon_host(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'icon' in release:
+        check_condition(release['icon'].startswith('https://s.giantswarm.io/app-icons/'), ret, 'icon-host',
+                        warning='Icon URL should start with `https://s.giantswarm.io/app-icons/` (is {})',
+                        accolade='Icon is hosted on our server s.giantswarm.io', params=(release['icon'],))
+
+
+@rule('icon-url-valid', cost=HTTP, urls=lambda release: [release['icon']] if 'icon' in release else [])
+def check_icon_url(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'icon' in release:
+        valid, status_code = app.url_results[release['icon']][:2]
+        if not valid:
+            add_finding(ret, 'icon-url-valid', 'error', 'Icon URL is invalid, {} - `{}`',
+                        describe_status(status_code), release['icon'])
+
+
+@rule('icon-svg')
+def check_icon_format(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'icon' in release:
+        check_condition(release['icon'].lower().endswith('.svg'), ret, 'icon-svg',
+                        warning='Icon should use the SVG format - currently: `{}`',
+                        accolade='Icon is in the SVG format', params=(release['icon'],))
+
+
+@rule('keywords', ids=('keywords-not-empty', 'keyword-format'))
+def check_keywords(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'keywords' in release:
+        check_condition(len(release['keywords']) > 0, ret, 'keywords-not-empty', error='Keywords list is empty')
+
+        for kw in release['keywords']:
+            check_condition(ctx.keyword_re.match(kw) is not None, ret, 'keyword-format',
+                            warning='Keyword doesn\'t match the expected format: `{}`', params=(kw,))
+
+
+@rule('chart-type')
+def check_type(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'type' in release:
+        check_condition(release['type'] == 'application', ret, 'chart-type',
+                        error='Chart field `type` should be `application` but is `{}` instead',
+                        params=(release['type'],))
+
+
+@rule('annotation-set')
+def check_annotations_set(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'annotations' in release:
+        for annotation in URL_ANNOTATIONS:
+            check_condition(annotation in release['annotations'], ret, 'annotation-set',
+                            warning='Annotation `{}` should be set', params=(annotation,))
+
+
+@rule('annotation-url-valid', cost=HTTP,
+      urls=lambda release: [url for a in URL_ANNOTATIONS for url in annotation_url(release, a)])
+def check_annotation_urls(app: AppCheck, ctx: Any, ret: list):
+    for annotation in URL_ANNOTATIONS:
+        for url in annotation_url(app.release, annotation):
+            valid, status_code = app.url_results[url][:2]
+            if not valid:
+                add_finding(ret, 'annotation-url-valid', 'error', 'URL in annotation `{}` is invalid, {} - `{}`',
+                            annotation, describe_status(status_code), url)
+
+
+def fetch_document(annotation: str, validate):
+    """
+    `fetch` function for rules validating the document in an annotation
+    """
+    def fetch(release: dict, ctx: Any) -> dict:
+        return {url: functools.partial(validate, validators=ctx.validators)
+                for url in annotation_url(release, annotation)}
+    return fetch
+
+
+def add_document_findings(app: AppCheck, annotation: str, rule_name: str, ret: list):
+    for url in annotation_url(app.release, annotation):
+        valid, status_code, findings = app.url_results[(url, rule_name)]
+        # an invalid URL is reported by annotation-url-valid
+        ret += findings or ()
+
+
+@rule('metadata-valid', cost=HTTP, fetch=fetch_document(ANNOTATIONS_METADATA, validate_metadata))
+def check_metadata(app: AppCheck, ctx: Any, ret: list):
+    add_document_findings(app, ANNOTATIONS_METADATA, 'metadata-valid', ret)
+
+
+@rule('values-schema', cost=HTTP, ids=('values-schema-valid', 'values-schema-draft'),
+      fetch=fetch_document(ANNOTATIONS_VALUES_SCHEMA, validate_values_schema))
+def check_values_schema(app: AppCheck, ctx: Any, ret: list):
+    add_document_findings(app, ANNOTATIONS_VALUES_SCHEMA, 'values-schema', ret)
+
+
+@rule('readme-versioned', cost=HTTP, requires=('annotation-url-valid',))
+def check_readme_versioned(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'version' in release:
+        for url in annotation_url(release, ANNOTATIONS_README):
+            # only for a README that exists
+            if not app.url_results[url][0]:
+                continue
+            check_condition(release['version'] in url, ret, 'readme-versioned',
+                            warning='README URL {} does not appear to be versioned',
+                            accolade='README URL appears to be versioned', params=(url,))
+
+
+@rule('readme', cost=HTTP,
+      ids=('readme-fetch', 'readme-size', 'readme-length', 'readme-placeholder', 'readme-heading',
+           'readme-code-fence', 'readme-image-alt', 'readme-empty-link', 'readme-link-reference',
+           'readme-link', 'readme-link-limit'),
+      urls=lambda release: annotation_url(release, ANNOTATIONS_README))
+def check_readme(app: AppCheck, ctx: Any, ret: list):
+    for url in annotation_url(app.release, ANNOTATIONS_README):
+        # an invalid URL is reported by annotation-url-valid
+        if app.url_results[url][0]:
+            ret += validate_readme(url, ctx)
+
+
+@rule('team-annotation')
+def check_team_annotation(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'annotations' in release:
+        check_condition(ANNOTATIONS_TEAM in release['annotations'], ret, 'team-annotation',
+                        warning='Annotation `{}` should be set',
+                        accolade='Team ownership is exposed via annotation', params=(ANNOTATIONS_TEAM,))
+
+
+@rule('release-fresh')
+def check_release_age(app: AppCheck, ctx: Any, ret: list):
+    release = app.release
+    if 'created' in release:
+        from dateutil.parser import isoparse
+        import pytz
+        utc = pytz.UTC
+
+        created = isoparse(release['created']).replace(tzinfo=utc)
+        now = datetime.utcnow().replace(tzinfo=utc)
+        age = now - created
+        days = age.total_seconds() / 60 / 60 / 24
+
+        check_condition(days <= 100, ret, 'release-fresh',
+                        warning='Latest release is older than 100 days',
+                        accolade='Latest release is fresh ({} days old)', params=(int(days),))
+
+
+@rule('release-deprecated')
+def check_deprecated(app: AppCheck, ctx: Any, ret: list):
+    if app.release.get('deprecated') == True:
+        add_finding(ret, 'release-deprecated', 'warning', 'Latest release is marked as deprecated')
+
+
+@rule('field-url-valid', cost=HTTP,
+      urls=lambda release: [url for field in ('sources', 'urls') for url in release.get(field, [])])
+def check_field_urls(app: AppCheck, ctx: Any, ret: list):
+    for field in ('sources', 'urls'):
+        for url in app.release.get(field, []):
+            valid, status_code = app.url_results[url][:2]
+            if not valid:
+                add_finding(ret, 'field-url-valid', 'error', 'URL in `{}` is invalid, {} - `{}`',
+                            field, describe_status(status_code), url)
+
+
+@rule('maintainer-url-valid', cost=HTTP,
+      urls=lambda release: [item['url'] for item in release.get('maintainers', []) if 'url' in item])
+def check_maintainer_urls(app: AppCheck, ctx: Any, ret: list):
+    for item in app.release.get('maintainers', []):
+        if 'url' in item:
+            valid, status_code = app.url_results[item['url']][:2]
+            if not valid:
+                add_finding(ret, 'maintainer-url-valid', 'error', 'URL in maintainer is invalid, {} - `{}`',
+                            describe_status(status_code), item['url'])
+
+
+@rule('duplicate-url')
+def check_duplicate_urls(app: AppCheck, ctx: Any, ret: list):
+    urls = release_urls(app.release)
+    dupe_urls = get_duplicates(urls)
+    if len(dupe_urls) > 0:
+        for url in urls:
+            check_condition(url not in dupe_urls, ret, 'duplicate-url',
+                            warning='URL is used in more than one field: `{}`', params=(url,))
+
+
+@rule('github-repo-detected', requires=('home',))
+def check_repo_detected(app: AppCheck, ctx: Any, ret: list):
+    if app.repo_handle is None:
+        add_finding(ret, 'github-repo-detected', 'error', 'Could not detect GitHub repo for this app')
+
+
+@rule('codeowners', cost=GITHUB, ids=('codeowners-file', 'codeowners-team'), requires=('home',))
+def check_codeowners(app: AppCheck, ctx: Any, ret: list):
+    """
+    Also finds the owning teams, for the rules requiring this one
+    """
+    if app.repo_handle is None:
+        return
+    repo = app_repo(app, ctx)
+    if not repo.exists:
+        return
+    if repo.teams is None:
+        add_finding(ret, 'codeowners-file', 'warning', 'Repo {} should have a `CODEOWNERS` file', app.repo_handle)
+    else:
+        add_finding(ret, 'codeowners-file', 'accolade', 'Repo {} has a `CODEOWNERS` file', app.repo_handle)
+        if not repo.teams:
+            add_finding(ret, 'codeowners-team', 'warning', 'CODEOWNERS file does not seem to contain any team name')
+        app.teams = repo.teams
+
+
+@rule('repo-file', cost=GITHUB, requires=('home',))
+def check_repo_files(app: AppCheck, ctx: Any, ret: list):
+    if app.repo_handle is None:
+        return
+    repo = app_repo(app, ctx)
+    if not repo.exists:
+        return
+    for path in REPO_FILES:
+        if not repo.has_file(path):
+            add_finding(ret, 'repo-file', 'warning', 'Repo {} should have a `{}` file', app.repo_handle, path)
+        else:
+            add_finding(ret, 'repo-file', 'accolade', 'Repo {} has a `{}` file', app.repo_handle, path)
+
+
+@rule('app-owner', cost=GITHUB, requires=('codeowners',))
+def check_owner(app: AppCheck, ctx: Any, ret: list):
+    owner = set(app.teams or ())
+
+    if len(owner) == 1:
+        add_finding(ret, 'app-owner', 'accolade', 'App data exposes a single owner `{}`', list(owner)[0])
+        app.owner = list(owner)[0]
+    elif len(owner) > 1:
+        add_finding(ret, 'app-owner', 'error', 'App data exposes various owners `{}`', ' '.join(list(owner)))
+    else:
+        add_finding(ret, 'app-owner', 'error', 'App does not have a visible owner')
+
+
+@rule('latest-version', scope=APP)
+def check_latest_version(app: AppCheck, ctx: Any, ret: list):
+    if app.latest_error is not None:
+        add_finding(ret, 'latest-version', 'error', 'Could not validate latest version: {}', app.latest_error)
+
+
+@rule('aggregated-changelog', cost=HTTP, scope=APP, requires=('home',))
+def check_aggregated_changelog(app: AppCheck, ctx: Any, ret: list):
+    # another validation not based on releases
+    if (app.repo_url is not None) and (ctx.aggregated_changelogs_repos is not None):
+        check_condition(app.repo_url in ctx.aggregated_changelogs_repos,
+                        ret, 'aggregated-changelog',
+                        error='Releases are not aggregated in Changes and '
+                              'Releases. Please add the app\'s repo to the '
+                              '[config](https://github.com/giantswarm/docs/blob/main/scripts/aggregate-changelogs/config.yaml)')
+
+
+@rule('names', scope=APP, ids=('duplicate-app', 'similar-app-name'))
+def check_names(app: AppCheck, ctx: Any, ret: list):
+    # duplicate and similar names across catalogs
+    if ctx.names is not None:
+        ret += ctx.names.findings(app.catalog, app.app_name)
+
+
+@rule('release-history', scope=APP,
+      ids=('too-many-releases', 'latest-release-date', 'kube-version-dropped',
+           'kube-version-drift', 'too-many-catalog-releases'))
+def check_release_history(app: AppCheck, ctx: Any, ret: list):
+    # all releases, with --release-history
+    if ctx.history is not None:
+        history = AppHistory(app.releases)
+        ret += ctx.history[app.catalog].add(app.app_name, history)
+        app.release_stats = history.stats()
+
+
+def validate_readme(url: str, ctx: Any) -> List[Finding]:
+    """
+    Obtain and validate the README from the given URL
+    and return the findings
+    """
+    findings = []
+    max_size = ctx.conf.get('readme_max_size_kb', 512) * 1024
+
+    try:
+        r = ctx.prober.get(url, stream=True, app=ctx.app)
+    except CircuitOpenError as e:
+        findings.append(Finding('readme-fetch', 'error', 'Error fetching README URL {}: {}', url, describe_status(STATUS_CIRCUIT_OPEN)))
+        return findings
+    except requests.RequestException as e:
+        findings.append(Finding('readme-fetch', 'error', 'Error fetching README URL {}: {}', url, str(e)))
+        return findings
+
+    if r.status_code >= 400:
+        r.close()
+        findings.append(Finding('readme-fetch', 'error', 'Error fetching README URL {}: status {}', url, r.status_code))
+        return findings
+
+    try:
+        with r.open() as stream:
+            body, truncated = read_capped(stream, max_size)
+    except Exception as e:
+        # errors while streaming come from urllib3, not requests
+        findings.append(Finding('readme-fetch', 'error', 'Error fetching README URL {}: {}', url, str(e)))
+        return findings
+
+    encoding = requests.utils.get_encoding_from_headers(r.headers) or 'utf-8'
+    content = body.decode(encoding, errors='replace')
+    if truncated:
+        # don't analyse a line cut in half
+        content = content[:content.rfind('\n') + 1]
+        findings.append(Finding('readme-size', 'warning', 'README is larger than {} KB, only the beginning was checked', max_size // 1024))
+
+    # length
+    if len(content) < 500:
+        findings.append(Finding('readme-length', 'error', 'README content too short'))
+    elif len(content) < 1000:
+        findings.append(Finding('readme-length', 'warning', 'README content could be longer'))
+    else:
+        findings.append(Finding('readme-length', 'accolade', 'README content appears reasonably long ({} chars)', len(content)))
+
+    # placeholder
+    if '{APP-NAME}' in content:
+        findings.append(Finding('readme-placeholder', 'error', 'README contains placeholder `{APP-NAME}`'))
+
+    analysis = analyse_readme(content, url)
+    findings += analysis.findings()
+    findings += check_readme_links(analysis, url, ctx)
+
+    return findings
+
+
+def check_readme_links(analysis: ReadmeAnalysis, url: str, ctx: Any) -> List[Finding]:
+    """
+    Probe the links and images of a README. At most `readme_max_links`
+    URLs are checked, and only for up to `readme_link_timeout` seconds,
+    so a README with hundreds of links can't stall the run. URLs already
+    probed for other fields or apps are not probed again.
+    """
+    findings = []
+    max_links = ctx.conf.get('readme_max_links', 50)
+
+    urls = [u for u in analysis.link_urls() if u != url]
+    if len(urls) > max_links:
+        findings.append(Finding('readme-link-limit', 'suggestion',
+                                'README has {} links, only the first {} were checked', len(urls), max_links))
+        urls = urls[:max_links]
+
+    results = ctx.prober.probe_all(urls, referrer=ctx.app,
+                                   timeout=ctx.conf.get('readme_link_timeout', 30))
+    for link_url in urls:
+        if link_url not in results:
+            continue
+        valid, status_code = results[link_url]
+        if not valid:
+            findings.append(Finding('readme-link', 'warning', 'Link in README is invalid, {} - `{}`',
+                                    describe_status(status_code), link_url))
+
+    unchecked = len(urls) - len(results)
+    if unchecked > 0:
+        findings.append(Finding('readme-link-limit', 'suggestion',
+                                '{} README links could not be checked in time', unchecked))
+
+    return findings
@@ -1,569 +1,588 @@
-from pprint import pprint
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import click
-from datetime import datetime
 from os import getenv
 import re
-from typing import AsyncContextManager, Optional, Tuple
-
-from colored import fg, attr
-from dateutil.parser import isoparse
-from dateutil.relativedelta import *
-import github
-from github.GithubException import UnknownObjectException
-import requests
-import semver
-import yaml
-import pytz
-
-utc=pytz.UTC
-
-# GitHub organisation expected to own the app home repository
-GITHUB_REPO_ORG = 'giantswarm'
-
-# Some chart annotation keys we'll look for
-ANNOTATIONS_TEAM          = 'application.giantswarm.io/team'
-ANNOTATIONS_README        = 'application.giantswarm.io/readme'
-ANNOTATIONS_METADATA      = 'application.giantswarm.io/metadata'
-ANNOTATIONS_VALUES_SCHEMA = 'application.giantswarm.io/values-schema'
-
-# These globals are used in our functions
-GITHUB_CLIENT = None
-CONF = None
-KEYWORD_RE = None
-CODEOWNER_TEAM_RE = None
-AGGREGATED_CHANGELOGS_REPOS = None
-
-@click.command()
+import sys
+import threading
+import time
+from typing import AsyncContextManager, Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from catalog import iter_catalog_app_names, iter_catalog_entries, load_yaml
+import checks  # registers the rules
+from documents import ValidatorCache
+from github_repos import GithubPool, RepoCache
+from history import CatalogHistory, latest_version
+from httpcache import HttpCache
+from metrics import Metrics
+from names import NameAnalysis
+from output import OUTPUT_FORMATS, TeeWriter, count_findings, create_writer
+from probe import UrlProber
+from results import ResultsStore, StoreWriter, format_time, print_diff
+from rules import GITHUB, HTTP, LOCAL, REGISTRY, RELEASE, AppCheck, RuleSelection, app_result, run_stage
+from shards import Shard, merge_partials
+from state import ValidationState
+from watch import StatusServer, Watcher
+
+# Heavy modules (github, dateutil, colored) are imported
+# where they are used, to keep startup fast for single-app checks.
+
+class Context:
+    """
+    Configuration and clients shared by all validation functions
+    during a run. Safe to use from several worker threads.
+    """
+    def __init__(self, conf: dict, tokens: Optional[List[str]] = None,
+                 cache: Optional[HttpCache] = None,
+                 repo_cache_path: Optional[str] = None):
+        self.conf = conf
+        self.keyword_re = re.compile(conf['keyword_pattern'])
+        self.codeowner_team_re = re.compile(conf['codeowner_team_pattern'])
+        self.metrics = Metrics()
+        self.prober = UrlProber(conf['user_agent'],
+                                max_workers=conf.get('url_probe_concurrency', 32),
+                                max_per_host=conf.get('url_probe_concurrency_per_host', 4),
+                                cache=cache,
+                                timeout=conf.get('url_timeout', 10),
+                                min_timeout=conf.get('url_min_timeout', 2),
+                                retries=conf.get('url_retries', 2),
+                                circuit_threshold=conf.get('circuit_breaker_threshold', 3),
+                                circuit_cooldown=conf.get('circuit_breaker_cooldown', 60),
+                                metrics=self.metrics)
+        self.github_url = conf.get('github_url', 'https://github.com')
+        self.github_pool = GithubPool(tokens or [],
+                                      reserve=conf.get('github_rate_limit_reserve', 100),
+                                      base_url=conf.get('github_api_url', 'https://api.github.com'),
+                                      metrics=self.metrics)
+        self.repo_cache = RepoCache(self.github_pool, self.codeowner_team_re,
+                                    path=repo_cache_path,
+                                    ttl=conf.get('github_repo_cache_ttl', 24 * 60 * 60))
+        self.validators = ValidatorCache()
+        self.rules = RuleSelection()
+        self.state = None
+        self.names = None
+        # catalog name -> CatalogHistory, with --release-history
+        self.history = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._aggregated_changelogs_repos = None
+        self._aggregated_changelogs_loaded = False
+
+    @property
+    def app(self) -> Optional[str]:
+        """
+        The app validated in the current thread, as `catalog/app`
+        """
+        return getattr(self._local, 'app', None)
+
+    @app.setter
+    def app(self, value: Optional[str]):
+        self._local.app = value
+
+    @property
+    def aggregated_changelogs_repos(self) -> Optional[list]:
+        """
+        Repositories configured for aggregated changelogs,
+        fetched when first needed.
+        """
+        with self._lock:
+            if not self._aggregated_changelogs_loaded:
+                self._aggregated_changelogs_repos = get_aggregated_changelog_repos(self)
+                self._aggregated_changelogs_loaded = True
+            return self._aggregated_changelogs_repos
+
+    def close(self):
+        self.prober.close()
+        self.repo_cache.save()
+        if self.state is not None:
+            self.state.save()
+
+
+@click.group(invoke_without_command=True)
 @click.option('--conf', default='./config.yaml', help='Configuration file path.')
-@click.option('--token-path', default='~/.github-token', help='Github token path.')
+@click.option('--token-path', default=['~/.github-token'], multiple=True, help='Github token path. Can be given several times to spread API calls over several tokens.')
 @click.option('--app-name', 'app_filter', help='Only report for this app', multiple=True)
-def main(conf, token_path, app_filter):
-    global AGGREGATED_CHANGELOGS_REPOS
-    global GITHUB_CLIENT
-    global CONF
-    global KEYWORD_RE
-    global CODEOWNER_TEAM_RE
-
-    CONF = read_config(conf)
-
-    KEYWORD_RE = re.compile(CONF['keyword_pattern'])
-    CODEOWNER_TEAM_RE = re.compile(CONF['codeowner_team_pattern'])
-
-    if token_path is None:
-        GITHUB_CLIENT = github.Github()
-    else:
-        token = read_token(token_path)
-        GITHUB_CLIENT = github.Github(token)
-    
-    AGGREGATED_CHANGELOGS_REPOS = get_aggregated_changelog_repos()
-
-    for cat in CONF['catalogs']:
-        error_count = 0
-        warning_count = 0
-        suggestions_count = 0
-        accolades_count = 0
-        index = load_catalog_index(cat['url'])
-        
-        if app_filter == ():
-            print(f'\n## Catalog `{cat["name"]}` - {len(index["entries"])} apps')
-
-        for app_name in index['entries'].keys():
-
-            # Apply app filter
-            if app_filter != ():
-                if app_name not in app_filter:
-                    continue
-
-            result = validate_app_releases(index['entries'][app_name])
-
-            # another validation not based on releases
-            if (AGGREGATED_CHANGELOGS_REPOS is not None) and (result['repo_url'] is not None):
-                result = check_condition(result['repo_url'] in AGGREGATED_CHANGELOGS_REPOS,
-                                         result,
-                                         error='Releases are not aggregated in Changes and '
-                                               'Releases. Please add the app\'s repo to the '
-                                               '[config](https://github.com/giantswarm/docs/blob/main/scripts/aggregate-changelogs/config.yaml)')
-
-
-            error_count += len(result['errors'])
-            warning_count += len(result['warnings'])
-            suggestions_count  += len(result['suggestions'])
-            accolades_count += len(result['accolades'])
-
-
-            if len(result['errors']) + len(result['warnings']) > 0:
-                errinfo = ''
-                if len(result['errors']) > 0:
-                    errinfo += f"{len(result['errors'])} errors and "
-                errinfo += f"{len(result['warnings'])} warnings"
-
-                app_label = f'`{app_name}`'
-                if result['repo_url'] is not None:
-                    app_label = f"[{app_name}]({result['repo_url']})"
-                
-                app_owner = '_no owner_'
-                if result['owner'] is not None:
-                    app_owner = result['owner']
-
-                print(f'\n### {app_label} ({app_owner}) -- {errinfo}')
-
-            print('\n<details>')
-
-            print(f'\nInformation based on release v{result["latest_release"]}')
-
-            if len(result['errors']):
-                print(f"\n#### {attr('bold')}{fg('red')}Errors{attr('reset')}\n")
-                for error in result['errors']:
-                    print(f"- [ ] {fg('red')}{error}{attr('reset')}")
-
-            if len(result['warnings']):
-                print(f"\n#### {attr('bold')}{fg('yellow')}Warnings{attr('reset')}\n")
-                for warning in result['warnings']:
-                    print(f"- [ ] {fg('yellow')}{warning}{attr('reset')}")
-
-            if len(result['suggestions']):
-                print(f"\n#### {attr('bold')}{fg('yellow')}Suggestions{attr('reset')}\n")
-                for item in result['suggestions']:
-                    print(f"- [ ] {item}")
-
-            # if len(result['accolades']):
-            #     print(f"\n#### {attr('bold')}{fg('yellow')}Looking good{attr('reset')}\n")
-            #     for item in result['accolades']:
-            #         print(f"- {fg('green')}{item}{attr('reset')}")
-
-            print('\n</details>')
-
-        print(f'\n{error_count} errors, {warning_count} warnings, {suggestions_count} suggestions, {accolades_count} accolades in total')
-
-
-def validate_app_releases(releases: list) -> dict:
-    """
-    Gathers errors, warnings, suggestions etc. based on
-    the releases for an app in a helm repository.
-    Validates whether a latest release can be found
-    and if yes, does a deeper check on the latest release.
-    """
-    ret = {
-        'errors': [],
-        'warnings': [],
-        'suggestions': [],
-        'accolades': [],
-        'repo_url': None,
-        'owner': None,
-        'latest_release': None,
+@click.option('--jobs', default=1, type=click.IntRange(min=1), help='Number of apps to validate in parallel.')
+@click.option('--cache-dir', default='~/.cache/app-catalog-qa', help='HTTP cache directory.')
+@click.option('--no-cache', is_flag=True, help='Don\'t use the HTTP cache.')
+@click.option('--state-file', help='State file for incremental runs. Only apps with a changed latest release get revalidated.')
+@click.option('--max-age', default=24.0, help='Revalidate apps in incremental runs after this many hours.')
+@click.option('--repo-cache-file', help='File to keep GitHub repository checks in between runs, for `github_repo_cache_ttl` seconds.')
+@click.option('--watch', is_flag=True, help='Keep running, poll the catalog indexes and revalidate the apps that changed. Results are served over HTTP.')
+@click.option('--interval', default=300.0, help='Seconds between polls in watch mode.')
+@click.option('--listen', default='127.0.0.1:8080', help='Address for serving results in watch mode, as host:port.')
+@click.option('--results-db', help='Store the results of the run in this SQLite database, see the report, diff and runs commands.')
+@click.option('--metrics-file', help='Write timing and network metrics of the run to this file.')
+@click.option('--metrics-format', type=click.Choice(['json', 'prometheus']), help='Format of the metrics file. Default: prometheus for *.prom files, json otherwise.')
+@click.option('--release-history', is_flag=True, help='Analyse the history of all releases, not only the latest.')
+@click.option('--rules', 'selected_rules', multiple=True, help='Only run these rules: rule names, finding rule IDs or cost classes (local, http, github), comma-separated. Default: all rules.')
+@click.option('--skip-rules', multiple=True, help='Don\'t run these rules. Takes the same values as --rules.')
+@click.option('--list-rules', is_flag=True, help='List all rules with their cost class and finding rule IDs, then exit.')
+@click.option('--shard', help='Only check the apps of shard i of N, given as i/N. Apps are split across shards by a hash of their name. Combine the output of all shards with the merge command.')
+@click.option('--output-format', type=click.Choice(OUTPUT_FORMATS), help='Report format. jsonl writes one record per app as soon as it is validated. Default: markdown, jsonl with --shard.')
+@click.pass_context
+def main(click_ctx, conf, token_path, app_filter, jobs, cache_dir, no_cache, state_file, max_age,
+         metrics_file, metrics_format, output_format, repo_cache_file, release_history,
+         selected_rules, skip_rules, list_rules, shard, results_db, watch, interval, listen):
+    """
+    Check the apps of the configured catalogs and write a report
+    """
+    if click_ctx.invoked_subcommand is not None:
+        return
+
+    if list_rules:
+        for r in REGISTRY.values():
+            print(f'{r.name:24} {r.cost:7} {r.scope:8} {", ".join(r.ids)}')
+        return
+
+    try:
+        rules = RuleSelection(selected_rules, skip_rules)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    if shard is not None:
+        if app_filter != ():
+            raise click.UsageError('--shard can\'t be combined with --app-name')
+        try:
+            shard = Shard.parse(shard)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    if output_format is None:
+        output_format = 'markdown' if shard is None else 'jsonl'
+    if watch:
+        if release_history or results_db is not None:
+            raise click.UsageError('--watch can\'t be combined with --release-history or --results-db')
+        host, _, port = listen.rpartition(':')
+        if not port.isdigit():
+            raise click.UsageError(f'Invalid --listen address {listen}, expected host:port')
+
+    # a run with local rules only needs no GitHub token
+    tokens = []
+    if GITHUB in rules.costs():
+        tokens = [read_token(path) for path in token_path]
+
+    config = read_config(conf)
+
+    cache = None
+    if not no_cache:
+        cache = HttpCache(cache_dir,
+                          ttl=config.get('http_cache_ttl', 3600),
+                          max_size=config.get('http_cache_max_size_mb', 256) * 1024 * 1024)
+
+    ctx = Context(config, tokens, cache, repo_cache_file)
+    ctx.rules = rules
+    if state_file is not None:
+        ctx.state = ValidationState(state_file, max_age * 60 * 60)
+    if release_history and 'release-history' in {r.name for r in rules.rules}:
+        ctx.history = {}
+
+    executor = None
+    if jobs > 1:
+        executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='app')
+
+    if watch:
+        try:
+            watch_catalogs(ctx, executor, interval, (host, int(port)),
+                           only=set(app_filter) or None, shard=shard)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            ctx.close()
+        return
+
+    # Name checks compare apps across all catalogs, so all
+    # names are needed before the first app is validated.
+    # Skipped when checking single apps, to keep that fast.
+    if app_filter == () and 'names' in {r.name for r in rules.rules}:
+        with ctx.metrics.phase('name_analysis'):
+            ctx.names = NameAnalysis({cat['name']: load_catalog_app_names(cat['url'], ctx)
+                                      for cat in ctx.conf['catalogs']})
+
+    writer = create_writer(output_format)
+    store = None
+    if results_db is not None:
+        store = ResultsStore(results_db)
+        run_id = store.start_run(shard=str(shard) if shard is not None else None)
+        writer = TeeWriter([writer, StoreWriter(store, run_id)])
+    map_results = ordered_map if writer.ordered else completion_map
+
+    for cat in ctx.conf['catalogs']:
+        catalog_start = time.perf_counter()
+        counts = {'errors': 0, 'warnings': 0, 'suggestions': 0, 'accolades': 0}
+        app_count = 0
+        # Apply app filter. With a filter we stop reading
+        # the index as soon as all apps have been found.
+        # The selector also numbers apps in index order, for
+        # merging sharded runs. Without --shard it passes all.
+        selector = (shard or Shard(1, 1)).selector()
+        entries = load_catalog_index(cat['url'], ctx, only=set(app_filter) or None,
+                                     catalog=cat['name'], select=selector)
+
+        if ctx.history is not None:
+            ctx.history[cat['name']] = CatalogHistory(
+                max_releases_per_app=ctx.conf.get('max_releases_per_app', 100),
+                max_releases=ctx.conf.get('max_releases_per_catalog', 10000))
+
+        # The local rules of all apps run first, as the index is read.
+        # Only the latest release of each app is kept for the HTTP and
+        # GitHub rules, which then run for `jobs` apps at a time.
+        with ctx.metrics.phase('local_rules', catalog=cat['name']):
+            apps = [start_app(cat['name'], app_name, releases, ctx)
+                    for app_name, releases in entries]
+
+        def validate(app):
+            return app.app_name, finish_app(app, ctx)
+
+        writer.start_catalog(cat)
+
+        for app_name, result in map_results(executor, validate, apps, window=jobs * 2):
+            app_count += 1
+            for key, n in count_findings(result).items():
+                counts[key] += n
+
+            writer.app(cat, app_name, result, position=selector.positions[app_name])
+
+        catalog_findings = []
+        history_stats = None
+        if ctx.history is not None:
+            # a shard has only part of the catalog, the merge
+            # command checks the catalog as a whole
+            if shard is None:
+                catalog_findings = [f for f in ctx.history[cat['name']].findings()
+                                    if rules.reports(f.rule_id)]
+            history_stats = ctx.history[cat['name']].stats()
+
+        writer.end_catalog(cat, app_count, counts, header=app_filter == (),
+                           findings=catalog_findings, stats=history_stats)
+
+        ctx.metrics.record_phase('catalog', time.perf_counter() - catalog_start,
+                                 catalog=cat['name'])
+
+    distinct, shared, references = ctx.prober.shared_url_stats()
+    summary = {
+        'urls': {
+            'distinct': distinct,
+            'shared': shared,
+            'duplicate_checks_avoided': references - distinct,
+        },
+        'github_tokens': [
+            {'token': q.label, 'calls': q.calls, 'remaining': q.remaining, 'limit': q.limit}
+            for q in ctx.github_pool.usage() if q.calls > 0
+        ],
+        'github_repos': {
+            'inspected': ctx.repo_cache.misses,
+            'reused': ctx.repo_cache.hits,
+        },
+        'schemas': {
+            'compiled': ctx.validators.misses,
+            'reused': ctx.validators.hits,
+        },
     }
-    
-    releases_dict = {}   # dict with version string as key
+    if shard is not None:
+        summary['shard'] = str(shard)
+        # the finding rule IDs reported, for merging catalog findings
+        summary['rules'] = 'all' if rules.complete else ','.join(sorted(rules.ids))
+    writer.finish(summary)
+
+    if executor is not None:
+        executor.shutdown()
+    ctx.close()
+    if store is not None:
+        store.close()
+
+    # Timing goes to stderr to keep the report clean
+    ctx.metrics.print_summary(sys.stderr)
+    if metrics_file is not None:
+        if metrics_format is None:
+            metrics_format = 'prometheus' if metrics_file.endswith('.prom') else 'json'
+        if metrics_format == 'prometheus':
+            ctx.metrics.write_prometheus(metrics_file)
+        else:
+            ctx.metrics.write_json(metrics_file)
 
-    for release in releases:
-        if release['version'] in releases_dict:
-            ret['errors'].append(f'Duplicate release {release["version"]}')
-            continue
 
-        releases_dict[release['version']] = release
+@main.command()
+@click.argument('partials', nargs=-1, required=True, type=click.File('r'))
+@click.option('--conf', default='./config.yaml', help='Configuration file path.')
+@click.option('--output-format', default='markdown', type=click.Choice(OUTPUT_FORMATS), help='Report format.')
+def merge(partials, conf, output_format):
+    """
+    Combine the jsonl output of all shards of a run (see --shard)
+    into one report
+    """
+    config = read_config(conf)
+    writer = create_writer(output_format)
+    try:
+        merge_partials(partials, writer, max_releases=config.get('max_releases_per_catalog', 10000))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
 
+@main.command()
+@click.argument('run_id', required=False, type=int)
+@click.option('--results-db', required=True, help='Results database written with --results-db.')
+@click.option('--output-format', default='markdown', type=click.Choice(OUTPUT_FORMATS), help='Report format.')
+def report(run_id, results_db, output_format):
+    """
+    Render the report of a stored run, by default the latest,
+    without network access
+    """
+    store = ResultsStore(results_db)
     try:
-        ret['latest_release'] = latest_version(releases_dict.keys())
-        result = validate_app_release(releases_dict[ret['latest_release']])
-        ret['errors'] += result['errors']
-        ret['warnings'] += result['warnings']
-        ret['suggestions'] += result['suggestions']
-        ret['accolades'] += result['accolades']
-        ret['repo_url'] = result['repo_url']
-        ret['owner'] = result['owner']
+        run_id, _ = store.finished_run(run_id)
+        store.render(run_id, create_writer(output_format))
     except ValueError as e:
-        ret['errors'].append(f'Could not validate latest version: {str(e)}')
+        raise click.ClickException(str(e))
+    finally:
+        store.close()
 
-    return ret
+
+@main.command()
+@click.argument('old', required=False, type=int)
+@click.argument('new', required=False, type=int)
+@click.option('--results-db', required=True, help='Results database written with --results-db.')
+def diff(old, new, results_db):
+    """
+    Show new, fixed and persisting findings per app between two
+    stored runs. NEW defaults to the latest run, OLD to the one
+    before NEW.
+    """
+    store = ResultsStore(results_db)
+    try:
+        new_run = store.finished_run(new)
+        old_run = store.finished_run(old, before=new_run[0])
+        print_diff(store, old_run, new_run, sys.stdout)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        store.close()
 
 
-def validate_app_release(release: dict) -> dict:
+@main.command()
+@click.option('--results-db', required=True, help='Results database written with --results-db.')
+@click.option('--limit', default=20, help='Number of runs to list.')
+def runs(results_db, limit):
     """
-    Valide a specific release of an app and
-    return reault dict.
+    List the latest stored runs
     """
-    global KEYWORD_RE
+    store = ResultsStore(results_db)
+    try:
+        for run_id, started, finished, shard, apps in store.runs(limit):
+            duration = 'unfinished' if finished is None else f'took {finished - started:.0f}s'
+            shard = f', shard {shard}' if shard is not None else ''
+            print(f'{run_id:6}  {format_time(started)}  {apps or 0} apps, {duration}{shard}')
+    finally:
+        store.close()
 
-    ret = {
-        'errors': [],
-        'warnings': [],
-        'suggestions': [],
-        'accolades': [],
-        'repo_url': None,
-        'owner': None,
-    }
 
-    urls = []
+def watch_catalogs(ctx: Context, executor: Optional[ThreadPoolExecutor], interval: float,
+                   address: Tuple[str, int], only: Optional[Set[str]] = None,
+                   shard: Optional[Shard] = None):
+    """
+    Watch mode: poll the catalogs every `interval` seconds and serve
+    the results on `address`, until interrupted
+    """
+    watcher = Watcher(ctx, ctx.conf['catalogs'],
+                      start=lambda catalog, app_name, releases: start_app(catalog, app_name, releases, ctx),
+                      finish=lambda app: finish_app(app, ctx),
+                      executor=executor, only=only, shard=shard,
+                      check_names=only is None and 'names' in {r.name for r in ctx.rules.rules})
+    server = StatusServer(address, watcher)
+    server.start()
+    print(f'Serving results on http://{address[0]}:{address[1]}/status, polling every {interval:.0f}s',
+          file=sys.stderr)
+    try:
+        watcher.run(interval)
+    finally:
+        server.shutdown()
 
-    owner_annotation = None
-    owner_codeowners = None
 
-    # Giant Swarm owned repo for this app
-    github_repo_handle = None
+def ordered_map(executor: Optional[ThreadPoolExecutor], fn: Callable,
+                iterable: Iterable, window: int) -> Iterator:
+    """
+    Like executor.map(), yields results in input order, but consumes
+    the iterable lazily and keeps at most `window` tasks in flight.
+    Without executor, works like the builtin map().
+    """
+    if executor is None:
+        yield from map(fn, iterable)
+        return
 
-    # required fields
-    for field in ('apiVersion', 'created', 'description', 'digest', 'name', 'version'):
-        ret = check_condition(field in release, ret,
-                              error=f'No `{field}` given')
-    
-    # apiVersions
-    ret = check_condition(release['apiVersion'] in ('v1', 'v2'), ret,
-                          error=f'Invalid helm chart apiVersion value `{release["apiVersion"]}`')
-    ret = check_condition(release['apiVersion'] == 'v2', ret,
-                          suggestion='Migrate helm chart to apiVersion v2')
-
-    # recommended fields
-    for field in ('appVersion', 'icon', 'sources', 'urls'):
-        ret = check_condition(field in release, ret,
-                              warning=f'No `{field}` given',
-                              accolade=f'Chart specifies the `{field}` field')
-    
-    # suggested fields
-    for field in ('keywords', 'kubeVersion', 'maintainers'):
-        ret = check_condition(field in release, ret,
-                              suggestion=f'Specify `{field}` attribute',
-                              accolade=f'Chart specifies the `{field}` field')
-    
-    # additional fields
-    ret = check_condition('dependencies' in release, ret,
-                          suggestion='Use `dependencies` to inform about required apps/charts',
-                          accolade='Chart specifies `dependencies`')
-    
-    # Deeper evaluations
-    ret = check_condition(not release['name'].endswith('-app'), ret,
-                          warning='App name should not end with `-app`')
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
 
-    if 'description' in release:
-        ret = check_condition('helm chart for' not in release['description'].lower(), ret,
-                              warning=f'Description should be unique and meaningful (is: `{release["description"]}`)')
-    
-    # URLs
-    ret = check_condition('home' in release, ret,
-                          error=f'Field `home` not set, must be set to a `https://github.com/{GITHUB_REPO_ORG}/...` repository URL')
-
-    if 'home' in release:
-        urls.append(release['home'])
-
-        ret = check_condition(release['home'].startswith(f'https://github.com/{GITHUB_REPO_ORG}/'), ret,
-                              warning=f'URL in `home` should point to a GitHub repo owned by {GITHUB_REPO_ORG} (is {release["home"]})',
-                              accolade=f'URL in `home` points to a GitHub repo owned by {GITHUB_REPO_ORG}')
-
-        if release['home'].startswith(f'https://github.com/{GITHUB_REPO_ORG}/'):
-            segments = release['home'].split('/')
-            github_repo_handle = f'{GITHUB_REPO_ORG}/{segments[4]}'
-            ret['repo_url'] = release['home']
-        
-        valid, status_code = check_url(release['home'])
-        ret = check_condition(valid, ret,
-                              error=f'URL in `home` is invalid, status code {status_code} - `{release["home"]}`')
-    
-    if 'icon' in release:
-        ret = check_condition(release['icon'].startswith('https://s.giantswarm.io/app-icons/'), ret,
-            warning=f'Icon URL should start with `https://s.giantswarm.io/app-icons/` (is {release["icon"]})',
-            accolade='Icon is hosted on our server s.giantswarm.io')
-        
-        valid, status_code = check_url(release['icon'])
-
-        ret = check_condition(valid, ret, error=f'Icon URL is invalid, status code {status_code} - `{release["icon"]}`')
-        
-        ret = check_condition(release['icon'].lower().endswith('.svg'), ret,
-            warning=f'Icon should use the SVG format - currently: `{release["icon"]}`',
-            accolade='Icon is in the SVG format')
-    
-    if 'keywords' in release:
-        ret = check_condition(len(release['keywords']) > 0, ret, error=f'Keywords list is empty')
-        
-        if len(release['keywords']) > 0:
-            for kw in release['keywords']:
-                ret = check_condition(KEYWORD_RE.match(kw) is not None, ret, warning=f'Keyword doesn\'t match the expected format: `{kw}`')
-    
-    if 'type' in release:
-        ret = check_condition(release['type'] == 'application', ret,
-                              error=f"Chart field `type` should be `application` but is `{release['type']}` instead")
-
-    if 'annotations' in release:
-        for annotation in (ANNOTATIONS_METADATA,
-                           ANNOTATIONS_README,
-                           ANNOTATIONS_VALUES_SCHEMA):
-            
-            ret = check_condition(annotation in release['annotations'], ret,
-                                  warning=f'Annotation `{annotation}` should be set')
-
-            if annotation in release['annotations']:
-                url = release['annotations'][annotation]
-                valid, status_code = check_url(release['annotations'][annotation])
-
-                ret = check_condition(valid, ret, error=f'URL in annotation `{annotation}` is invalid, status code {status_code} - `{release["home"]}`')
-                if valid:
-                    # Deeper README analysis
-                    if annotation == ANNOTATIONS_README:
-                        if 'version' in release:
-
-                            ret = check_condition(release['version'] in release['annotations'][annotation], ret,
-                                warning=f"README URL {release['annotations'][annotation]} does not appear to be versioned",
-                                accolade=f'README URL appears to be versioned')
-
-                        err, warn, acc = validate_readme(release['annotations'][annotation])
-                        ret['errors'] += err
-                        ret['warnings'] += warn
-                        ret['accolades'] += acc
-
-        ret = check_condition(ANNOTATIONS_TEAM in release['annotations'], ret,
-            warning=f'Annotation `{ANNOTATIONS_TEAM}` should be set',
-            accolade=f'Team ownership is exposed via annotation')
-
-    if 'created' in release:
-        created = isoparse(release['created']).replace(tzinfo=utc)
-        now = datetime.utcnow().replace(tzinfo=utc)
-        age = now - created
-        days = age.total_seconds() / 60 / 60 / 24
-
-        ret = check_condition(days <= 100, ret,
-                              warning=f'Latest release is older than 100 days',
-                              accolade=f'Latest release is fresh ({int(days)} days old)')
-
-    if 'deprecated' in release:
-        if release['deprecated'] == True:
-            ret['warnings'].append(f'Latest release is marked as deprecated')
-
-    for field in ('sources', 'urls'):
-        if field in release:
-            for url in release[field]:
-                urls.append(url)
-
-                valid, status_code = check_url(url)
-                ret = check_condition(valid, ret,
-                    error=f'URL in `{field}` is invalid, status code {status_code} - `{url}`')
-    
-    if 'maintainers' in release:
-        for item in release['maintainers']:
-            if 'url' in item:
-                urls.append(item['url'])
-
-                valid, status_code = check_url(item['url'])
-                ret = check_condition(valid, ret,
-                    error=f'URL in maintainer is invalid, status code {status_code} - `{item["url"]}`')
-
-    # Look for duplicate URLs
-    dupe_urls = get_duplicates(urls)
-    if len(dupe_urls) > 0:
-        for url in urls:
-            ret = check_condition(url not in dupe_urls, ret,
-                warning=f'URL is used in more than one field: `{url}`')
-    
-    # Look into app GitHub repo
-    if github_repo_handle is None:
-        ret['errors'].append('Could not detect GitHub repo for this app')
-    else:
-        repo_exists = github_repo_exists(github_repo_handle)
-        if repo_exists:
-            codeowners = get_github_repo_file(github_repo_handle, 'CODEOWNERS')
-            if codeowners is None:
-                ret['warnings'].append(f'Repo {github_repo_handle} should have a `CODEOWNERS` file')
-            else:
-                ret['accolades'].append(f'Repo {github_repo_handle} has a `CODEOWNERS` file')
-                matches = CODEOWNER_TEAM_RE.findall(codeowners.decode('utf-8'))
-                if matches is None:
-                    ret['warnings'].append(f'CODEOWNERS file does not seem to contain any team name')
-                else:
-                    if len(matches) == 1:
-                        owner_codeowners = matches[0]
-                    else:
-                        owner_codeowners = matches
-            
-            # Check more files
-            for path in ('README.md', 'LICENSE', 'SECURITY.md', 'DCO', 'CONTRIBUTING.md'):
-                content = get_github_repo_file(github_repo_handle, path)
-                if content is None:
-                    ret['warnings'].append(f'Repo {github_repo_handle} should have a `{path}` file')
-                else:
-                    ret['accolades'].append(f'Repo {github_repo_handle} has a `{path}` file')
-
-    # Owners
-    owner = set()
-    if owner_annotation is not None:
-        owner.add(owner_annotation)
-    if owner_codeowners is not None:
-        if type(owner_codeowners) == str:
-            owner.add(owner_codeowners)
-        elif type(owner_codeowners) == list:
-            for o in owner_codeowners:
-                owner.add(o)
-    
-    if len(owner) == 1:
-        ret['accolades'].append(f'App data exposes a single owner `{list(owner)[0]}`')
-        ret['owner'] = list(owner)[0]
-    elif len(owner) > 1:
-        ret['errors'].append(f'App data exposes various owners `{" ".join(list(owner))}`')
-    else:
-        ret['errors'].append(f'App does not have a visible owner')
-
-    return ret
-
-
-def check_condition(expression, results, error=None, warning=None, suggestion=None, accolade=None):
-    if expression == True:
-        if accolade is not None:
-            results['accolades'].append(accolade)
-    else:
-        if error is not None:
-            results['errors'].append(error)
-        elif warning is not None:
-            results['warnings'].append(warning)
-        elif suggestion is not None:
-            results['suggestions'].append(suggestion)
-
-    return results
-
-
-def latest_version(version_strings):
-    """
-    Returns the latest semver from a list of version strings
-    """
-    versions_tuples = [] # list of tuples (semver, string)
-
-    for vstring in version_strings:
-        is_valid = semver.VersionInfo.isvalid(vstring)
-        if not is_valid:
-            raise ValueError(f"Version string not semver conformant: '{vstring}'")
-        
-        semver_version = semver.VersionInfo.parse(vstring)
-        versions_tuples.append((semver_version, vstring))
-
-    versions_sorted = sorted(versions_tuples, key=cmp_to_key(semver_cmp))
-
-    return versions_sorted[-1][1]
-
-
-def semver_cmp(v1, v2):
-    return v1[0].compare(v2[0])
-
-
-def cmp_to_key(mycmp):
-    'Convert a cmp= function into a key= function'
-    class K(object):
-        def __init__(self, obj, *args):
-            self.obj = obj
-        def __lt__(self, other):
-            return mycmp(self.obj, other.obj) < 0
-        def __gt__(self, other):
-            return mycmp(self.obj, other.obj) > 0
-        def __eq__(self, other):
-            return mycmp(self.obj, other.obj) == 0
-        def __le__(self, other):
-            return mycmp(self.obj, other.obj) <= 0  
-        def __ge__(self, other):
-            return mycmp(self.obj, other.obj) >= 0
-        def __ne__(self, other):
-            return mycmp(self.obj, other.obj) != 0
-    return K
-
-
-def get_duplicates(thelist: list) -> list:
-    thelist = sorted(thelist)
-    items = set()
-    dupes = set()
-    for i in thelist:
-        if i in items:
-            dupes.add(i)
-        else:
-            items.add(i)
-    return list(dupes)
+    while pending:
+        yield pending.popleft().result()
 
 
-def load_catalog_index(url: str) -> dict:
-    r = requests.get(url)
-    data = yaml.load(r.text, Loader=yaml.Loader)
-    return data
+def completion_map(executor: Optional[ThreadPoolExecutor], fn: Callable,
+                   iterable: Iterable, window: int) -> Iterator:
+    """
+    Like ordered_map(), but yields each result as soon as it is
+    done, regardless of input order.
+    """
+    if executor is None:
+        yield from map(fn, iterable)
+        return
 
+    pending = set()
+    for item in iterable:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                yield f.result()
 
-def read_config(path: str) -> dict:
-    with open(path, "r") as input:
-        data = yaml.load(input, Loader=yaml.Loader)
-        return data
+    for f in as_completed(pending):
+        yield f.result()
 
 
-def check_url(url: str) -> Tuple[bool, int]:
+def start_app(catalog: str, app_name: str, releases: list, ctx: Context) -> AppCheck:
     """
-    Load URL and return tuple (valid, status_code)
+    Local stage of an app: find its latest release, reuse the stored
+    result of the release rules in incremental runs, and run the
+    local rules.
     """
+    ctx.app = f'{catalog}/{app_name}'
+    app = AppCheck(catalog, app_name, releases)
+
+    releases_dict = {}   # dict with version string as key
+    for release in releases:
+        releases_dict.setdefault(release.get('version'), release)
     try:
-        r = requests.head(url, timeout=10, headers={
-            'user-agent': CONF['user_agent'],
-        })
-        return str(r.status_code)[0] == '2', r.status_code
-    except Exception as e:
-        return False, 0
-
-
-def validate_readme(url: str) -> Tuple[list, list, list]:
-    """
-    Obtain and validate the README from the given URL
-    and return errors, warnings, accolades
-    """
-    errors = []
-    warnings = []
-    accolades = []
-
-    r = requests.get(url, timeout=10)
-    if r.status_code >= 400:
-        errors.append(f'Error fetching README URL {url}: status {r.status_code}')
-    else:
-        content = r.text
-
-        # length
-        if len(content) < 500:
-            errors.append(f'README content too short')
-        elif len(content) < 1000:
-            warnings.append(f'README content could be longer')
-        else:
-            accolades.append(f'README content appears reasonably long ({len(content)} chars)')
-        
-        # placeholder
-        if '{APP-NAME}' in content:
-            errors.append('README contains placeholder `{APP-NAME}`')
+        app.latest_release = latest_version(releases_dict.keys())
+        app.release = releases_dict[app.latest_release]
+    except ValueError as e:
+        app.latest_error = str(e)
 
-    return errors, warnings, accolades
+    if ctx.state is not None:
+        key = state_key(app, ctx)
+        if key is not None:
+            app.stored = ctx.state.lookup(catalog, app_name, key)
+        if app.stored is not None:
+            app.repo_url = app.stored['repo_url']
+            app.owner = app.stored['owner']
 
+    run_stage(app, ctx, ctx.rules.stage(LOCAL))
+    # only local rules look at all releases
+    app.releases = None
+    return app
 
-def github_repo_exists(repo_handle: str) -> bool:
-    global GITHUB_CLIENT
-    try:
-        _ = GITHUB_CLIENT.get_repo(repo_handle)
-        return True
-    except UnknownObjectException:
-        return False
 
+def finish_app(app: AppCheck, ctx: Context) -> dict:
+    """
+    HTTP and GitHub stages of an app, returning its result
+    """
+    ctx.app = f'{app.catalog}/{app.app_name}'
+    with ctx.metrics.phase('app', app=ctx.app):
+        run_stage(app, ctx, ctx.rules.stage(HTTP))
+        run_stage(app, ctx, ctx.rules.stage(GITHUB))
+
+    if ctx.state is not None and app.stored is None:
+        key = state_key(app, ctx)
+        if key is not None:
+            ctx.state.store(app.catalog, app.app_name, key, app_result(app, ctx.rules, scope=RELEASE))
 
-def get_github_repo_file(repo_handle: str, path: str) -> Optional[bytes]:
-    global GITHUB_CLIENT
-    try:
-        repo = GITHUB_CLIENT.get_repo(repo_handle)
-        file = repo.get_contents(path=path)
-        return file.decoded_content
-    except UnknownObjectException:
+    return app_result(app, ctx.rules)
+
+
+def state_key(app: AppCheck, ctx: Context) -> Optional[str]:
+    """
+    Key of an app's stored result in incremental runs: the digest of
+    its latest release, and the rule selection the result is for.
+    None if there is no latest release or it has no digest.
+    """
+    if app.release is None or app.release.get('digest') is None:
         return None
+    return f'{app.release["digest"]}/{ctx.rules.fingerprint()}'
+
+
+def load_catalog_index(url: str, ctx: Context,
+                       only: Optional[Set[str]] = None,
+                       catalog: Optional[str] = None,
+                       select: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[str, list]]:
+    """
+    Download the catalog index as a stream and yield
+    tuples (app name, releases) one app at a time.
+    If `only` is given, yield just these apps and stop
+    reading once all of them have been found. Apps for
+    which `select(app name)` is False are skipped.
+
+    Parse time only counts time spent in the parser, not in the
+    consumer. Unless the index is served from the cache, it includes
+    reading from the network, as the body is downloaded while it is
+    parsed. Stopping early skips the rest of the download.
+    """
+    with ctx.metrics.phase('index_download', catalog=catalog):
+        r = ctx.prober.get(url, stream=True)
+        r.raise_for_status()
+
+    parse_time = 0.0
+    with r.open() as stream:
+        entries = iter_catalog_entries(stream, only, select)
+        while True:
+            start = time.perf_counter()
+            try:
+                entry = next(entries)
+            except StopIteration:
+                break
+            finally:
+                parse_time += time.perf_counter() - start
+            yield entry
+
+    ctx.metrics.record_phase('index_parse', parse_time, catalog=catalog)
+
+
+def load_catalog_app_names(url: str, ctx: Context) -> List[str]:
+    """
+    Return the names of all apps in a catalog index.
+    With the HTTP cache, the index is only downloaded once
+    for this and load_catalog_index().
+    """
+    r = ctx.prober.get(url, stream=True)
+    r.raise_for_status()
+    with r.open() as stream:
+        return list(iter_catalog_app_names(stream))
+
 
+def read_config(path: str) -> dict:
+    with open(path, "r") as input:
+        data = load_yaml(input)
+        return data
+
+
+def check_url(url: str, ctx: Context) -> Tuple[bool, int]:
+    """
+    Load URL and return tuple (valid, status_code)
+    """
+    return ctx.prober.probe_all([url], referrer=ctx.app)[url]
 
-def get_aggregated_changelog_repos() -> list:
+
+def get_aggregated_changelog_repos(ctx: Context) -> list:
     """
     Return a list of github repositories configured for
     aggregated changelogs.
     """
-    global CONF
+    conf = ctx.conf
     conf_key = 'aggregated_changelogs_config_url'
     
-    if conf_key not in CONF:
+    if conf_key not in conf:
         return None
     
-    r = requests.get(CONF[conf_key])
-    r.raise_for_status()
-    data = yaml.load(r.text, Loader=yaml.Loader)
+    with ctx.metrics.phase('changelog_config'):
+        r = ctx.prober.get(conf[conf_key])
+        r.raise_for_status()
+        data = load_yaml(r.content)
 
     if 'repositories' not in data:
-        raise ValueError(f'Invalid YAML found in {CONF[conf_key]}, key "repositories" not found.')
+        raise ValueError(f'Invalid YAML found in {conf[conf_key]}, key "repositories" not found.')
     
-    return list(map(lambda x: f'https://github.com/{x}', data['repositories'].keys()))
+    return list(map(lambda x: f'{ctx.github_url}/{x}', data['repositories'].keys()))
 
 
 def read_token(path: str) -> str:
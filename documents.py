@@ -0,0 +1,200 @@
+"""
+Validation of the documents referenced in chart annotations:
+the app metadata file and the values schema.
+"""
+from concurrent.futures import Future
+import hashlib
+import json
+import threading
+from typing import Any, List
+
+import yaml
+
+from catalog import load_yaml
+from findings import Finding
+
+# Expected structure of the app metadata file (`main.yaml`)
+METADATA_SCHEMA = {
+    '$schema': 'http://json-schema.org/draft-07/schema#',
+    'type': 'object',
+    'required': ['chartFile', 'dateCreated', 'digest'],
+    'properties': {
+        'annotations': {
+            'type': 'object',
+            'additionalProperties': {'type': 'string'},
+        },
+        'chartApiVersion': {'enum': ['v1', 'v2']},
+        'chartFile': {'type': 'string', 'minLength': 1},
+        # unquoted timestamps are loaded as datetime, so no type here
+        'dateCreated': {},
+        'defaultNamespace': {'type': 'string'},
+        'digest': {'type': 'string', 'minLength': 1},
+        'home': {'type': 'string'},
+        'icon': {'type': 'string'},
+        'keywords': {'type': 'array', 'items': {'type': 'string'}},
+        'restrictions': {
+            'type': 'object',
+            'additionalProperties': False,
+            'properties': {
+                'clusterSingleton': {'type': 'boolean'},
+                'compatibleProviders': {'type': 'array', 'items': {'type': 'string'}},
+                'fixedNamespace': {'type': 'string'},
+                'gpuInstances': {'type': 'boolean'},
+                'namespaceSingleton': {'type': 'boolean'},
+            },
+        },
+        'upstreamChartURL': {'type': 'string'},
+        'upstreamChartVersion': {'type': 'string'},
+    },
+}
+
+# Schema errors listed per document at most, and their maximum length
+MAX_ERRORS_LISTED = 3
+MAX_ERROR_LENGTH = 200
+
+
+class SchemaError(ValueError):
+    """
+    A document isn't a valid JSON schema
+    """
+
+
+class ValidatorCache:
+    """
+    Compiled JSON schema validators, keyed by the SHA-256 of the
+    schema document. Apps sharing a schema, byte for byte, get the
+    validator compiled for the first one, or the same SchemaError.
+    A schema is compiled by its first caller, later callers wait for
+    it; schemas with different digests are compiled in parallel.
+    Validators for the meta-schemas of the drafts are created once
+    per draft.
+
+    jsonschema is imported on first use.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # content digest -> Future of the validator or SchemaError
+        self._validators = {}
+        # validator class -> validator for its meta-schema
+        self._meta_validators = {}
+
+    def get(self, content: bytes) -> Any:
+        """
+        Return a validator for the JSON schema in `content`.
+        Raises SchemaError if it isn't valid JSON or not a
+        valid schema for its draft.
+        """
+        key = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            future = self._validators.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._validators[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                future.set_result(self._compile(content))
+            except Exception as e:
+                # let a later caller try again
+                with self._lock:
+                    del self._validators[key]
+                future.set_exception(e)
+
+        validator = future.result()
+        if isinstance(validator, SchemaError):
+            raise validator
+        return validator
+
+    def _compile(self, content: bytes) -> Any:
+        from jsonschema.validators import validator_for
+
+        try:
+            schema = json.loads(content)
+        except ValueError as e:
+            return SchemaError(f'not valid JSON: {e}')
+        if not isinstance(schema, dict):
+            return SchemaError('not a JSON object')
+
+        cls = validator_for(schema)
+        meta_validator = self._meta_validators.get(cls)
+        if meta_validator is None:
+            meta_validator = self._meta_validators.setdefault(cls, cls(cls.META_SCHEMA))
+        errors = sorted(meta_validator.iter_errors(schema), key=lambda e: list(e.path))
+        if errors:
+            return SchemaError(format_errors(errors))
+        return cls(schema)
+
+
+_metadata_validator = None
+_metadata_validator_lock = threading.Lock()
+
+
+def metadata_validator() -> Any:
+    """
+    Validator for METADATA_SCHEMA, compiled once on first use
+    """
+    global _metadata_validator
+    with _metadata_validator_lock:
+        if _metadata_validator is None:
+            from jsonschema.validators import validator_for
+            _metadata_validator = validator_for(METADATA_SCHEMA)(METADATA_SCHEMA)
+    return _metadata_validator
+
+
+def validate_metadata(content: bytes, validators: ValidatorCache) -> List[Finding]:
+    """
+    Check that the metadata file is YAML with the expected structure.
+    The schema is fixed, so `validators` isn't used; it is taken for the
+    same signature as validate_values_schema().
+    """
+    try:
+        metadata = load_yaml(content)
+    except yaml.YAMLError as e:
+        problem = ' '.join(str(e).split())
+        return [Finding('metadata-valid', 'error', 'Metadata is not valid YAML: {}', problem)]
+
+    errors = list(metadata_validator().iter_errors(metadata))
+    if errors:
+        return [Finding('metadata-valid', 'error',
+                        'Metadata doesn\'t have the expected structure: {}', format_errors(errors))]
+    return [Finding('metadata-valid', 'accolade', 'Metadata has the expected structure')]
+
+
+def validate_values_schema(content: bytes, validators: ValidatorCache) -> List[Finding]:
+    """
+    Check that the values schema is a valid JSON schema
+    """
+    try:
+        validator = validators.get(content)
+    except SchemaError as e:
+        return [Finding('values-schema-valid', 'error', 'Values schema is invalid, {}', str(e))]
+
+    findings = [Finding('values-schema-valid', 'accolade', 'Values schema is a valid JSON schema')]
+    if '$schema' not in validator.schema:
+        findings.append(Finding('values-schema-draft', 'suggestion',
+                                'Values schema should declare its draft with `$schema`'))
+    return findings
+
+
+def format_errors(errors: list) -> str:
+    """
+    Describe jsonschema validation errors, like
+    `restrictions.gpuInstances`: 'yes' is not of type 'boolean'
+    """
+    described = []
+    for error in errors[:MAX_ERRORS_LISTED]:
+        path = '.'.join(str(p) for p in error.absolute_path)
+        message = error.message
+        if len(message) > MAX_ERROR_LENGTH:
+            message = message[:MAX_ERROR_LENGTH] + '...'
+        described.append(f'`{path}`: {message}' if path else message)
+    if len(errors) > MAX_ERRORS_LISTED:
+        described.append(f'{len(errors) - MAX_ERRORS_LISTED} more')
+    return '; '.join(described)
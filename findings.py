@@ -0,0 +1,156 @@
+"""
+Structured validation findings with stable rule IDs.
+"""
+import sys
+from typing import List
+
+# Severities in report order, with the result dict key holding them
+SEVERITIES = ('error', 'warning', 'suggestion', 'accolade')
+RESULT_KEYS = {
+    'error': 'errors',
+    'warning': 'warnings',
+    'suggestion': 'suggestions',
+    'accolade': 'accolades',
+}
+
+# Rule IDs and their short descriptions. IDs are part of the
+# machine-readable output and must not change.
+RULES = {
+    'duplicate-release': 'Each release version must appear only once in the index',
+    'latest-version': 'All release versions must be valid semver, so the latest release can be determined',
+    'aggregated-changelog': 'The app repository must be configured for aggregated changelogs',
+    'required-field': 'The chart must specify all required fields',
+    'chart-api-version': 'The chart apiVersion must be v1 or v2',
+    'chart-api-version-v2': 'The chart should use apiVersion v2',
+    'recommended-field': 'The chart should specify recommended fields',
+    'suggested-field': 'The chart may specify suggested fields',
+    'dependencies': 'The chart may specify its dependencies',
+    'name-app-suffix': 'The app name should not end with -app',
+    'description-meaningful': 'The description should be unique and meaningful',
+    'home-set': 'The home field must point to the app repository',
+    'home-github-org': 'The home URL should point to a repository of the GitHub organisation',
+    'home-url-valid': 'The home URL must be reachable',
+    'icon-host': 'The icon should be hosted on s.giantswarm.io',
+    'icon-url-valid': 'The icon URL must be reachable',
+    'icon-svg': 'The icon should use the SVG format',
+    'keywords-not-empty': 'The keywords list must not be empty',
+    'keyword-format': 'Keywords should match the expected format',
+    'chart-type': 'The chart type must be application',
+    'annotation-set': 'Metadata, README and values schema annotations should be set',
+    'annotation-url-valid': 'URLs in annotations must be reachable',
+    'readme-versioned': 'The README URL should point to a versioned README',
+    'readme-fetch': 'The README must be retrievable',
+    'readme-length': 'The README should have a reasonable length',
+    'readme-placeholder': 'The README must not contain template placeholders',
+    'readme-size': 'The README should not be larger than the size checked',
+    'readme-heading': 'The README should have a well-formed heading structure',
+    'readme-code-fence': 'Code blocks in the README should be closed',
+    'readme-image-alt': 'Images in the README should have an alternative text',
+    'readme-empty-link': 'Links in the README should have a text and a target',
+    'readme-link-reference': 'Reference-style links in the README should be defined',
+    'readme-link': 'Links in the README should be valid',
+    'readme-link-limit': 'All links in the README should be checked',
+    'metadata-valid': 'The app metadata file should have the expected structure',
+    'values-schema-valid': 'The values schema should be a valid JSON schema',
+    'values-schema-draft': 'The values schema should declare its JSON schema draft',
+    'team-annotation': 'Team ownership should be exposed via annotation',
+    'release-fresh': 'The latest release should not be older than 100 days',
+    'release-deprecated': 'The latest release should not be deprecated',
+    'field-url-valid': 'URLs in sources and urls must be reachable',
+    'maintainer-url-valid': 'Maintainer URLs must be reachable',
+    'duplicate-url': 'A URL should not be used in more than one field',
+    'github-repo-detected': 'The GitHub repository of the app must be detectable',
+    'codeowners-file': 'The app repository should have a CODEOWNERS file',
+    'codeowners-team': 'The CODEOWNERS file should name a team',
+    'repo-file': 'The app repository should have the expected files',
+    'app-owner': 'The app must expose a single owner',
+    'duplicate-app': 'An app should be published in one catalog only',
+    'similar-app-name': 'App names should be clearly distinguishable from other apps',
+    'too-many-releases': 'An app should not keep too many releases in the index',
+    'too-many-catalog-releases': 'A catalog index should not grow too large',
+    'latest-release-date': 'The newest release of a version line should have the highest version',
+    'kube-version-dropped': 'The latest release should keep specifying kubeVersion',
+    'kube-version-drift': 'Releases of one minor version line should have the same kubeVersion constraint',
+}
+
+
+class Finding:
+    """
+    One result of a check: the rule that produced it, its severity
+    and the human readable message.
+
+    With `params`, the message is a str.format() template, formatted
+    only when the message is needed. Templates, rule IDs and severities
+    are interned, so findings of the same kind share these strings
+    and hold just their parameters.
+    """
+    __slots__ = ('rule_id', 'severity', 'template', 'params')
+
+    def __init__(self, rule_id: str, severity: str, message: str, *params):
+        self.rule_id = sys.intern(rule_id)
+        self.severity = sys.intern(severity)
+        self.template = sys.intern(message) if params else message
+        self.params = params
+
+    @property
+    def message(self) -> str:
+        if not self.params:
+            return self.template
+        return self.template.format(*self.params)
+
+    def __str__(self) -> str:
+        return self.message
+
+    def __repr__(self) -> str:
+        return f'Finding({self.rule_id!r}, {self.severity!r}, {self.message!r})'
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Finding) and
+                (self.rule_id, self.severity, self.message) ==
+                (other.rule_id, other.severity, other.message))
+
+    def __hash__(self) -> int:
+        return hash((self.rule_id, self.severity, self.message))
+
+    def to_dict(self) -> dict:
+        return {'rule_id': self.rule_id, 'severity': self.severity, 'message': self.message}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Finding':
+        return cls(data['rule_id'], data['severity'], data['message'])
+
+
+def add_finding(findings: list, rule_id: str, severity: str, message: str, *params):
+    """
+    Append a finding to a rule's list of findings. `message` is a
+    template for `params`, see Finding.
+    """
+    findings.append(Finding(rule_id, severity, message, *params))
+
+
+def iter_findings(result: dict) -> List[Finding]:
+    """
+    All findings of a result dict, in severity order
+    """
+    return [f for severity in SEVERITIES for f in result[RESULT_KEYS[severity]]]
+
+
+def result_to_dict(result: dict) -> dict:
+    """
+    JSON serializable copy of a result dict
+    """
+    data = dict(result)
+    for key in RESULT_KEYS.values():
+        data[key] = [f.to_dict() for f in result[key]]
+    return data
+
+
+def result_from_dict(data: dict) -> dict:
+    """
+    Inverse of result_to_dict(). Raises TypeError or KeyError
+    for data that wasn't written by it.
+    """
+    result = dict(data)
+    for key in RESULT_KEYS.values():
+        result[key] = [Finding.from_dict(f) for f in data[key]]
+    return result
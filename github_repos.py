@@ -0,0 +1,338 @@
+"""
+Inspection of app repositories on GitHub with as few API calls as possible.
+"""
+from concurrent.futures import Future
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Set
+from urllib.parse import urlsplit
+
+from metrics import Metrics
+
+# Files we expect in the root of an app repository, besides CODEOWNERS
+REPO_FILES = ('README.md', 'LICENSE', 'SECURITY.md', 'DCO', 'CONTRIBUTING.md')
+
+
+class RepoInfo:
+    """
+    What we know about an app repository: whether it exists,
+    which files are in its root directory and the content
+    of the files we had to download. `teams` holds the team
+    names found in CODEOWNERS, if RepoCache parsed it.
+    """
+    def __init__(self, handle: str, exists: bool,
+                 files: Optional[Set[str]] = None,
+                 contents: Optional[Dict[str, bytes]] = None,
+                 teams: Optional[List[str]] = None):
+        self.handle = handle
+        self.exists = exists
+        self.files = files or set()
+        self.contents = contents or {}
+        self.teams = teams
+
+    def has_file(self, path: str) -> bool:
+        return path in self.files
+
+    def file_content(self, path: str) -> Optional[bytes]:
+        return self.contents.get(path)
+
+
+class TokenQuota:
+    """
+    Rate limit state and usage of one GitHub token, the `number`th
+    of the pool, counting from 1
+    """
+    def __init__(self, token: Optional[str], number: int = 1):
+        self.token = token
+        self.number = number
+        self.remaining = None
+        self.limit = None
+        self.reset = 0
+        self.calls = 0
+
+    @property
+    def label(self) -> str:
+        """
+        Name of the token in reports, by position in --token-path.
+        Nothing derived from the token itself, as reports get posted.
+        """
+        if self.token is None:
+            return 'unauthenticated'
+        return f'#{self.number}'
+
+
+class GithubPool:
+    """
+    Schedules GitHub API calls over one or more tokens.
+
+    Remaining quota and reset time of each token are taken from the
+    rate limit headers of every response. Work is handed to the token
+    with the most remaining calls. When a token gets down to `reserve`
+    remaining calls, callers wait for its reset instead of running
+    into the limit.
+
+    PyGithub clients must not be shared between threads, so each
+    thread gets its own client per token.
+
+    If `metrics` is given, every API call is recorded there.
+    """
+
+    def __init__(self, tokens: List[Optional[str]], reserve: int = 100,
+                 base_url: str = 'https://api.github.com',
+                 metrics: Optional[Metrics] = None):
+        if len(tokens) == 0:
+            tokens = [None]
+        self.quotas = [TokenQuota(token, i + 1) for i, token in enumerate(tokens)]
+        self.reserve = reserve
+        self.base_url = base_url
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def lease(self, app: Optional[str] = None) -> 'GithubLease':
+        """
+        Pick the token with the most remaining quota, waiting
+        for a reset if all tokens are down to the reserve.
+        `app` tags the lease's calls in the metrics.
+        """
+        while True:
+            with self._lock:
+                # unknown quota counts as full
+                index = max(range(len(self.quotas)),
+                            key=lambda i: float('inf') if self.quotas[i].remaining is None
+                            else self.quotas[i].remaining)
+                wait = self._wait_time(index)
+            if wait <= 0:
+                return GithubLease(self, index, self._client(index), app)
+            self._sleep(wait)
+
+    def usage(self) -> List[TokenQuota]:
+        return list(self.quotas)
+
+    def _wait_time(self, index: int) -> float:
+        quota = self.quotas[index]
+        if quota.remaining is None or quota.remaining > self.reserve:
+            return 0
+        return quota.reset - time.time() + 1
+
+    def _sleep(self, seconds: float):
+        print(f'GitHub rate limit reserve reached, waiting {int(seconds)} seconds for reset',
+              file=sys.stderr)
+        time.sleep(seconds)
+
+    def _throttle(self, index: int):
+        with self._lock:
+            wait = self._wait_time(index)
+        if wait > 0:
+            self._sleep(wait)
+
+    def _record(self, index: int, client: 'github.Github'):
+        remaining, limit = client.rate_limiting
+        with self._lock:
+            quota = self.quotas[index]
+            quota.calls += 1
+            quota.remaining = remaining
+            quota.limit = limit
+            quota.reset = client.rate_limiting_resettime
+
+    def _client(self, index: int) -> 'github.Github':
+        import github
+
+        if not hasattr(self._local, 'clients'):
+            self._local.clients = {}
+        if index not in self._local.clients:
+            token = self.quotas[index].token
+            self._local.clients[index] = github.Github(token, base_url=self.base_url)
+        return self._local.clients[index]
+
+
+class GithubLease:
+    """
+    A client bound to one token of the pool. API calls made
+    through call() are counted, update the token's quota and
+    wait for a reset when the token is down to the reserve.
+    """
+    def __init__(self, pool: GithubPool, index: int, client: 'github.Github',
+                 app: Optional[str] = None):
+        self.pool = pool
+        self.index = index
+        self.client = client
+        self.app = app
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        from github.GithubException import GithubException
+
+        self.pool._throttle(self.index)
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except GithubException as e:
+            # error responses carry rate limit headers too
+            self.pool._record(self.index, self.client)
+            self._record_call(e.status, start)
+            raise
+        except Exception as e:
+            self._record_call(type(e).__name__, start)
+            raise
+        self.pool._record(self.index, self.client)
+        self._record_call(200, start)
+        return result
+
+    def _record_call(self, status, start: float):
+        metrics = self.pool.metrics
+        if metrics is not None:
+            metrics.record_request(urlsplit(self.pool.base_url).netloc, 'GitHub API', status,
+                                   time.monotonic() - start, app=self.app)
+
+
+def inspect_github_repo(pool: GithubPool, repo_handle: str,
+                        fetch: Iterable[str] = ('CODEOWNERS',),
+                        app: Optional[str] = None) -> RepoInfo:
+    """
+    List the root directory of the repository in one request to learn
+    whether it exists and which files it has, and download only the
+    files in `fetch` that are present. Costs one API call plus one per
+    downloaded file.
+    """
+    from github.GithubException import UnknownObjectException
+
+    lease = pool.lease(app)
+
+    # lazy: the repository isn't requested, only its contents
+    repo = lease.client.get_repo(repo_handle, lazy=True)
+    try:
+        listing = lease.call(repo.get_contents, '')
+    except UnknownObjectException as e:
+        if not is_empty_repo_error(e):
+            return RepoInfo(repo_handle, False)
+        listing = []
+
+    files = set()
+    for item in listing:
+        if item.type in ('file', 'symlink'):
+            files.add(item.path)
+
+    contents = {}
+    for path in fetch:
+        if path in files:
+            try:
+                contents[path] = lease.call(repo.get_contents, path).decoded_content
+            except UnknownObjectException:
+                files.discard(path)
+
+    return RepoInfo(repo_handle, True, files, contents)
+
+
+def is_empty_repo_error(e: 'github.GithubException.UnknownObjectException') -> bool:
+    """
+    Whether a 404 on the root listing is for an existing, empty
+    repository rather than a missing one
+    """
+    data = e.data if isinstance(e.data, dict) else {}
+    return data.get('message') == 'This repository is empty.'
+
+
+class RepoCache:
+    """
+    Inspects each repository at most once per run, no matter how many
+    apps and catalogs refer to it. Callers asking for a repository
+    that is being inspected wait for that inspection.
+
+    CODEOWNERS is parsed with `team_re` once, and only the resulting
+    team names are kept. If `path` is given, results are also stored
+    in that file and reused by following runs for `ttl` seconds.
+    """
+
+    def __init__(self, pool: GithubPool, team_re: Pattern,
+                 path: Optional[str] = None, ttl: float = 24 * 60 * 60):
+        self.pool = pool
+        self.team_re = team_re
+        self.path = os.path.expanduser(path) if path is not None else None
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # handle -> Future of the one inspection for this handle
+        self._results = {}
+        self._stored = {}
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self._stored = json.load(f)
+            except ValueError:
+                self._stored = {}
+
+    def get(self, repo_handle: str, app: Optional[str] = None) -> RepoInfo:
+        with self._lock:
+            future = self._results.get(repo_handle)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._results[repo_handle] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                future.set_result(self._inspect(repo_handle, app))
+            except Exception as e:
+                # let a later caller try again
+                with self._lock:
+                    del self._results[repo_handle]
+                future.set_exception(e)
+
+        return future.result()
+
+    def reset(self):
+        """
+        Forget all inspections, including those loaded from `path`,
+        so that repositories are inspected again on their next use
+        """
+        with self._lock:
+            self._results = {}
+            self._stored = {}
+
+    def save(self):
+        """
+        Write the results of this run to the persisted layer
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            for handle, future in self._results.items():
+                if future.done() and future.exception() is None:
+                    info = future.result()
+                    self._stored.setdefault(handle, {
+                        'fetched_at': time.time(),
+                        'exists': info.exists,
+                        'files': sorted(info.files),
+                        'teams': info.teams,
+                    })
+            data = self._stored
+
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def _inspect(self, repo_handle: str, app: Optional[str]) -> RepoInfo:
+        stored = self._stored.get(repo_handle)
+        if stored is not None and time.time() - stored['fetched_at'] < self.ttl:
+            return RepoInfo(repo_handle, stored['exists'], set(stored['files']),
+                            teams=stored['teams'])
+
+        info = inspect_github_repo(self.pool, repo_handle, app=app)
+        codeowners = info.file_content('CODEOWNERS')
+        if codeowners is not None:
+            info.teams = self.team_re.findall(codeowners.decode('utf-8'))
+        # file contents are not needed after parsing
+        info.contents = {}
+
+        # replace an outdated stored entry when saving
+        with self._lock:
+            self._stored.pop(repo_handle, None)
+        return info
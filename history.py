@@ -0,0 +1,273 @@
+"""
+Version ordering and analysis of the release history of apps.
+"""
+from array import array
+import calendar
+import re
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from findings import Finding
+
+# Semantic version, as accepted by semver.VersionInfo.parse()
+SEMVER_RE = re.compile(r'''
+    ^
+    (?P<major>0|[1-9]\d*)
+    \.
+    (?P<minor>0|[1-9]\d*)
+    \.
+    (?P<patch>0|[1-9]\d*)
+    (?:-(?P<prerelease>
+        (?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)
+        (?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*
+    ))?
+    (?:\+(?P<build>
+        [0-9a-zA-Z-]+
+        (?:\.[0-9a-zA-Z-]+)*
+    ))?
+    $
+''', re.VERBOSE)
+
+# RFC 3339 timestamps as written by helm
+CREATED_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)[Tt ](\d\d):(\d\d):(\d\d)(?:\.\d+)?'
+                        r'(?:([Zz])|([+-])(\d\d):(\d\d))$')
+
+NAN = float('nan')
+DAY = 24 * 60 * 60
+
+
+def version_key(vstring: str) -> tuple:
+    """
+    Sort key of a semantic version string, ordering like
+    semver.VersionInfo.compare(): major, minor, patch, then
+    a release after all its pre-releases, pre-releases by their
+    dot-separated parts (numeric before alphanumeric, numbers by
+    value), build metadata ignored.
+
+    Raises ValueError for strings that aren't semantic versions.
+    """
+    m = SEMVER_RE.match(vstring) if isinstance(vstring, str) else None
+    if m is None:
+        raise ValueError(f"Version string not semver conformant: '{vstring}'")
+
+    prerelease = m.group('prerelease')
+    if prerelease is None:
+        pre_key = (1, ())
+    else:
+        pre_key = (0, tuple((0, int(p), '') if p.isdigit() else (1, 0, p)
+                            for p in prerelease.split('.')))
+    return int(m.group('major')), int(m.group('minor')), int(m.group('patch')), pre_key
+
+
+def latest_version(version_strings: Iterable[str]) -> str:
+    """
+    Returns the latest semver from a list of version strings
+    """
+    latest = None
+    latest_key = None
+    for vstring in version_strings:
+        key = version_key(vstring)
+        # the last of equal versions wins, like with a stable sort
+        if latest_key is None or key >= latest_key:
+            latest, latest_key = vstring, key
+    if latest is None:
+        raise ValueError('No versions given')
+    return latest
+
+
+def parse_created(value) -> float:
+    """
+    Unix timestamp of a release's `created` field, NaN if missing
+    or not parseable
+    """
+    if not isinstance(value, str):
+        return NAN
+    m = CREATED_RE.match(value)
+    if m is None:
+        return NAN
+    year, month, day, hour, minute, second = (int(x) for x in m.group(1, 2, 3, 4, 5, 6))
+    try:
+        ts = calendar.timegm((year, month, day, hour, minute, second))
+    except ValueError:
+        return NAN
+    if m.group(8) is not None:
+        offset = int(m.group(9)) * 3600 + int(m.group(10)) * 60
+        ts -= offset if m.group(8) == '+' else -offset
+    return float(ts)
+
+
+class AppHistory:
+    """
+    The releases of one app as columns: version strings, their sort
+    keys, creation timestamps and kubeVersion constraints. Releases
+    with an invalid version are left out.
+    """
+    __slots__ = ('versions', 'keys', 'created', 'kube_versions')
+
+    def __init__(self, releases: list):
+        self.versions = []
+        self.keys = []
+        self.created = array('d')
+        self.kube_versions = []
+        seen = set()
+        for release in releases:
+            version = release.get('version')
+            if version in seen:
+                continue
+            try:
+                key = version_key(version)
+            except ValueError:
+                continue
+            seen.add(version)
+            self.versions.append(version)
+            self.keys.append(key)
+            self.created.append(parse_created(release.get('created')))
+            self.kube_versions.append(release.get('kubeVersion'))
+
+    def __len__(self) -> int:
+        return len(self.versions)
+
+    def latest_by_version(self) -> Optional[int]:
+        if not self.keys:
+            return None
+        return max(range(len(self.keys)), key=self.keys.__getitem__)
+
+    def latest_by_date(self) -> Optional[int]:
+        dated = [i for i, ts in enumerate(self.created) if ts == ts]
+        if not dated:
+            return None
+        return max(dated, key=self.created.__getitem__)
+
+    def stats(self, now: Optional[float] = None) -> dict:
+        """
+        Release cadence: number of releases, median days
+        between releases, releases in the last 30 and 90
+        days and days since the newest release
+        """
+        now = time.time() if now is None else now
+        dates = sorted(ts for ts in self.created if ts == ts)
+        intervals = sorted(b - a for a, b in zip(dates, dates[1:]))
+
+        return {
+            'releases': len(self),
+            'median_days_between_releases': round(intervals[len(intervals) // 2] / DAY, 1) if intervals else None,
+            'releases_last_30_days': sum(1 for ts in dates if now - ts <= 30 * DAY),
+            'releases_last_90_days': sum(1 for ts in dates if now - ts <= 90 * DAY),
+            'days_since_last_release': round((now - dates[-1]) / DAY, 1) if dates else None,
+        }
+
+    def kube_version_drift(self) -> List[Tuple[str, List[str]]]:
+        """
+        Minor version lines (e. g. `1.4.x`) whose releases specify
+        different kubeVersion constraints, as tuples (line, constraints)
+        """
+        lines = {}
+        for key, kube_version in zip(self.keys, self.kube_versions):
+            if kube_version is not None:
+                lines.setdefault(key[:2], set()).add(str(kube_version))
+        return [(f'{major}.{minor}.x', sorted(constraints))
+                for (major, minor), constraints in sorted(lines.items())
+                if len(constraints) > 1]
+
+
+class CatalogHistory:
+    """
+    Compact index of all releases in a catalog, filled app by app:
+    one array entry per release for the app it belongs to, its
+    version numbers and creation time.
+    """
+
+    def __init__(self, max_releases_per_app: int = 100,
+                 max_releases: int = 10000):
+        self.max_releases_per_app = max_releases_per_app
+        self.max_releases = max_releases
+        self.apps = []
+        self.app_ids = array('L')
+        self.major = array('L')
+        self.minor = array('L')
+        self.patch = array('L')
+        self.prerelease = array('b')
+        self.created = array('d')
+        self._lock = threading.Lock()
+
+    def add(self, app_name: str, history: AppHistory) -> List[Finding]:
+        """
+        Add the releases of an app and return the findings about its history
+        """
+        with self._lock:
+            app_id = len(self.apps)
+            self.apps.append(app_name)
+            for key, ts in zip(history.keys, history.created):
+                self.app_ids.append(app_id)
+                self.major.append(key[0])
+                self.minor.append(key[1])
+                self.patch.append(key[2])
+                self.prerelease.append(1 - key[3][0])
+                self.created.append(ts)
+
+        return app_findings(history, self.max_releases_per_app)
+
+    def stats(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            counts = [0] * len(self.apps)
+            for app_id in self.app_ids:
+                counts[app_id] += 1
+            counts.sort()
+            return {
+                'apps': len(self.apps),
+                'releases': len(self.app_ids),
+                'prereleases': sum(self.prerelease),
+                'median_releases_per_app': counts[len(counts) // 2] if counts else 0,
+                'max_releases_per_app': counts[-1] if counts else 0,
+                'releases_last_30_days': sum(1 for ts in self.created if now - ts <= 30 * DAY),
+            }
+
+    def findings(self) -> List[Finding]:
+        """
+        Findings about the catalog as a whole
+        """
+        return catalog_findings(len(self.app_ids), self.max_releases)
+
+
+def catalog_findings(releases: int, max_releases: int) -> List[Finding]:
+    """
+    Findings about a catalog with `releases` releases in its index
+    """
+    findings = []
+    if releases > max_releases:
+        findings.append(Finding('too-many-catalog-releases', 'warning',
+                                'Catalog index has {} releases, more than {}. '
+                                'Consider removing old releases from the index', releases, max_releases))
+    return findings
+
+
+def app_findings(history: AppHistory, max_releases: int) -> List[Finding]:
+    findings = []
+
+    if len(history) > max_releases:
+        findings.append(Finding('too-many-releases', 'warning',
+                                'App has {} releases in the index, more than {}', len(history), max_releases))
+
+    latest = history.latest_by_version()
+    newest = history.latest_by_date()
+    if latest is not None and newest is not None and latest != newest:
+        # a newer patch of an older minor line is a backport, that's fine
+        if history.keys[newest][:2] == history.keys[latest][:2]:
+            findings.append(Finding('latest-release-date', 'warning',
+                                    'Newest release by date v{} is not the latest by version (v{})',
+                                    history.versions[newest], history.versions[latest]))
+
+    if latest is not None and history.kube_versions[latest] is None:
+        if any(k is not None for k in history.kube_versions):
+            findings.append(Finding('kube-version-dropped', 'warning',
+                                    'Latest release doesn\'t specify `kubeVersion`, earlier releases do'))
+
+    for line, constraints in history.kube_version_drift():
+        constraint_list = ', '.join(f'`{c}`' for c in constraints)
+        findings.append(Finding('kube-version-drift', 'warning',
+                                'Releases of {} specify different `kubeVersion` constraints: {}',
+                                line, constraint_list))
+
+    return findings
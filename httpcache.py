@@ -0,0 +1,278 @@
+"""
+Persistent on-disk cache for HTTP responses with conditional revalidation.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import BinaryIO, Optional
+
+import requests
+
+# Response headers we keep with a cache entry
+STORED_HEADERS = ('etag', 'last-modified', 'content-type')
+
+# Status codes worth retrying after a backoff, see UrlProber. Responses
+# with these are transient and never stored.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CachedResponse:
+    """
+    The parts of an HTTP response we need for validation,
+    either fresh from the network or read from the cache.
+    Streamed responses keep their body in a file or the
+    raw connection instead of `content`. `requested` is False
+    for responses served from the cache without any request.
+    """
+    def __init__(self, url: str, status_code: int, headers: dict,
+                 content: Optional[bytes] = None, from_cache: bool = False,
+                 body_path: Optional[str] = None, raw: Optional[BinaryIO] = None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+        self.requested = True
+        self.body_path = body_path
+        self.raw = raw
+
+    @property
+    def text(self) -> str:
+        if self.content is None:
+            return ''
+        encoding = requests.utils.get_encoding_from_headers(self.headers) or 'utf-8'
+        return self.content.decode(encoding, errors='replace')
+
+    def open(self) -> BinaryIO:
+        """
+        Return a binary file object to read the body from
+        """
+        if self.body_path is not None:
+            return open(self.body_path, 'rb')
+        if self.raw is not None:
+            return self.raw
+        return io.BytesIO(self.content or b'')
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.close()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error for url: {self.url}')
+
+
+class HttpCache:
+    """
+    Stores response status, validators and (for GET requests) bodies
+    in a directory, keyed by method and URL.
+
+    Entries younger than `ttl` seconds are served without any request.
+    Older entries are revalidated with If-None-Match/If-Modified-Since.
+    When the directory grows beyond `max_size` bytes, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, max_size: int = 256 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._size = sum(os.path.getsize(os.path.join(self.path, f))
+                         for f in os.listdir(self.path))
+
+    def request(self, session: requests.Session, method: str, url: str,
+                stream: bool = False, **kwargs) -> CachedResponse:
+        """
+        Perform a request through the cache using the given session.
+        GET bodies are written to the cache chunk by chunk, so with
+        `stream` the body is never held in memory as a whole. Streamed
+        bodies are written while the caller reads them (see
+        CacheFiller), so a caller stopping early doesn't download
+        the rest.
+        """
+        key = cache_key(method, url)
+        entry = self._load(key)
+
+        if entry is not None and time.time() - entry['stored_at'] < self.ttl:
+            response = self._response(key, entry, stream)
+            response.requested = False
+            return response
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if 'etag' in entry['headers']:
+                headers['If-None-Match'] = entry['headers']['etag']
+            if 'last-modified' in entry['headers']:
+                headers['If-Modified-Since'] = entry['headers']['last-modified']
+
+        # like requests.head(), HEAD requests don't follow redirects
+        kwargs.setdefault('allow_redirects', method != 'HEAD')
+        with contextlib.ExitStack() as stack:
+            r = stack.enter_context(session.request(method, url, headers=headers, stream=True, **kwargs))
+            if r.status_code == 304 and entry is not None:
+                entry['stored_at'] = time.time()
+                self._save(key, entry)
+                return self._response(key, entry, stream)
+
+            # Server errors and rate limits are transient, don't keep them
+            if r.status_code >= 500 or r.status_code in RETRY_STATUS_CODES:
+                return CachedResponse(url, r.status_code, r.headers,
+                                      r.content if method == 'GET' else None)
+
+            entry = {
+                'method': method,
+                'url': url,
+                'status_code': r.status_code,
+                'headers': {k: r.headers[k] for k in STORED_HEADERS if k in r.headers},
+                'stored_at': time.time(),
+            }
+
+            if method == 'GET' and stream:
+                # the filler closes the response
+                stack.pop_all()
+                r.raw.decode_content = True
+                return CachedResponse(url, r.status_code, r.headers,
+                                      raw=CacheFiller(self, key, entry, r))
+
+            body_tmp = None
+            if method == 'GET':
+                body_tmp = self._tmp_file(key, 'body')
+                with open(body_tmp, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
+
+        self._save(key, entry, body_tmp)
+        response = self._response(key, entry, stream)
+        response.from_cache = False
+        return response
+
+    def _tmp_file(self, key: str, kind: str) -> str:
+        return f'{self._file(key, kind)}.{threading.get_ident()}.tmp'
+
+    def _response(self, key: str, entry: dict, stream: bool) -> CachedResponse:
+        response = CachedResponse(entry['url'], entry['status_code'], entry['headers'],
+                                  from_cache=True)
+        if entry['method'] == 'GET':
+            if stream:
+                response.body_path = self._file(key, 'body')
+            else:
+                try:
+                    with open(self._file(key, 'body'), 'rb') as f:
+                        response.content = f.read()
+                except FileNotFoundError:
+                    response.content = b''
+        return response
+
+    def _file(self, key: str, kind: str) -> str:
+        return os.path.join(self.path, f'{key}.{kind}')
+
+    def _load(self, key: str) -> Optional[dict]:
+        path = self._file(key, 'json')
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            # mtime serves as last access time for LRU eviction
+            os.utime(path)
+            return entry
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, key: str, entry: dict, body_tmp: Optional[str] = None):
+        """
+        Write the entry metadata and move a downloaded body
+        file (if any) into place.
+        """
+        with self._lock:
+            meta_path = self._file(key, 'json')
+            meta_tmp = self._tmp_file(key, 'json')
+            with open(meta_tmp, 'w') as f:
+                json.dump(entry, f)
+
+            for tmp, path in ((body_tmp, self._file(key, 'body')), (meta_tmp, meta_path)):
+                if tmp is None:
+                    continue
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                self._size += os.path.getsize(tmp) - old_size
+                os.replace(tmp, path)
+
+            if self._size > self.max_size:
+                self._evict(keep=key)
+
+    def _evict(self, keep: str):
+        """
+        Remove least recently used entries, except `keep`,
+        until we are below 90% of the size limit.
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                path = os.path.join(self.path, name)
+                entries.append((os.path.getmtime(path), name[:-len('.json')]))
+        entries.sort()
+
+        for _, key in entries:
+            if self._size <= self.max_size * 0.9:
+                break
+            if key == keep:
+                continue
+            for kind in ('json', 'body'):
+                path = self._file(key, kind)
+                if os.path.exists(path):
+                    self._size -= os.path.getsize(path)
+                    os.remove(path)
+
+
+class CacheFiller(io.RawIOBase):
+    """
+    Body of a streamed response, written to the cache as the caller
+    reads it. The entry is stored once the body has been read to the
+    end. A body closed before that is dropped, and the rest of it is
+    never downloaded.
+    """
+
+    def __init__(self, cache: HttpCache, key: str, entry: dict, response: requests.Response):
+        super().__init__()
+        self.cache = cache
+        self.key = key
+        self.entry = entry
+        self.response = response
+        self.body_tmp = cache._tmp_file(key, 'body')
+        self.file = open(self.body_tmp, 'wb')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.response.raw.read(len(buffer))
+        if not data:
+            self._store()
+            return 0
+        self.file.write(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.file is not None:
+            # not read to the end
+            self.file.close()
+            self.file = None
+            os.remove(self.body_tmp)
+        self.response.close()
+        super().close()
+
+    def _store(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.cache._save(self.key, self.entry, self.body_tmp)
+
+
+def cache_key(method: str, url: str) -> str:
+    return hashlib.sha256(f'{method} {url}'.encode('utf-8')).hexdigest()
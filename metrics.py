@@ -0,0 +1,229 @@
+"""
+Timing and network instrumentation of a run.
+"""
+from contextlib import contextmanager
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, TextIO
+
+# Prefix of all Prometheus metric names
+PROMETHEUS_PREFIX = 'app_catalog_qa'
+
+
+class RequestRecord:
+    """
+    One outbound request
+    """
+    __slots__ = ('host', 'kind', 'app', 'status', 'duration', 'size')
+
+    def __init__(self, host: str, kind: str, app: Optional[str],
+                 status: str, duration: float, size: int):
+        self.host = host
+        self.kind = kind
+        self.app = app
+        self.status = status
+        self.duration = duration
+        self.size = size
+
+
+class Metrics:
+    """
+    Records the duration of run phases (index download and parse,
+    per-app validation, ...) and of every outbound request, tagged
+    by host, kind (HEAD, GET, GitHub API), app and status.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = []
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Start over, e. g. for the next poll in watch mode
+        """
+        with self._lock:
+            self.started = time.time()
+            self.phases = []
+            self.requests = []
+
+    @contextmanager
+    def phase(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - start, **labels)
+
+    def record_phase(self, name: str, duration: float, **labels):
+        with self._lock:
+            self.phases.append((name, labels, duration))
+
+    def record_request(self, host: str, kind: str, status, duration: float,
+                       size: int = 0, app: Optional[str] = None):
+        record = RequestRecord(host, kind, app, str(status), duration, size)
+        with self._lock:
+            self.requests.append(record)
+
+    def summary(self, slowest: int = 10) -> dict:
+        """
+        Aggregate the recorded data: phase totals, latency percentiles
+        per host, the slowest apps and bytes transferred.
+        """
+        with self._lock:
+            phases = list(self.phases)
+            requests = list(self.requests)
+
+        phase_totals = {}
+        app_durations = {}
+        for name, labels, duration in phases:
+            if 'app' in labels:
+                app_durations[labels['app']] = app_durations.get(labels['app'], 0) + duration
+                continue
+            key = (name, labels.get('catalog'))
+            phase_totals[key] = phase_totals.get(key, 0) + duration
+
+        hosts = {}
+        app_requests = {}
+        for r in requests:
+            host = hosts.setdefault(r.host, {'durations': [], 'bytes': 0, 'statuses': {}, 'kinds': {}})
+            host['durations'].append(r.duration)
+            host['bytes'] += r.size
+            host['statuses'][r.status] = host['statuses'].get(r.status, 0) + 1
+            host['kinds'][r.kind] = host['kinds'].get(r.kind, 0) + 1
+            if r.app is not None:
+                app_requests[r.app] = app_requests.get(r.app, 0) + 1
+
+        host_summary = {}
+        for name, host in hosts.items():
+            durations = sorted(host['durations'])
+            host_summary[name] = {
+                'requests': len(durations),
+                'p50': percentile(durations, 50),
+                'p90': percentile(durations, 90),
+                'p99': percentile(durations, 99),
+                'max': durations[-1],
+                'sum': sum(durations),
+                'bytes': host['bytes'],
+                'statuses': host['statuses'],
+                'kinds': host['kinds'],
+            }
+
+        slowest_apps = sorted(app_durations.items(), key=lambda x: x[1], reverse=True)[:slowest]
+
+        return {
+            'started': self.started,
+            'duration': time.time() - self.started,
+            'phases': [{'phase': name, 'catalog': catalog, 'duration': duration}
+                       for (name, catalog), duration in phase_totals.items()],
+            'hosts': host_summary,
+            'slowest_apps': [{'app': app, 'duration': duration, 'requests': app_requests.get(app, 0)}
+                             for app, duration in slowest_apps],
+            'requests_total': len(requests),
+            'bytes_total': sum(r.size for r in requests),
+        }
+
+    def print_summary(self, out: TextIO):
+        s = self.summary()
+
+        print(f'\nRun took {s["duration"]:.1f}s, {s["requests_total"]} requests, '
+              f'{s["bytes_total"] / 1024 / 1024:.1f} MB transferred', file=out)
+
+        for phase in s['phases']:
+            catalog = f' ({phase["catalog"]})' if phase['catalog'] is not None else ''
+            print(f'  {phase["phase"]}{catalog}: {phase["duration"]:.2f}s', file=out)
+
+        print('\nLatency per host (p50 / p90 / p99 / max, seconds):', file=out)
+        for name, host in sorted(s['hosts'].items(), key=lambda x: x[1]['sum'], reverse=True):
+            print(f'  {name}: {host["requests"]} requests, {host["p50"]:.3f} / {host["p90"]:.3f} / '
+                  f'{host["p99"]:.3f} / {host["max"]:.3f}', file=out)
+
+        if s['slowest_apps']:
+            print('\nSlowest apps:', file=out)
+            for app in s['slowest_apps']:
+                print(f'  {app["app"]}: {app["duration"]:.2f}s, {app["requests"]} requests', file=out)
+
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path: str):
+        """
+        Write the summary in the Prometheus text format,
+        for the node exporter's textfile collector.
+        """
+        s = self.summary()
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f'# HELP {p}_run_duration_seconds Duration of the last QA run.',
+            f'# TYPE {p}_run_duration_seconds gauge',
+            f'{p}_run_duration_seconds {s["duration"]}',
+            f'# HELP {p}_run_timestamp_seconds Start time of the last QA run.',
+            f'# TYPE {p}_run_timestamp_seconds gauge',
+            f'{p}_run_timestamp_seconds {s["started"]}',
+            f'# HELP {p}_phase_duration_seconds Duration of run phases.',
+            f'# TYPE {p}_phase_duration_seconds gauge',
+        ]
+        for phase in s['phases']:
+            labels = {'phase': phase['phase']}
+            if phase['catalog'] is not None:
+                labels['catalog'] = phase['catalog']
+            lines.append(f'{p}_phase_duration_seconds{format_labels(labels)} {phase["duration"]}')
+
+        lines += [
+            f'# HELP {p}_request_duration_seconds Latency of outbound requests per host.',
+            f'# TYPE {p}_request_duration_seconds summary',
+        ]
+        for name, host in s['hosts'].items():
+            for q, quantile in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99')):
+                labels = format_labels({'host': name, 'quantile': quantile})
+                lines.append(f'{p}_request_duration_seconds{labels} {host[q]}')
+            lines.append(f'{p}_request_duration_seconds_sum{format_labels({"host": name})} {host["sum"]}')
+            lines.append(f'{p}_request_duration_seconds_count{format_labels({"host": name})} {host["requests"]}')
+
+        lines += [
+            f'# HELP {p}_requests Outbound requests per host, kind and status.',
+            f'# TYPE {p}_requests gauge',
+        ]
+        counts = {}
+        with self._lock:
+            for r in self.requests:
+                key = (r.host, r.kind, r.status)
+                counts[key] = counts.get(key, 0) + 1
+        for (host, kind, status), n in sorted(counts.items()):
+            lines.append(f'{p}_requests{format_labels({"host": host, "kind": kind, "status": status})} {n}')
+
+        lines += [
+            f'# HELP {p}_transferred_bytes Bytes received per host.',
+            f'# TYPE {p}_transferred_bytes gauge',
+        ]
+        for name, host in s['hosts'].items():
+            lines.append(f'{p}_transferred_bytes{format_labels({"host": name})} {host["bytes"]}')
+
+        # write and rename, so the collector never reads a partial file
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    escaped = []
+    for k, v in labels.items():
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{k}="{v}"')
+    return '{' + ','.join(escaped) + '}'
@@ -0,0 +1,193 @@
+"""
+Cross-catalog analysis of app names: exact duplicates and
+names too similar to each other.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from findings import Finding
+
+# Name parts that don't make a name distinct
+NAME_SUFFIXES = ('app', 'chart', 'helm')
+
+SEPARATORS_RE = re.compile(r'[-_.\s]+')
+
+
+class NameAnalysis:
+    """
+    Indexes the app names of all catalogs once, then answers per
+    app which other catalogs publish the same name and which names
+    are near-duplicates.
+
+    Names are near-duplicates if their normalised forms (see
+    normalise_name) are equal or within a small edit distance.
+    Equal normalised forms are found by hashing, small edit
+    distances with a bigram index (see similar_keys).
+    """
+
+    def __init__(self, catalogs: Dict[str, Iterable[str]]):
+        # app name -> catalogs publishing it, in config order
+        self.catalogs_by_name = {}
+        # normalised name -> app names
+        self.names_by_key = {}
+        for catalog, names in catalogs.items():
+            for name in names:
+                self.catalogs_by_name.setdefault(name, []).append(catalog)
+                self.names_by_key.setdefault(normalise_name(name), set()).add(name)
+
+        # normalised name -> other normalised names close to it
+        self.similar_keys = similar_keys(self.names_by_key.keys())
+
+    def findings(self, catalog: str, app_name: str) -> List[Finding]:
+        findings = []
+
+        others = [c for c in self.catalogs_by_name.get(app_name, []) if c != catalog]
+        if others:
+            catalog_list = ', '.join(f'`{c}`' for c in others)
+            findings.append(Finding('duplicate-app', 'warning',
+                                    'App is also published in catalog {}', catalog_list))
+
+        for name in self.similar_names(app_name):
+            catalog_list = ', '.join(f'`{c}`' for c in self.catalogs_by_name[name])
+            findings.append(Finding('similar-app-name', 'warning',
+                                    'App name is very similar to `{}` (in catalog {})', name, catalog_list))
+
+        return findings
+
+    def similar_names(self, app_name: str) -> List[str]:
+        """
+        Other app names considered near-duplicates of `app_name`
+        """
+        key = normalise_name(app_name)
+        names = set(self.names_by_key.get(key, ()))
+        for k in self.similar_keys.get(key, ()):
+            names.update(self.names_by_key[k])
+        names.discard(app_name)
+        return sorted(names)
+
+
+def similar_keys(keys: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Find all pairs of keys within max_edit_distance() of each other,
+    without comparing every key with every other.
+
+    If two strings are within edit distance k, and one of them is cut
+    into k + 2 segments, at least two segments appear unchanged in the
+    other, shifted by at most k characters, as each edit touches at most
+    one segment. So the segments of all keys are indexed by (key length,
+    segment number, segment), and a key is only compared with keys that
+    have two of their segments at a matching position in it.
+    """
+    keys = [key for key in keys if max_edit_distance(len(key)) > 0]
+
+    index = {}
+    for key in keys:
+        for i, (start, size) in enumerate(segments(len(key))):
+            index.setdefault((len(key), i, key[start:start + size]), []).append(key)
+
+    similar = {}
+    for key in keys:
+        max_distance = max_edit_distance(len(key))
+        # candidate -> bit mask of its segments found in key
+        hits = {}
+        for length in range(len(key) - max_distance, len(key) + max_distance + 1):
+            # the shorter name's limit applies to a pair
+            limit = min(max_distance, max_edit_distance(length))
+            if limit == 0:
+                continue
+            for i, (start, size) in enumerate(segments(length)):
+                first = max(0, start - limit)
+                last = min(len(key) - size, start + limit)
+                for pos in range(first, last + 1):
+                    for other in index.get((length, i, key[pos:pos + size]), ()):
+                        hits[other] = hits.get(other, 0) | 1 << i
+        hits.pop(key, None)
+
+        for other, mask in hits.items():
+            if mask & (mask - 1) == 0:
+                # less than two segments found
+                continue
+            limit = min(max_distance, max_edit_distance(len(other)))
+            if levenshtein(key, other, limit) <= limit:
+                similar.setdefault(key, []).append(other)
+    return similar
+
+
+def segments(length: int) -> List[Tuple[int, int]]:
+    """
+    Cut a string of the given length into max_edit_distance() + 2
+    segments of (almost) equal size, as tuples (start, size)
+    """
+    count = max_edit_distance(length) + 2
+    size, extra = divmod(length, count)
+    result = []
+    start = 0
+    for i in range(count):
+        # the last segments take the remainder
+        n = size + (1 if i >= count - extra else 0)
+        result.append((start, n))
+        start += n
+    return result
+
+
+def normalise_name(name: str) -> str:
+    """
+    Lower-case the name, drop generic suffixes like `-app`
+    and remove separators: `Grafana-App` becomes `grafana`.
+    """
+    parts = [p for p in SEPARATORS_RE.split(name.lower()) if p]
+    while len(parts) > 1 and parts[-1] in NAME_SUFFIXES:
+        parts.pop()
+    return ''.join(parts)
+
+
+def max_edit_distance(length: int) -> int:
+    """
+    Edit distance up to which normalised names of the given length
+    count as similar. Short names differ in few characters without
+    being similar (`loki`, `kiam`), so they only match exactly.
+    """
+    if length < 6:
+        return 0
+    if length < 12:
+        return 1
+    return 2
+
+
+def levenshtein(a: str, b: str, limit: Optional[int] = None) -> int:
+    """
+    Edit distance between two strings. With `limit`, only cells within
+    `limit` of the diagonal are computed, and limit + 1 is returned as
+    soon as the distance is known to exceed it.
+    """
+    # a common prefix or suffix doesn't change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    while a and b and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is None:
+        limit = len(a)
+    if len(a) - len(b) > limit:
+        return limit + 1
+
+    over = limit + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        ca = a[i - 1]
+        first = max(1, i - limit)
+        last = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        for j in range(first, last + 1):
+            current[j] = min(previous[j] + 1,
+                             current[j - 1] + 1,
+                             previous[j - 1] + (ca != b[j - 1]))
+        if min(current[first - 1:last + 1]) > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
@@ -0,0 +1,322 @@
+"""
+Report writers for the supported output formats.
+"""
+import io
+import json
+import sys
+from typing import List, Optional, TextIO
+
+from findings import RESULT_KEYS, RULES, Finding, iter_findings
+
+OUTPUT_FORMATS = ('markdown', 'jsonl', 'sarif')
+
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+SARIF_LEVELS = {'error': 'error', 'warning': 'warning', 'suggestion': 'note'}
+TOOL_NAME = 'app-catalog-qa'
+TOOL_URI = 'https://github.com/giantswarm/app-catalog-qa'
+
+
+class ReportWriter:
+    """
+    Receives the results of a run as they come in.
+
+    `ordered` tells whether the writer needs app results in
+    catalog index order, or takes them as soon as they are done.
+    """
+    ordered = True
+
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+
+    def start_catalog(self, catalog: dict):
+        pass
+
+    def app(self, catalog: dict, app_name: str, result: dict, position: Optional[int] = None):
+        """
+        Called for each app. `position` is the app's position in the
+        catalog index.
+        """
+        pass
+
+    def end_catalog(self, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding] = (), stats: Optional[dict] = None):
+        """
+        Called after the last app of a catalog. `findings` are about
+        the catalog as a whole, `stats` are release history statistics.
+        """
+        pass
+
+    def finish(self, summary: dict):
+        pass
+
+
+class MarkdownWriter(ReportWriter):
+    """
+    The Markdown report, suited for GitHub issues
+    """
+
+    def start_catalog(self, catalog: dict):
+        # The catalog header needs the number of apps, which we only
+        # know after streaming through the index, so the app sections
+        # are collected first.
+        self._report = io.StringIO()
+
+    def app(self, catalog: dict, app_name: str, result: dict, position: Optional[int] = None):
+        print_app_result(app_name, result, self._report)
+
+    def end_catalog(self, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding] = (), stats: Optional[dict] = None):
+        if header:
+            print(f'\n## Catalog `{catalog["name"]}` - {app_count} apps', file=self.out)
+        if stats is not None:
+            print(f'\nRelease history: {stats["releases"]} releases ({stats["prereleases"]} pre-releases), '
+                  f'{stats["median_releases_per_app"]} per app in the median, at most {stats["max_releases_per_app"]}, '
+                  f'{stats["releases_last_30_days"]} in the last 30 days', file=self.out)
+        for finding in findings:
+            print(f'\n- [ ] {finding.message}', file=self.out)
+        self.out.write(self._report.getvalue())
+
+        print(f'\n{counts["errors"]} errors, {counts["warnings"]} warnings, '
+              f'{counts["suggestions"]} suggestions, {counts["accolades"]} accolades in total',
+              file=self.out)
+
+    def finish(self, summary: dict):
+        urls = summary['urls']
+        if urls['distinct'] > 0:
+            print(f'\n{urls["distinct"]} distinct URLs checked, {urls["shared"]} of them shared by more than one app '
+                  f'({urls["duplicate_checks_avoided"]} duplicate checks avoided)', file=self.out)
+
+        repos = summary['github_repos']
+        if repos['reused'] > 0:
+            print(f'\n{repos["inspected"]} distinct GitHub repos checked, '
+                  f'{repos["reused"]} checks reused for apps sharing a repo', file=self.out)
+
+        schemas = summary['schemas']
+        if schemas['reused'] > 0:
+            print(f'\n{schemas["compiled"]} distinct JSON schemas compiled, '
+                  f'{schemas["reused"]} validations reused a compiled schema', file=self.out)
+
+        for token in summary['github_tokens']:
+            print(f'\nGitHub token {token["token"]}: {token["calls"]} API calls, '
+                  f'{token["remaining"]}/{token["limit"]} remaining', file=self.out)
+
+
+class JsonlWriter(ReportWriter):
+    """
+    One JSON record per line, written and flushed as soon as an app
+    is done. Records have a `type`: `app` for each app, `catalog`
+    with the totals of a catalog and `summary` at the end of the run.
+    The output of sharded runs is merged from these records, see
+    shards.merge_partials().
+    """
+    ordered = False
+
+    def app(self, catalog: dict, app_name: str, result: dict, position: Optional[int] = None):
+        self._write(app_record(catalog['name'], app_name, result, position))
+
+    def end_catalog(self, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding] = (), stats: Optional[dict] = None):
+        self._write(dict(type='catalog', catalog=catalog['name'], url=catalog['url'], apps=app_count, **counts,
+                         findings=[f.to_dict() for f in findings], release_stats=stats))
+
+    def finish(self, summary: dict):
+        self._write(dict(type='summary', **summary))
+
+    def _write(self, record: dict):
+        self.out.write(json.dumps(record) + '\n')
+        self.out.flush()
+
+
+class SarifWriter(ReportWriter):
+    """
+    A SARIF 2.1.0 log, written at the end of the run. Accolades
+    are left out, suggestions are reported as notes.
+    """
+    ordered = False
+
+    def __init__(self, out: TextIO = sys.stdout):
+        super().__init__(out)
+        self._results = []
+        self._artifacts = []
+
+    def start_catalog(self, catalog: dict):
+        self._artifacts.append({'location': {'uri': catalog['url']}})
+
+    def app(self, catalog: dict, app_name: str, result: dict, position: Optional[int] = None):
+        for finding in iter_findings(result):
+            self._add(finding, catalog, {
+                'name': app_name,
+                'fullyQualifiedName': f'{catalog["name"]}/{app_name}',
+                'kind': 'module',
+            }, {
+                'catalog': catalog['name'],
+                'app': app_name,
+                'latestRelease': result['latest_release'],
+            })
+
+    def end_catalog(self, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding] = (), stats: Optional[dict] = None):
+        for finding in findings:
+            self._add(finding, catalog, {
+                'name': catalog['name'],
+                'kind': 'package',
+            }, {
+                'catalog': catalog['name'],
+            })
+
+    def _add(self, finding: Finding, catalog: dict, logical_location: dict, properties: dict):
+        if finding.severity not in SARIF_LEVELS:
+            return
+        self._results.append({
+            'ruleId': finding.rule_id,
+            'level': SARIF_LEVELS[finding.severity],
+            'message': {'text': finding.message},
+            'locations': [{
+                'physicalLocation': {
+                    'artifactLocation': {
+                        'uri': catalog['url'],
+                        'index': len(self._artifacts) - 1,
+                    },
+                },
+                'logicalLocations': [logical_location],
+            }],
+            'properties': properties,
+        })
+
+    def finish(self, summary: dict):
+        log = {
+            '$schema': SARIF_SCHEMA,
+            'version': '2.1.0',
+            'runs': [{
+                'tool': {
+                    'driver': {
+                        'name': TOOL_NAME,
+                        'informationUri': TOOL_URI,
+                        'rules': [{'id': rule_id, 'shortDescription': {'text': text}}
+                                  for rule_id, text in RULES.items()],
+                    },
+                },
+                'artifacts': self._artifacts,
+                'results': self._results,
+                'properties': summary,
+            }],
+        }
+        json.dump(log, self.out, indent=2)
+        self.out.write('\n')
+
+
+class TeeWriter(ReportWriter):
+    """
+    Passes the results on to several writers. Ordered if
+    any of them is.
+    """
+
+    def __init__(self, writers: List[ReportWriter]):
+        super().__init__(None)
+        self.writers = writers
+        self.ordered = any(w.ordered for w in writers)
+
+    def start_catalog(self, catalog: dict):
+        for w in self.writers:
+            w.start_catalog(catalog)
+
+    def app(self, catalog: dict, app_name: str, result: dict, position: Optional[int] = None):
+        for w in self.writers:
+            w.app(catalog, app_name, result, position=position)
+
+    def end_catalog(self, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding] = (), stats: Optional[dict] = None):
+        for w in self.writers:
+            w.end_catalog(catalog, app_count, counts, header, findings=findings, stats=stats)
+
+    def finish(self, summary: dict):
+        for w in self.writers:
+            w.finish(summary)
+
+
+def create_writer(output_format: str, out: TextIO = sys.stdout) -> ReportWriter:
+    writers = {
+        'markdown': MarkdownWriter,
+        'jsonl': JsonlWriter,
+        'sarif': SarifWriter,
+    }
+    return writers[output_format](out)
+
+
+def app_record(catalog: str, app_name: str, result: dict, position: Optional[int] = None) -> dict:
+    """
+    JSON record of an app's result, as written by JsonlWriter
+    """
+    return {
+        'type': 'app',
+        'catalog': catalog,
+        'app': app_name,
+        'position': position,
+        'latest_release': result['latest_release'],
+        'digest': result.get('digest'),
+        'repo_url': result['repo_url'],
+        'owner': result['owner'],
+        'findings': [f.to_dict() for f in iter_findings(result)],
+        'release_stats': result.get('release_stats'),
+    }
+
+
+def count_findings(result: dict) -> dict:
+    return {key: len(result[key]) for key in RESULT_KEYS.values()}
+
+
+def print_app_result(app_name: str, result: dict, out: TextIO = sys.stdout):
+    """
+    Print the Markdown report section for one app
+    """
+    from colored import fg, attr
+
+    if len(result['errors']) + len(result['warnings']) > 0:
+        errinfo = ''
+        if len(result['errors']) > 0:
+            errinfo += f"{len(result['errors'])} errors and "
+        errinfo += f"{len(result['warnings'])} warnings"
+
+        app_label = f'`{app_name}`'
+        if result['repo_url'] is not None:
+            app_label = f"[{app_name}]({result['repo_url']})"
+
+        app_owner = '_no owner_'
+        if result['owner'] is not None:
+            app_owner = result['owner']
+
+        print(f'\n### {app_label} ({app_owner}) -- {errinfo}', file=out)
+
+    print('\n<details>', file=out)
+
+    print(f'\nInformation based on release v{result["latest_release"]}', file=out)
+
+    stats = result.get('release_stats')
+    if stats is not None and stats['releases'] > 0:
+        cadence = ''
+        if stats['median_days_between_releases'] is not None:
+            cadence = f', median {stats["median_days_between_releases"]} days apart'
+        print(f'\nRelease history: {stats["releases"]} releases{cadence}, '
+              f'{stats["releases_last_90_days"]} in the last 90 days', file=out)
+
+    if len(result['errors']):
+        print(f"\n#### {attr('bold')}{fg('red')}Errors{attr('reset')}\n", file=out)
+        for error in result['errors']:
+            print(f"- [ ] {fg('red')}{error.message}{attr('reset')}", file=out)
+
+    if len(result['warnings']):
+        print(f"\n#### {attr('bold')}{fg('yellow')}Warnings{attr('reset')}\n", file=out)
+        for warning in result['warnings']:
+            print(f"- [ ] {fg('yellow')}{warning.message}{attr('reset')}", file=out)
+
+    if len(result['suggestions']):
+        print(f"\n#### {attr('bold')}{fg('yellow')}Suggestions{attr('reset')}\n", file=out)
+        for item in result['suggestions']:
+            print(f"- [ ] {item.message}", file=out)
+
+    # if len(result['accolades']):
+    #     print(f"\n#### {attr('bold')}{fg('yellow')}Looking good{attr('reset')}\n", file=out)
+    #     for item in result['accolades']:
+    #         print(f"- {fg('green')}{item.message}{attr('reset')}", file=out)
+
+    print('\n</details>', file=out)
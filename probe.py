@@ -0,0 +1,410 @@
+"""
+Concurrent URL probing with per-host connection pooling.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from httpcache import RETRY_STATUS_CODES, CachedResponse, HttpCache
+from metrics import Metrics
+
+# Status code reported for URLs on a host whose circuit breaker is open
+STATUS_CIRCUIT_OPEN = -1
+
+# Status codes of servers that don't support HEAD requests
+HEAD_NOT_SUPPORTED_STATUS_CODES = (405, 501)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised instead of sending a request to a host
+    that failed too often in a row.
+    """
+
+
+class HostHealth:
+    """
+    Tracks latency and failures of one host.
+
+    The timeout adapts to the host's observed latency (a multiple of
+    its moving average, between `min_timeout` and `max_timeout`). After
+    `threshold` consecutive connection failures or timeouts the circuit
+    opens and requests fail fast for `cooldown` seconds. After that,
+    the circuit is half-open: a single request is let through as a
+    trial, while the others keep failing fast. Its success closes the
+    circuit, its failure opens it for another `cooldown`.
+    """
+
+    def __init__(self, min_timeout: float, max_timeout: float,
+                 threshold: int, cooldown: float):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.latency = None
+        self.failures = 0
+        self.open_until = 0.0
+        # whether the trial request of the half-open circuit is in flight
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            if self.trial or time.monotonic() < self.open_until:
+                return False
+            self.trial = True
+            return True
+
+    def timeout(self) -> float:
+        with self._lock:
+            if self.latency is None:
+                return self.max_timeout
+            return min(self.max_timeout, max(self.min_timeout, self.latency * 5))
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.failures = 0
+            self.trial = False
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + self.cooldown
+
+    def end_trial(self):
+        """
+        A request ended in a way that says nothing about the host,
+        like an invalid URL or a response from the cache. If it was
+        the trial, the next request is the trial.
+        """
+        with self._lock:
+            self.trial = False
+
+
+class UrlProber:
+    """
+    Probes URLs with HEAD requests on a thread pool.
+
+    At most `max_workers` probes are in flight overall and at most
+    `max_per_host` against a single host. Each host gets its own
+    requests session, so keep-alive connections are reused between
+    probes of the same host. If a cache is given, all requests
+    go through it.
+
+    Results are kept for the lifetime of the prober, so each distinct
+    URL is probed at most once. Callers asking for a URL whose probe
+    is in flight wait for that probe instead of starting another.
+
+    The health of each host is tracked (see HostHealth), and requests
+    answered with a transient error are retried up to `retries` times
+    with jittered exponential backoff.
+
+    If `metrics` is given, every request sent is recorded there,
+    tagged with the app it was made for.
+    """
+
+    def __init__(self, user_agent: str, timeout: float = 10,
+                 max_workers: int = 32, max_per_host: int = 4,
+                 cache: Optional[HttpCache] = None,
+                 min_timeout: float = 2, retries: int = 2,
+                 circuit_threshold: int = 3, circuit_cooldown: float = 60,
+                 metrics: Optional[Metrics] = None):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_per_host = max_per_host
+        self.cache = cache
+        self.retries = retries
+        self.circuit_threshold = circuit_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='probe')
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._host_slots = {}
+        self._host_health = {}
+        # URL -> Future of the one probe for this URL
+        self._results = {}
+        # URL -> Future of the one fetch for this URL
+        self._fetches = {}
+        # URL -> set of referrers (e. g. apps) that asked for it
+        self._referrers = {}
+
+    def probe(self, url: str, app: Optional[str] = None) -> Tuple[bool, int]:
+        """
+        Send a HEAD request to the URL and return tuple (valid, status_code).
+        Falls back to GET for servers that reject HEAD requests.
+        status_code is 0 if the request failed and STATUS_CIRCUIT_OPEN
+        if it wasn't sent because the host is considered down.
+        """
+        try:
+            r = self.request('HEAD', url, app=app)
+            if r.status_code in HEAD_NOT_SUPPORTED_STATUS_CODES:
+                r = self.request('GET', url, stream=True, app=app)
+                r.close()
+            return str(r.status_code)[0] == '2', r.status_code
+        except CircuitOpenError as e:
+            return False, STATUS_CIRCUIT_OPEN
+        except Exception as e:
+            return False, 0
+
+    def fetch(self, url: str, handler: Callable[[bytes], Any],
+              app: Optional[str] = None) -> Tuple[bool, int, Any]:
+        """
+        Send a GET request to the URL and return tuple (valid,
+        status_code, handled), where `handled` is what `handler`
+        returns for the body of a valid response, None otherwise.
+        Only the handler's result is kept, not the body.
+        """
+        try:
+            r = self.request('GET', url, app=app)
+        except CircuitOpenError as e:
+            return False, STATUS_CIRCUIT_OPEN, None
+        except Exception as e:
+            return False, 0, None
+        valid = str(r.status_code)[0] == '2'
+        return valid, r.status_code, handler(r.content) if valid else None
+
+    def get(self, url: str, stream: bool = False,
+            app: Optional[str] = None, headers: Optional[dict] = None) -> CachedResponse:
+        """
+        Send a GET request to the URL and return the response.
+        With `stream`, read the body via the response's open().
+        Requests with extra `headers`, like conditional requests
+        of the caller, bypass the HTTP cache.
+        """
+        return self.request('GET', url, stream, app=app, headers=headers)
+
+    def request(self, method: str, url: str, stream: bool = False,
+                app: Optional[str] = None, headers: Optional[dict] = None) -> CachedResponse:
+        """
+        Send a request, guarded by the host's circuit breaker and
+        with retries for transient errors. Raises CircuitOpenError
+        if the host is considered down.
+        """
+        host = host_of(url)
+        health = self._health(host)
+
+        attempt = 0
+        while True:
+            with self._slots(host):
+                # checked with the slot held, as the probes we
+                # waited for may have opened the circuit
+                if not health.allow():
+                    raise CircuitOpenError(f'Circuit open for host {host}')
+
+                start = time.monotonic()
+                try:
+                    # retries go to the server, not to a cached response
+                    r = self._send(host, method, url, stream, health.timeout(), headers,
+                                   use_cache=attempt == 0)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    health.record_failure()
+                    self._record(host, method, app, type(e).__name__, start)
+                    raise
+                except Exception as e:
+                    health.end_trial()
+                    self._record(host, method, app, type(e).__name__, start)
+                    raise
+                if r.requested:
+                    health.record_success(time.monotonic() - start)
+                else:
+                    health.end_trial()
+                self._record(host, method, app, r.status_code, start, r)
+
+            if r.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                return r
+
+            r.close()
+            time.sleep(backoff_delay(attempt, r.headers.get('retry-after')))
+            attempt += 1
+
+    def _send(self, host: str, method: str, url: str, stream: bool,
+              timeout: float, headers: Optional[dict] = None,
+              use_cache: bool = True) -> CachedResponse:
+        session = self._session(host)
+        if self.cache is not None and headers is None and use_cache:
+            return self.cache.request(session, method, url, stream=stream,
+                                      timeout=timeout)
+
+        # like requests.head(), HEAD requests don't follow redirects
+        r = session.request(method, url, stream=stream, timeout=timeout, headers=headers,
+                            allow_redirects=method != 'HEAD')
+        if stream:
+            r.raw.decode_content = True
+            return CachedResponse(url, r.status_code, r.headers, raw=r.raw)
+        return CachedResponse(url, r.status_code, r.headers,
+                              r.content if method == 'GET' else None)
+
+    def _record(self, host: str, method: str, app: Optional[str], status,
+                start: float, r: Optional[CachedResponse] = None):
+        if self.metrics is None:
+            return
+        if r is not None and r.from_cache:
+            # served or revalidated from the cache
+            kind, size = f'{method} (cached)', 0
+        else:
+            kind, size = method, response_size(r)
+        self.metrics.record_request(host, kind, status, time.monotonic() - start,
+                                    size, app)
+
+    def probe_all(self, urls: Iterable[str],
+                  referrer: Optional[str] = None,
+                  timeout: Optional[float] = None,
+                  fetch: Optional[Dict[Tuple[str, str], Callable[[bytes], Any]]] = None) -> Dict[Any, tuple]:
+        """
+        Probe all given URLs concurrently and return a dict mapping
+        URL to tuple (valid, status_code). URLs probed before, or
+        currently being probed for another caller, are not probed again.
+        With `timeout`, URLs whose probe hasn't finished after that
+        many seconds are left out of the result.
+
+        `fetch` maps tuples (URL, name) to handlers for the body of
+        the URL, where `name` tells apart handlers of the same URL.
+        These are fetched (see fetch()) in the same round, and their
+        tuples map to (valid, status_code, handled). Fetches are done
+        once per URL and name. A fetch counts as the probe of its URL,
+        so it is not probed again.
+        """
+        fetch = fetch or {}
+        futures = {}
+        with self._lock:
+            for key, handler in fetch.items():
+                url = key[0]
+                if key not in self._fetches:
+                    self._fetches[key] = self._executor.submit(self.fetch, url, handler, referrer)
+                    self._results.setdefault(url, self._fetches[key])
+                    self._referrers.setdefault(url, set())
+                futures[key] = self._fetches[key]
+                self._referrers[url].add(referrer)
+
+            for url in urls:
+                if url not in self._results:
+                    self._results[url] = self._executor.submit(self.probe, url, referrer)
+                    self._referrers[url] = set()
+                futures[url] = self._results[url]
+                self._referrers[url].add(referrer)
+
+        if timeout is not None:
+            done, _ = wait(futures.values(), timeout=timeout)
+            futures = {url: f for url, f in futures.items() if f in done}
+        # a probe may be answered by a fetch of the URL
+        return {key: f.result() if key in fetch else f.result()[:2]
+                for key, f in futures.items()}
+
+    def shared_url_stats(self) -> Tuple[int, int, int]:
+        """
+        Return tuple (distinct URLs, URLs with more than one
+        referrer, total references over all referrers)
+        """
+        with self._lock:
+            distinct = len(self._referrers)
+            shared = sum(1 for r in self._referrers.values() if len(r) > 1)
+            references = sum(len(r) for r in self._referrers.values())
+        return distinct, shared, references
+
+    def reset(self):
+        """
+        Forget earlier probe and fetch results, so URLs are requested
+        again. For long-running processes, see watch.py.
+        """
+        with self._lock:
+            self._results.clear()
+            self._fetches.clear()
+            self._referrers.clear()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for session in self._sessions.values():
+            session.close()
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['user-agent'] = self.user_agent
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def _health(self, host: str) -> HostHealth:
+        with self._lock:
+            if host not in self._host_health:
+                self._host_health[host] = HostHealth(self.min_timeout, self.timeout,
+                                                     self.circuit_threshold,
+                                                     self.circuit_cooldown)
+            return self._host_health[host]
+
+    def _slots(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None,
+                  base: float = 0.5, cap: float = 10) -> float:
+    """
+    Seconds to wait before retry number `attempt` (starting at 0):
+    exponential backoff with full jitter, or the server's
+    Retry-After value if given in seconds. At most `cap`.
+    """
+    if retry_after is not None and retry_after.isdigit():
+        return min(cap, float(retry_after))
+    return random.uniform(0, min(cap, base * 2 ** (attempt + 1)))
+
+
+def response_size(r: Optional[CachedResponse]) -> int:
+    """
+    Number of body bytes received with a response, as far as known
+    """
+    if r is None:
+        return 0
+    if r.content is not None:
+        return len(r.content)
+    if r.body_path is not None:
+        try:
+            return os.path.getsize(r.body_path)
+        except OSError:
+            return 0
+    # streamed from the network, not read yet
+    length = r.headers.get('content-length', '')
+    return int(length) if length.isdigit() else 0
+
+
+def describe_status(status_code: int) -> str:
+    """
+    Human readable description of a status code returned by probe()
+    """
+    if status_code == STATUS_CIRCUIT_OPEN:
+        return 'host unreachable (circuit open)'
+    return f'status code {status_code}'
+
+
+def host_of(url: str) -> str:
+    """
+    Return the lower-cased network location of a URL, or an empty
+    string if it can't be parsed.
+    """
+    try:
+        return urlsplit(url).netloc.lower()
+    except Exception as e:
+        return ''
@@ -0,0 +1,203 @@
+"""
+README analysis: bounded reading of the body, extraction of links
+and images, and markdownlint-style structural checks.
+"""
+import re
+from typing import BinaryIO, List, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from findings import Finding
+
+# Links and images on one line: inline `[text](url)` and `![alt](url)`,
+# reference-style `[text][ref]`, autolinks `<https://...>` and HTML
+# `href`/`src` attributes.
+LINK_RE = re.compile(r'''
+    (?P<image>!?)\[(?P<text>[^\]]*)\]
+        (?:
+            \(\s*<?(?P<url>[^)\s>]*)>?(?:\s+(?:"[^"]*"|'[^']*'|\([^)]*\)))?\s*\)
+          | \[(?P<ref>[^\]]*)\]
+        )
+  | <(?P<autolink>https?://[^>\s]+)>
+  | <(?:a|img)\s[^>]*?(?:href|src)\s*=\s*["'](?P<html>[^"']+)["']
+''', re.VERBOSE | re.IGNORECASE)
+
+# Link reference definition `[ref]: url "title"`
+REFERENCE_RE = re.compile(r'^ {0,3}\[(?P<ref>[^\]]+)\]:\s*<?(?P<url>[^\s>]+)>?')
+HEADING_RE = re.compile(r'^ {0,3}(?P<level>#{1,6})(?P<space>\s*)(?P<text>.*?)\s*$')
+FENCE_RE = re.compile(r'^ {0,3}(?P<fence>`{3,}|~{3,})')
+CODE_SPAN_RE = re.compile(r'(`+).*?\1')
+
+# Line numbers listed per structural problem at most
+MAX_LINES_LISTED = 5
+
+
+class Link:
+    """
+    A link or image found in a README, with the URL resolved
+    against the README URL
+    """
+    __slots__ = ('url', 'text', 'line', 'image')
+
+    def __init__(self, url: str, text: str, line: int, image: bool = False):
+        self.url = url
+        self.text = text
+        self.line = line
+        self.image = image
+
+    @property
+    def checkable(self) -> bool:
+        return urlsplit(self.url).scheme in ('http', 'https')
+
+
+class ReadmeAnalysis:
+    """
+    Result of scanning a README once: its links and images and
+    the structural problems found, as lists of line numbers
+    per problem.
+    """
+
+    def __init__(self):
+        self.links = []
+        self.headings = []
+        self.problems = {}
+
+    def add_problem(self, problem: str, line: int):
+        lines = self.problems.setdefault(problem, [])
+        if not lines or lines[-1] != line:
+            lines.append(line)
+
+    def link_urls(self) -> List[str]:
+        """
+        Distinct HTTP(S) URLs of links and images, in order of appearance
+        """
+        return list(dict.fromkeys(link.url for link in self.links if link.checkable))
+
+    def findings(self) -> List[Finding]:
+        findings = []
+
+        if not self.headings:
+            findings.append(Finding('readme-heading', 'suggestion', 'README has no headings'))
+        elif self.headings[0][0] != 1:
+            findings.append(Finding('readme-heading', 'suggestion',
+                                    'README should start with a top-level heading (line {})', self.headings[0][1]))
+
+        messages = (
+            ('multiple-h1', 'readme-heading', 'suggestion', 'README has more than one top-level heading'),
+            ('heading-increment', 'readme-heading', 'suggestion', 'Heading levels should only increase by one'),
+            ('heading-space', 'readme-heading', 'suggestion', 'Headings need a space after the `#`'),
+            ('empty-heading', 'readme-heading', 'suggestion', 'README has empty headings'),
+            ('unclosed-fence', 'readme-code-fence', 'warning', 'Code block is not closed'),
+            ('image-alt', 'readme-image-alt', 'suggestion', 'Images should have an alternative text'),
+            ('empty-link', 'readme-empty-link', 'warning', 'Links should have a text and a target'),
+            ('undefined-reference', 'readme-link-reference', 'warning', 'Link references are not defined'),
+        )
+        for problem, rule_id, severity, message in messages:
+            lines = self.problems.get(problem)
+            if lines:
+                findings.append(Finding(rule_id, severity, message + ' ({})', format_lines(lines)))
+
+        return findings
+
+
+def read_capped(stream: BinaryIO, max_bytes: int) -> Tuple[bytes, bool]:
+    """
+    Read at most `max_bytes` from the stream. Returns tuple
+    (content, truncated).
+    """
+    chunks = []
+    size = 0
+    while size <= max_bytes:
+        chunk = stream.read(min(64 * 1024, max_bytes + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    content = b''.join(chunks)
+    return content[:max_bytes], size > max_bytes
+
+
+def analyse_readme(text: str, base_url: str) -> ReadmeAnalysis:
+    """
+    Scan the README line by line, collecting links, images and
+    headings and recording structural problems. Code blocks and
+    code spans are skipped.
+    """
+    analysis = ReadmeAnalysis()
+    references = set()
+    # (reference, line) of reference-style links
+    used_references = []
+    fence = None
+    fence_line = 0
+    previous_level = 0
+
+    for number, line in enumerate(text.splitlines(), 1):
+        m = FENCE_RE.match(line)
+        if fence is not None:
+            if m is not None and m.group('fence')[0] == fence[0] and len(m.group('fence')) >= len(fence):
+                fence = None
+            continue
+        if m is not None:
+            fence, fence_line = m.group('fence'), number
+            continue
+
+        m = REFERENCE_RE.match(line)
+        if m is not None:
+            references.add(m.group('ref').lower())
+            analysis.links.append(Link(resolve_url(base_url, m.group('url')), m.group('ref'), number))
+            continue
+
+        m = HEADING_RE.match(line)
+        if m is not None:
+            level = len(m.group('level'))
+            if m.group('text') and not m.group('space'):
+                analysis.add_problem('heading-space', number)
+            elif not m.group('text').strip('#'):
+                analysis.add_problem('empty-heading', number)
+            if level == 1 and any(h[0] == 1 for h in analysis.headings):
+                analysis.add_problem('multiple-h1', number)
+            if previous_level and level > previous_level + 1:
+                analysis.add_problem('heading-increment', number)
+            analysis.headings.append((level, number))
+            previous_level = level
+
+        for m in LINK_RE.finditer(CODE_SPAN_RE.sub('', line)):
+            if m.group('autolink') is not None:
+                analysis.links.append(Link(m.group('autolink'), '', number))
+            elif m.group('html') is not None:
+                analysis.links.append(Link(resolve_url(base_url, m.group('html')), '', number))
+            elif m.group('ref') is not None:
+                # `[text][]` refers to `text`
+                used_references.append(((m.group('ref') or m.group('text')).lower(), number))
+            else:
+                image = m.group('image') == '!'
+                url = m.group('url')
+                if image and not m.group('text').strip():
+                    analysis.add_problem('image-alt', number)
+                if not url or url == '#' or (not image and not m.group('text').strip()):
+                    analysis.add_problem('empty-link', number)
+                if url and not url.startswith('#'):
+                    analysis.links.append(Link(resolve_url(base_url, url), m.group('text'), number, image))
+
+    if fence is not None:
+        analysis.add_problem('unclosed-fence', fence_line)
+
+    for reference, number in used_references:
+        if reference not in references:
+            analysis.add_problem('undefined-reference', number)
+
+    return analysis
+
+
+def resolve_url(base_url: str, url: str) -> str:
+    """
+    Absolute URL of a link target, without fragment. Anchors
+    within the README resolve to the README URL itself.
+    """
+    return urldefrag(urljoin(base_url, url))[0]
+
+
+def format_lines(lines: List[int]) -> str:
+    listed = ', '.join(str(n) for n in lines[:MAX_LINES_LISTED])
+    if len(lines) > MAX_LINES_LISTED:
+        listed += f' and {len(lines) - MAX_LINES_LISTED} more'
+    return f'line {listed}' if len(lines) == 1 else f'lines {listed}'
@@ -0,0 +1,318 @@
+"""
+SQLite store of run results, for comparing runs and rendering
+the report of a stored run again without network access.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from findings import RESULT_KEYS, Finding, iter_findings
+from output import ReportWriter
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL,
+    shard TEXT,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS catalogs (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    url TEXT NOT NULL,
+    apps INTEGER NOT NULL,
+    header INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    warnings INTEGER NOT NULL,
+    suggestions INTEGER NOT NULL,
+    accolades INTEGER NOT NULL,
+    findings TEXT NOT NULL,
+    release_stats TEXT,
+    PRIMARY KEY (run_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS apps (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    catalog TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER,
+    version TEXT,
+    digest TEXT,
+    repo_url TEXT,
+    owner TEXT,
+    release_stats TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS apps_run ON apps (run_id, catalog, name);
+CREATE TABLE IF NOT EXISTS findings (
+    app_id INTEGER NOT NULL REFERENCES apps (id),
+    ordinal INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    rule_id TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (app_id, ordinal)
+) WITHOUT ROWID;
+'''
+
+# Numbers in finding messages, like ages, counts and status codes,
+# outside of `quoted` values like URLs. Only standalone numbers,
+# versions like 1.2.3, v1.2 or 1.4.x and names like app2 are kept.
+NUMBER_RE = re.compile(r'`[^`]*`|(?<![\w.-])\d+(\.\d+)?(?![\w-]|\.\w)')
+
+# Severities compared by diffs. Accolades aren't problems.
+DIFF_SEVERITIES = ('error', 'warning', 'suggestion')
+
+
+def finding_key(finding: Finding) -> str:
+    """
+    Stable key of a finding of an app, to recognize it in later runs:
+    its rule ID and a hash of the message with numbers left out, so a
+    release getting older or a changed status code is the same finding.
+    The message is used rather than the finding's parameters, as
+    findings read back from the state file or partials only have that.
+    """
+    message = NUMBER_RE.sub(lambda m: m.group() if m.group().startswith('`') else '#', finding.message)
+    return f'{finding.rule_id}:{hashlib.sha1(message.encode("utf-8")).hexdigest()[:12]}'
+
+
+class ResultsStore:
+    """
+    Results of runs: per catalog the totals, per app the latest
+    release version and digest, and each finding with its key.
+    Runs are numbered from 1, unfinished runs have no `finished` time.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def start_run(self, shard: Optional[str] = None) -> int:
+        with self.db:
+            cursor = self.db.execute('INSERT INTO runs (started, shard) VALUES (?, ?)',
+                                     (time.time(), shard))
+        return cursor.lastrowid
+
+    def add_app(self, run_id: int, catalog: str, app_name: str, position: Optional[int], result: dict):
+        """
+        Store the result of an app. Committed with the catalog.
+        """
+        cursor = self.db.execute(
+            'INSERT INTO apps (run_id, catalog, name, position, version, digest, repo_url, owner, release_stats) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_id, catalog, app_name, position, result['latest_release'], result.get('digest'),
+             result['repo_url'], result['owner'], _dumps(result.get('release_stats'))))
+        self.db.executemany(
+            'INSERT INTO findings (app_id, ordinal, key, rule_id, severity, message) VALUES (?, ?, ?, ?, ?, ?)',
+            [(cursor.lastrowid, i, finding_key(f), f.rule_id, f.severity, f.message)
+             for i, f in enumerate(iter_findings(result))])
+
+    def add_catalog(self, run_id: int, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding], stats: Optional[dict]):
+        with self.db:
+            position = self.db.execute('SELECT COUNT(*) FROM catalogs WHERE run_id = ?',
+                                       (run_id,)).fetchone()[0]
+            self.db.execute(
+                'INSERT INTO catalogs (run_id, position, name, url, apps, header, errors, warnings, '
+                'suggestions, accolades, findings, release_stats) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, position, catalog['name'], catalog['url'], app_count, header,
+                 counts['errors'], counts['warnings'], counts['suggestions'], counts['accolades'],
+                 json.dumps([f.to_dict() for f in findings]), _dumps(stats)))
+
+    def finish_run(self, run_id: int, summary: dict):
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ?, summary = ? WHERE id = ?',
+                            (time.time(), json.dumps(summary), run_id))
+
+    def runs(self, limit: int = 20) -> List[tuple]:
+        """
+        The latest runs, newest first, as tuples
+        (id, started, finished, shard, number of apps)
+        """
+        return self.db.execute(
+            'SELECT r.id, r.started, r.finished, r.shard, '
+            '(SELECT SUM(apps) FROM catalogs c WHERE c.run_id = r.id) '
+            'FROM runs r ORDER BY r.id DESC LIMIT ?', (limit,)).fetchall()
+
+    def finished_run(self, run_id: Optional[int] = None, before: Optional[int] = None) -> Tuple[int, float]:
+        """
+        Return (id, started) of a finished run: `run_id`, or the latest
+        one, or the latest before run `before`. Raises ValueError if
+        there is no such run.
+        """
+        if run_id is not None:
+            row = self.db.execute('SELECT id, started FROM runs WHERE id = ? AND finished IS NOT NULL',
+                                  (run_id,)).fetchone()
+        elif before is not None:
+            row = self.db.execute('SELECT id, started FROM runs WHERE finished IS NOT NULL AND id < ? '
+                                  'ORDER BY id DESC LIMIT 1', (before,)).fetchone()
+        else:
+            row = self.db.execute('SELECT id, started FROM runs WHERE finished IS NOT NULL '
+                                  'ORDER BY id DESC LIMIT 1').fetchone()
+        if row is None:
+            if run_id is not None:
+                raise ValueError(f'No finished run {run_id}')
+            if before is not None:
+                raise ValueError(f'No finished run before run {before}')
+            raise ValueError('No finished runs')
+        return row
+
+    def render(self, run_id: int, writer: ReportWriter):
+        """
+        Replay a stored run to a report writer
+        """
+        catalogs = self.db.execute(
+            'SELECT name, url, apps, header, errors, warnings, suggestions, accolades, findings, release_stats '
+            'FROM catalogs WHERE run_id = ? ORDER BY position', (run_id,)).fetchall()
+        for name, url, app_count, header, *counts, findings, stats in catalogs:
+            catalog = {'name': name, 'url': url}
+            writer.start_catalog(catalog)
+            for position, app_name, result in self.app_results(run_id, name):
+                writer.app(catalog, app_name, result, position=position)
+            writer.end_catalog(catalog, app_count, dict(zip(RESULT_KEYS.values(), counts)), bool(header),
+                               findings=[Finding.from_dict(f) for f in json.loads(findings)],
+                               stats=_loads(stats))
+
+        summary = self.db.execute('SELECT summary FROM runs WHERE id = ?', (run_id,)).fetchone()[0]
+        writer.finish(json.loads(summary))
+
+    def app_results(self, run_id: int, catalog: str) -> Iterator[Tuple[Optional[int], str, dict]]:
+        """
+        Yield (position, app name, result dict) for the apps of a
+        catalog in a run, in index order
+        """
+        rows = self.db.execute(
+            'SELECT a.id, a.position, a.name, a.version, a.digest, a.repo_url, a.owner, a.release_stats, '
+            'f.rule_id, f.severity, f.message '
+            'FROM apps a LEFT JOIN findings f ON f.app_id = a.id '
+            'WHERE a.run_id = ? AND a.catalog = ? ORDER BY a.position, a.id, f.ordinal',
+            (run_id, catalog))
+
+        app_id = None
+        for (row_app_id, position, app_name, version, digest, repo_url, owner, stats,
+             rule_id, severity, message) in rows:
+            if row_app_id != app_id:
+                if app_id is not None:
+                    yield app
+                app_id = row_app_id
+                result = {key: [] for key in RESULT_KEYS.values()}
+                result.update(latest_release=version, digest=digest, repo_url=repo_url, owner=owner)
+                if stats is not None:
+                    result['release_stats'] = json.loads(stats)
+                app = (position, app_name, result)
+            if rule_id is not None:
+                result[RESULT_KEYS[severity]].append(Finding(rule_id, severity, message))
+        if app_id is not None:
+            yield app
+
+    def findings(self, run_id: int) -> Dict[Tuple[str, str], Dict[str, Finding]]:
+        """
+        The findings compared by diffs of a run: for each
+        (catalog, app name), a dict of finding key -> finding,
+        in report order. Apps without findings are included.
+        """
+        rows = self.db.execute(
+            'SELECT a.catalog, a.name, f.key, f.rule_id, f.severity, f.message '
+            'FROM apps a JOIN catalogs c ON c.run_id = a.run_id AND c.name = a.catalog '
+            'LEFT JOIN findings f ON f.app_id = a.id '
+            'WHERE a.run_id = ? ORDER BY c.position, a.position, a.id, f.ordinal', (run_id,))
+        apps = {}
+        for catalog, app_name, key, rule_id, severity, message in rows:
+            app = apps.setdefault((catalog, app_name), {})
+            if key is not None and severity in DIFF_SEVERITIES:
+                app.setdefault(key, Finding(rule_id, severity, message))
+        return apps
+
+
+class StoreWriter(ReportWriter):
+    """
+    Writes the results of the run to a ResultsStore
+    """
+    ordered = False
+
+    def __init__(self, store: ResultsStore, run_id: int):
+        super().__init__(None)
+        self.store = store
+        self.run_id = run_id
+
+    def app(self, catalog: dict, app_name: str, result: dict, position: Optional[int] = None):
+        self.store.add_app(self.run_id, catalog['name'], app_name, position, result)
+
+    def end_catalog(self, catalog: dict, app_count: int, counts: dict, header: bool,
+                    findings: List[Finding] = (), stats: Optional[dict] = None):
+        self.store.add_catalog(self.run_id, catalog, app_count, counts, header, list(findings), stats)
+
+    def finish(self, summary: dict):
+        self.store.finish_run(self.run_id, summary)
+
+
+def print_diff(store: ResultsStore, old: Tuple[int, float], new: Tuple[int, float], out: TextIO):
+    """
+    Print the changes between two runs in Markdown: per app the new and
+    fixed findings and the number of persisting ones, and apps added to
+    or removed from a catalog. `old` and `new` are (run ID, start time).
+    """
+    old_apps = store.findings(old[0])
+    new_apps = store.findings(new[0])
+    print(f'\n## Changes from run {old[0]} ({format_time(old[1])}) to run {new[0]} ({format_time(new[1])})',
+          file=out)
+
+    # removed apps are listed after the others of their catalog
+    catalogs = list(dict.fromkeys(catalog for catalog, _ in list(new_apps) + list(old_apps)))
+    apps = sorted(list(new_apps) + [app for app in old_apps if app not in new_apps],
+                  key=lambda app: catalogs.index(app[0]))
+
+    totals = {'new': 0, 'fixed': 0, 'persisting': 0}
+    catalog = None
+    for app in apps:
+        before = old_apps.get(app, {})
+        after = new_apps.get(app)
+        if after is None:
+            new_findings, fixed, persisting = [], [], 0
+        else:
+            new_findings = [f for key, f in after.items() if key not in before]
+            fixed = [f for key, f in before.items() if key not in after]
+            persisting = len(after.keys() & before.keys())
+        totals['new'] += len(new_findings)
+        totals['fixed'] += len(fixed)
+        totals['persisting'] += persisting
+        if app in old_apps and after is not None and not new_findings and not fixed:
+            continue
+
+        if app[0] != catalog:
+            catalog = app[0]
+            print(f'\n### Catalog `{catalog}`', file=out)
+        if after is None:
+            print(f'\n#### `{app[1]}` -- removed', file=out)
+            continue
+        status = ' -- new app' if app not in old_apps else ''
+        print(f'\n#### `{app[1]}`{status}: {len(new_findings)} new, {len(fixed)} fixed, '
+              f'{persisting} persisting\n', file=out)
+        for finding in new_findings:
+            print(f'- New {finding.severity}: {finding.message}', file=out)
+        for finding in fixed:
+            print(f'- Fixed {finding.severity}: {finding.message}', file=out)
+
+    print(f'\n{totals["new"]} new, {totals["fixed"]} fixed, {totals["persisting"]} persisting findings',
+          file=out)
+
+
+def format_time(ts: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(ts))
+
+
+def _dumps(value: Optional[dict]) -> Optional[str]:
+    return None if value is None else json.dumps(value)
+
+
+def _loads(value: Optional[str]) -> Optional[dict]:
+    return None if value is None else json.loads(value)
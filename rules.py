@@ -0,0 +1,242 @@
+"""
+Registry of the checks run for each app, with their cost class,
+scope and dependencies, and the selection of checks for a run.
+
+Checks are registered with the @rule decorator, in the order their
+findings are reported. They run in stages by cost class: the local
+checks of all apps in a catalog first, then the HTTP and GitHub
+checks of each app.
+"""
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from findings import RESULT_KEYS
+
+# Cost classes, in the order their stages run
+LOCAL = 'local'
+HTTP = 'http'
+GITHUB = 'github'
+COSTS = (LOCAL, HTTP, GITHUB)
+
+# Scope of a check: the latest release, with results kept in the
+# incremental state, or the app as a whole, checked in every run
+RELEASE = 'release'
+APP = 'app'
+
+
+class Rule:
+    """
+    A registered check. `check(app, ctx, ret)` adds findings to the
+    list `ret` (see add_finding and check_condition), `ids` are the
+    finding rule IDs it may add. Rules named in `requires` run before this
+    one, even if not selected, as it uses what they set on the
+    AppCheck.
+
+    HTTP rules declare the URLs they need with `urls(release)` and
+    documents to fetch with `fetch(release, ctx)`. These are requested
+    for all HTTP rules of an app in one round before they run, the
+    results are in AppCheck.url_results: by URL for `urls`, by tuple
+    (URL, rule name) for documents.
+    """
+    __slots__ = ('name', 'check', 'cost', 'ids', 'scope', 'requires', 'urls', 'fetch')
+
+    def __init__(self, name: str, check: Callable, cost: str, ids: tuple,
+                 scope: str, requires: tuple,
+                 urls: Optional[Callable] = None, fetch: Optional[Callable] = None):
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.ids = ids
+        self.scope = scope
+        self.requires = requires
+        self.urls = urls
+        self.fetch = fetch
+
+
+# rule name -> Rule, in registration order
+REGISTRY: Dict[str, Rule] = {}
+
+
+def rule(name: str, cost: str = LOCAL, ids: Optional[Iterable[str]] = None,
+         scope: str = RELEASE, requires: Iterable[str] = (),
+         urls: Optional[Callable] = None, fetch: Optional[Callable] = None) -> Callable:
+    """
+    Decorator registering a check function as rule `name`. Its finding
+    rule IDs default to the rule name. Required rules have to be
+    registered before.
+    """
+    def register(check: Callable) -> Callable:
+        if name in REGISTRY:
+            raise ValueError(f'Rule {name} is registered twice')
+        for required in requires:
+            if required not in REGISTRY:
+                raise ValueError(f'Rule {name} requires {required}, which is not registered before it')
+        REGISTRY[name] = Rule(name, check, cost, tuple(ids or (name,)), scope,
+                              tuple(requires), urls, fetch)
+        return check
+    return register
+
+
+class AppCheck:
+    """
+    An app going through the check stages: its releases (until the
+    local stage is done), the latest release, the findings of each
+    rule and what rules pass on to the rules requiring them.
+    """
+
+    def __init__(self, catalog: str, app_name: str, releases: list):
+        self.catalog = catalog
+        self.app_name = app_name
+        self.releases = releases
+        self.release = None
+        self.latest_release = None
+        # why the latest release couldn't be determined
+        self.latest_error = None
+        self.repo_handle = None
+        self.repo_url = None
+        # RepoInfo of the app's GitHub repository, see app_repo()
+        self.repo = None
+        self.teams = None
+        self.owner = None
+        self.release_stats = None
+        self.url_results = {}
+        # rule name -> tuple of the rule's findings
+        self.findings = {}
+        # result of the release rules from the incremental state
+        self.stored = None
+
+
+class RuleSelection:
+    """
+    The rules to run, from the --rules and --skip-rules options. Both
+    take rule names, finding rule IDs and cost classes. Rules required
+    by selected rules run as well, but only findings with a selected
+    rule ID are reported.
+    """
+
+    def __init__(self, rules: Iterable[str] = (), skip: Iterable[str] = ()):
+        names = set(split_names(rules))
+        skipped = set(split_names(skip))
+        unknown = (names | skipped) - known_names()
+        if unknown:
+            raise ValueError(f'Unknown rules: {", ".join(sorted(unknown))}')
+
+        # finding rule IDs to report
+        self.ids = set()
+        run = set()
+        for r in REGISTRY.values():
+            for rule_id in r.ids:
+                keys = {r.name, rule_id, r.cost}
+                if (not names or keys & names) and not keys & skipped:
+                    self.ids.add(rule_id)
+                    run.add(r.name)
+
+        # requirements are registered before the rules requiring them
+        for r in reversed(list(REGISTRY.values())):
+            if r.name in run:
+                run.update(r.requires)
+        self.rules = [r for r in REGISTRY.values() if r.name in run]
+
+        self.complete = self.ids == {i for r in REGISTRY.values() for i in r.ids}
+
+    def stage(self, cost: str) -> List[Rule]:
+        return [r for r in self.rules if r.cost == cost]
+
+    def costs(self) -> set:
+        """
+        Cost classes of the rules to run
+        """
+        return {r.cost for r in self.rules}
+
+    def reports(self, rule_id: str) -> bool:
+        return rule_id in self.ids
+
+    def fingerprint(self) -> str:
+        """
+        Identifies the selection, so results of the incremental
+        state are only reused for the same selection
+        """
+        if self.complete:
+            return 'all'
+        return hashlib.sha256(' '.join(sorted(self.ids)).encode('utf-8')).hexdigest()[:16]
+
+
+def split_names(values: Iterable[str]) -> List[str]:
+    """
+    Option values, each of which may be a comma-separated list
+    """
+    return [name.strip() for value in values for name in value.split(',') if name.strip()]
+
+
+def known_names() -> set:
+    names = set(COSTS)
+    for r in REGISTRY.values():
+        names.add(r.name)
+        names.update(r.ids)
+    return names
+
+
+def new_result() -> dict:
+    return {key: [] for key in RESULT_KEYS.values()}
+
+
+def run_stage(app: AppCheck, ctx: Any, rules: List[Rule]):
+    """
+    Run the given rules for an app. Release rules are skipped if there
+    is no latest release, or if its result came from the incremental
+    state. The URLs and documents of all rules are requested in one
+    round first.
+    """
+    rules = [r for r in rules
+             if r.scope == APP or (app.release is not None and app.stored is None)]
+
+    urls = []
+    fetch = {}
+    for r in rules:
+        if app.release is None:
+            continue
+        if r.urls is not None:
+            urls += r.urls(app.release)
+        if r.fetch is not None:
+            for url, handler in r.fetch(app.release, ctx).items():
+                fetch[(url, r.name)] = handler
+    if urls or fetch:
+        app.url_results.update(ctx.prober.probe_all(urls, referrer=ctx.app, fetch=fetch))
+
+    for r in rules:
+        ret = []
+        r.check(app, ctx, ret)
+        # most rules find little, the empty tuple is shared
+        app.findings[r.name] = tuple(ret)
+
+
+def app_result(app: AppCheck, selection: RuleSelection, scope: Optional[str] = None) -> dict:
+    """
+    Collect the reported findings of all rules, in registration order,
+    into a result dict. With `scope`, only of the rules of that scope.
+    """
+    result = new_result()
+    result['latest_release'] = app.latest_release
+    result['digest'] = app.release.get('digest') if app.release is not None else None
+    result['repo_url'] = app.repo_url
+    result['owner'] = app.owner
+
+    stored_added = False
+    for r in selection.rules:
+        if scope is not None and r.scope != scope:
+            continue
+        if r.scope == RELEASE and app.stored is not None:
+            # stored findings take the place of the release rules
+            if not stored_added:
+                for key in RESULT_KEYS.values():
+                    result[key] += app.stored[key]
+                stored_added = True
+            continue
+
+        for f in app.findings.get(r.name, ()):
+            if selection.reports(f.rule_id):
+                result[RESULT_KEYS[f.severity]].append(f)
+
+    if app.release_stats is not None:
+        result['release_stats'] = app.release_stats
+    return result
@@ -0,0 +1,209 @@
+"""
+Sharded runs: the apps of all catalogs split across several workers
+with --shard, and the merge of their partial results into one report.
+"""
+import json
+import zlib
+from typing import Iterable, List, Optional, Set, TextIO
+
+from findings import RESULT_KEYS, Finding
+from history import catalog_findings
+from output import ReportWriter
+
+
+class Shard:
+    """
+    Shard `index` of `count`, counting from 1. Apps are assigned to
+    shards by a hash of their name, so an app lands in the same shard
+    in every catalog and every run.
+    """
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f'Invalid shard {index}/{count}')
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, value: str) -> 'Shard':
+        """
+        Parse a shard given as `i/N`, like `2/4`
+        """
+        try:
+            index, count = (int(n) for n in value.split('/'))
+        except ValueError:
+            raise ValueError(f'Invalid shard {value}, expected i/N like 2/4')
+        return cls(index, count)
+
+    def __str__(self) -> str:
+        return f'{self.index}/{self.count}'
+
+    def owns(self, app_name: str) -> bool:
+        # not hash(), which is salted per process
+        return zlib.crc32(app_name.encode('utf-8')) % self.count == self.index - 1
+
+    def selector(self) -> 'ShardSelector':
+        return ShardSelector(self)
+
+
+class ShardSelector:
+    """
+    `select` filter for iter_catalog_entries() passing the apps of a
+    shard. Remembers their position in the full index, so the merged
+    report lists apps in index order, and the names of all apps.
+    """
+
+    def __init__(self, shard: Shard):
+        self.shard = shard
+        # all app names seen, in index order
+        self.names = []
+        # app name -> position in the index
+        self.positions = {}
+
+    def __call__(self, app_name: str) -> bool:
+        position = len(self.names)
+        self.names.append(app_name)
+        if not self.shard.owns(app_name):
+            return False
+        self.positions[app_name] = position
+        return True
+
+
+def merge_partials(partials: Iterable[TextIO], writer: ReportWriter, max_releases: int):
+    """
+    Combine the JSONL output of all shards of a run into one report.
+    Apps are listed in index order, catalog totals and release history
+    statistics are those of the whole catalog. `max_releases` is the
+    `max_releases_per_catalog` limit for the merged release count.
+
+    Raises ValueError if shards are missing, given twice or from runs
+    with different shard counts or rule selections.
+    """
+    # catalog name -> its record from each shard, in order of appearance
+    catalogs = {}
+    # catalog name -> (position, app name, result) for its apps
+    apps = {}
+    summaries = []
+    for stream in partials:
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['type'] == 'app':
+                apps.setdefault(record['catalog'], []).append(
+                    (record['position'], record['app'], result_from_record(record)))
+            elif record['type'] == 'catalog':
+                catalogs.setdefault(record['catalog'], []).append(record)
+            elif record['type'] == 'summary':
+                summaries.append(record)
+    check_shards([record.get('shard', '1/1') for record in summaries])
+    reported = reported_rule_ids(summaries)
+
+    for name, records in catalogs.items():
+        catalog = {'name': name, 'url': records[0]['url']}
+        writer.start_catalog(catalog)
+
+        entries = sorted(apps.get(name, []), key=lambda a: a[0])
+        for position, app_name, result in entries:
+            writer.app(catalog, app_name, result, position=position)
+        results = [result for _, _, result in entries]
+
+        counts = {key: sum(r[key] for r in records) for key in RESULT_KEYS.values()}
+        stats = merge_release_stats(records, results)
+        findings = []
+        if stats is not None:
+            findings = [f for f in catalog_findings(stats['releases'], max_releases)
+                        if reported is None or f.rule_id in reported]
+        writer.end_catalog(catalog, sum(r['apps'] for r in records), counts, header=True,
+                           findings=findings, stats=stats)
+
+    writer.finish(merge_summaries(summaries))
+
+
+def result_from_record(record: dict) -> dict:
+    """
+    Result dict of an app from its JSONL record
+    """
+    result = {key: [] for key in RESULT_KEYS.values()}
+    for data in record['findings']:
+        finding = Finding.from_dict(data)
+        result[RESULT_KEYS[finding.severity]].append(finding)
+    result['latest_release'] = record['latest_release']
+    result['digest'] = record.get('digest')
+    result['repo_url'] = record['repo_url']
+    result['owner'] = record['owner']
+    if record.get('release_stats') is not None:
+        result['release_stats'] = record['release_stats']
+    return result
+
+
+def check_shards(shards: List[str]):
+    """
+    Make sure the summaries of the partials are from all shards of a
+    run, once each. A shard that didn't finish has no summary.
+    """
+    parsed = [Shard.parse(s) for s in shards]
+    counts = {s.count for s in parsed}
+    if len(counts) > 1:
+        raise ValueError(f'Partials are from runs with different shard counts: {", ".join(shards)}')
+    count = counts.pop() if counts else 1
+
+    indexes = [s.index for s in parsed]
+    duplicate = sorted({i for i in indexes if indexes.count(i) > 1})
+    if duplicate:
+        raise ValueError(f'Shards given twice: {", ".join(f"{i}/{count}" for i in duplicate)}')
+    missing = sorted(set(range(1, count + 1)) - set(indexes))
+    if missing:
+        raise ValueError(f'Missing shards: {", ".join(f"{i}/{count}" for i in missing)}')
+
+
+def reported_rule_ids(summaries: List[dict]) -> Optional[Set[str]]:
+    """
+    The finding rule IDs the shards reported, None for all. Raises
+    ValueError if the shards ran with different rule selections.
+    """
+    selections = {summary.get('rules', 'all') for summary in summaries}
+    if len(selections) > 1:
+        raise ValueError('Partials are from runs with different rule selections')
+    selection = selections.pop() if selections else 'all'
+    if selection == 'all':
+        return None
+    return set(selection.split(',')) - {''}
+
+
+def merge_release_stats(records: List[dict], results: List[dict]) -> Optional[dict]:
+    """
+    Release history statistics of a catalog from those of its shards.
+    The median comes from the release counts of the apps.
+    """
+    stats = [r['release_stats'] for r in records if r.get('release_stats') is not None]
+    if not stats:
+        return None
+
+    counts = sorted(r['release_stats']['releases'] for r in results if 'release_stats' in r)
+    return {
+        'apps': sum(s['apps'] for s in stats),
+        'releases': sum(s['releases'] for s in stats),
+        'prereleases': sum(s['prereleases'] for s in stats),
+        'median_releases_per_app': counts[len(counts) // 2] if counts else 0,
+        'max_releases_per_app': max(s['max_releases_per_app'] for s in stats),
+        'releases_last_30_days': sum(s['releases_last_30_days'] for s in stats),
+    }
+
+
+def merge_summaries(summaries: List[dict]) -> dict:
+    """
+    Run summary from those of the shards. Counters are summed, so URLs
+    and repos checked by several shards count once per shard. Token
+    usage is listed per shard.
+    """
+    merged = {}
+    for summary in summaries:
+        for key, value in summary.items():
+            if isinstance(value, dict):
+                totals = merged.setdefault(key, {})
+                for name, n in value.items():
+                    totals[name] = totals.get(name, 0) + n
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+    return merged
@@ -0,0 +1,60 @@
+"""
+State file for incremental validation runs.
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from findings import result_from_dict, result_to_dict
+
+
+class ValidationState:
+    """
+    Remembers, per catalog and app, the digest of the latest release
+    and the validation result we got for it.
+
+    A stored result is reused as long as the latest release digest
+    is unchanged and the result is not older than `max_age` seconds.
+    """
+
+    def __init__(self, path: str, max_age: float):
+        self.path = os.path.expanduser(path)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self._data = json.load(f)
+
+    def lookup(self, catalog: str, app_name: str, digest: str) -> Optional[dict]:
+        """
+        Return a copy of the stored result if it is still valid.
+        Results stored in an older format are ignored.
+        """
+        with self._lock:
+            entry = self._data.get(catalog, {}).get(app_name)
+        if entry is None or entry['digest'] != digest:
+            return None
+        if time.time() - entry['validated_at'] > self.max_age:
+            return None
+        try:
+            return result_from_dict(entry['result'])
+        except (KeyError, TypeError):
+            return None
+
+    def store(self, catalog: str, app_name: str, digest: str, result: dict):
+        with self._lock:
+            self._data.setdefault(catalog, {})[app_name] = {
+                'digest': digest,
+                'validated_at': time.time(),
+                'result': result_to_dict(result),
+            }
+
+    def save(self):
+        with self._lock:
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._data, f)
+            os.replace(tmp, self.path)
@@ -0,0 +1,316 @@
+"""
+Watch mode: poll the catalog indexes, revalidate the apps whose
+entries changed and serve the current results over HTTP.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, List, Optional, Set, TextIO, Tuple
+from urllib.parse import unquote, urlsplit
+
+from catalog import iter_catalog_entries
+from names import NameAnalysis
+from output import app_record, count_findings
+from rules import REGISTRY, AppCheck, app_result, run_stage
+from shards import Shard
+
+
+def entry_fingerprint(releases: list) -> str:
+    """
+    Digest of an app's index entry, to tell whether it changed
+    """
+    return hashlib.sha256(repr(releases).encode('utf-8')).hexdigest()
+
+
+class WatchedCatalog:
+    """
+    What is kept of a catalog between polls: the validators of the
+    last index response, the fingerprint of each app's entry, and
+    the apps with their results.
+    """
+
+    def __init__(self, conf: dict):
+        self.name = conf['name']
+        self.url = conf['url']
+        self.etag = None
+        self.last_modified = None
+        # app name -> entry_fingerprint(), of the apps whose result is
+        # up to date
+        self.fingerprints = {}
+        # apps whose last validation failed, to be retried
+        self.failed = set()
+        # all app names, for the name checks
+        self.names = []
+        # app name -> position in the index
+        self.positions = {}
+        # app name -> AppCheck, kept for rerunning the name checks
+        self.apps = {}
+        # app name -> result dict
+        self.results = {}
+        self.checked_at = None
+        self.changed_at = None
+        self.error = None
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.failed:
+            # the failed apps are retried even if the index didn't change
+            return headers
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class Watcher:
+    """
+    Polls the catalog indexes with conditional GET requests. When an
+    index changed, its entries are compared with those of the previous
+    poll, and only added or changed apps are validated: with
+    `start(catalog, app name, releases)` for the local stage while the
+    index is read, and `finish(app)` for the HTTP and GitHub stages,
+    as in a normal run. The clients of `ctx` stay warm between polls,
+    URL probes and repository inspections are done again.
+
+    An app whose validation failed keeps its previous result, and is
+    validated again on the next poll.
+
+    With `check_names`, the name checks of all apps are run again
+    when apps are added or removed.
+    """
+
+    def __init__(self, ctx: Any, catalogs: List[dict],
+                 start: Callable[[str, str, list], AppCheck],
+                 finish: Callable[[AppCheck], dict],
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 only: Optional[Set[str]] = None, shard: Optional[Shard] = None,
+                 check_names: bool = False):
+        self.ctx = ctx
+        self.catalogs = [WatchedCatalog(conf) for conf in catalogs]
+        self.start = start
+        self.finish = finish
+        self.executor = executor
+        self.only = only
+        self.shard = shard or Shard(1, 1)
+        self.check_names = check_names
+        self.cycles = 0
+        self._lock = threading.Lock()
+
+    def run(self, interval: float, out: TextIO = sys.stderr):
+        """
+        Poll every `interval` seconds, until interrupted
+        """
+        while True:
+            started = time.monotonic()
+            self.cycle(out)
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def cycle(self, out: TextIO = sys.stderr):
+        """
+        Poll all catalogs once and revalidate the apps that changed
+        """
+        # keep the metrics of one poll only
+        self.ctx.metrics.reset()
+        started = time.perf_counter()
+
+        changed = []
+        names_changed = False
+        for catalog in self.catalogs:
+            try:
+                apps, removed, catalog_names_changed = self.poll(catalog, out)
+            except Exception as e:
+                # keep the previous results and try again next time
+                catalog.error = str(e)
+                print(f'{format_now()} {catalog.name}: polling failed, {e}', file=out)
+                continue
+            catalog.error = None
+            changed += [(catalog, app, fingerprint) for app, fingerprint in apps]
+            names_changed = names_changed or catalog_names_changed
+            if apps or removed:
+                print(f'{format_now()} {catalog.name}: {len(apps)} apps added or changed, '
+                      f'{len(removed)} removed', file=out)
+
+        if names_changed and self.check_names:
+            self.ctx.names = NameAnalysis({c.name: c.names for c in self.catalogs})
+            names_rule = [REGISTRY['names']]
+            unchanged = [(c, app) for c in self.catalogs for app in c.apps.values()]
+            for catalog, app in unchanged + [(c, app) for c, app, _ in changed]:
+                try:
+                    run_stage(app, self.ctx, names_rule)
+                except Exception as e:
+                    print(f'{format_now()} {catalog.name}/{app.app_name}: name checks failed, {e}', file=out)
+            with self._lock:
+                for catalog, app in unchanged:
+                    catalog.results[app.app_name] = app_result(app, self.ctx.rules)
+
+        if changed:
+            # URLs and repositories are checked again for the apps that changed
+            self.ctx.prober.reset()
+            self.ctx.repo_cache.reset()
+
+            def finish(app: AppCheck) -> Optional[dict]:
+                try:
+                    return self.finish(app)
+                except Exception as e:
+                    print(f'{format_now()} {app.catalog}/{app.app_name}: validation failed, {e}', file=out)
+                    return None
+
+            results = self._map(finish, [app for _, app, _ in changed])
+            failed = 0
+            for (catalog, app, fingerprint), result in zip(changed, results):
+                with self._lock:
+                    if result is None:
+                        catalog.failed.add(app.app_name)
+                        failed += 1
+                        continue
+                    catalog.failed.discard(app.app_name)
+                    catalog.apps[app.app_name] = app
+                    catalog.results[app.app_name] = result
+                    catalog.fingerprints[app.app_name] = fingerprint
+            print(f'{format_now()} {len(changed) - failed} apps validated, {failed} failed, '
+                  f'in {time.perf_counter() - started:.1f}s, {len(self.ctx.metrics.requests)} requests', file=out)
+
+        with self._lock:
+            self.cycles += 1
+
+    def poll(self, catalog: WatchedCatalog,
+             out: TextIO = sys.stderr) -> Tuple[List[Tuple[AppCheck, str]], Set[str], bool]:
+        """
+        Request the index of a catalog if it changed, and run the local
+        stage for added or changed apps. Returns these apps with the
+        fingerprints of their entries, the names of removed apps and
+        whether the app names changed. The fingerprint of an app is
+        recorded once its result is stored.
+        """
+        r = self.ctx.prober.get(catalog.url, stream=True, headers=catalog.conditional_headers())
+        catalog.checked_at = time.time()
+        if r.status_code == 304:
+            r.close()
+            return [], set(), False
+        r.raise_for_status()
+
+        selector = self.shard.selector()
+        seen = set()
+        apps = []
+        failed = set()
+        with r.open() as stream:
+            for app_name, releases in iter_catalog_entries(stream, self.only, selector):
+                seen.add(app_name)
+                fingerprint = entry_fingerprint(releases)
+                if catalog.fingerprints.get(app_name) == fingerprint:
+                    continue
+                try:
+                    apps.append((self.start(catalog.name, app_name, releases), fingerprint))
+                except Exception as e:
+                    failed.add(app_name)
+                    print(f'{format_now()} {catalog.name}/{app_name}: validation failed, {e}', file=out)
+
+        removed = (catalog.results.keys() | catalog.failed) - seen
+        names_changed = selector.names != catalog.names
+        with self._lock:
+            for app_name in removed:
+                catalog.apps.pop(app_name, None)
+                catalog.results.pop(app_name, None)
+            catalog.fingerprints = {name: fingerprint for name, fingerprint in catalog.fingerprints.items()
+                                    if name in seen and name not in failed}
+            catalog.failed = (catalog.failed & seen) | failed
+            catalog.names = selector.names
+            catalog.positions = selector.positions
+            catalog.etag = r.headers.get('etag')
+            catalog.last_modified = r.headers.get('last-modified')
+            if apps or removed:
+                catalog.changed_at = catalog.checked_at
+        return apps, removed, names_changed
+
+    def status(self) -> dict:
+        """
+        Totals and poll times per catalog
+        """
+        with self._lock:
+            catalogs = []
+            for c in self.catalogs:
+                counts = {'errors': 0, 'warnings': 0, 'suggestions': 0, 'accolades': 0}
+                for result in c.results.values():
+                    for key, n in count_findings(result).items():
+                        counts[key] += n
+                catalogs.append(dict(catalog=c.name, url=c.url, apps=len(c.results), **counts,
+                                     checked_at=c.checked_at, changed_at=c.changed_at, error=c.error))
+            return {'polls': self.cycles, 'catalogs': catalogs}
+
+    def records(self, catalog: Optional[str] = None, app_name: Optional[str] = None) -> List[dict]:
+        """
+        App records as written by JsonlWriter, in index order,
+        optionally of one catalog or app only
+        """
+        with self._lock:
+            records = []
+            for c in self.catalogs:
+                if catalog is not None and c.name != catalog:
+                    continue
+                for name in sorted(c.results, key=lambda name: c.positions.get(name, 0)):
+                    if app_name is None or name == app_name:
+                        records.append(app_record(c.name, name, c.results[name], c.positions.get(name)))
+            return records
+
+    def _map(self, fn: Callable, items: list) -> list:
+        if self.executor is None:
+            return [fn(item) for item in items]
+        return list(self.executor.map(fn, items))
+
+
+class StatusServer(ThreadingHTTPServer):
+    """
+    Serves the current results of a Watcher as JSON:
+
+    - `/status`: totals and poll times per catalog
+    - `/apps`: records of all apps, like the jsonl output
+    - `/apps/<catalog>` and `/apps/<catalog>/<app>`
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], watcher: Watcher):
+        super().__init__(address, StatusHandler)
+        self.watcher = watcher
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='status-server', daemon=True).start()
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        watcher = self.server.watcher
+        parts = [unquote(p) for p in urlsplit(self.path).path.split('/') if p]
+        if parts == ['status']:
+            self._send(200, watcher.status())
+        elif parts[:1] == ['apps'] and len(parts) <= 3:
+            records = watcher.records(*parts[1:])
+            if len(parts) == 3 and not records:
+                self._send(404, {'error': 'App not found'})
+            elif len(parts) == 3:
+                self._send(200, records[0])
+            else:
+                self._send(200, records)
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def _send(self, status: int, body: Any):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args):
+        # stderr is for the poll log
+        pass
+
+
+def format_now() -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S')